@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -174,6 +175,36 @@ AUTH_USER_MODEL = 'authentication.User'
 # External API Keys
 GOOGLE_BOOKS_API_KEY = os.environ.get('GOOGLE_BOOKS_API_KEY')  # Add your Google Books API key here for production
 
+# External search fan-out: per-provider timeouts under the overall deadline (seconds)
+EXTERNAL_SEARCH_TIMEOUTS = {
+    'google_books': 4.0,
+    'open_library': 4.0,
+}
+EXTERNAL_SEARCH_DEADLINE = 5.0
+
+# Tuning of the books app. Each of these settings is a dict of overrides
+# merged over the defaults of the module named, so only set what differs:
+#   EXTERNAL_HTTP_CLIENT, EXTERNAL_ADAPTIVE_TIMEOUT  books.http_client
+#   EXTERNAL_CIRCUIT_BREAKER                         books.circuit_breaker
+#   EXTERNAL_SEARCH_CACHE                            books.provider_cache
+#   SEARCH_SINGLE_FLIGHT                             books.singleflight
+#   EXTERNAL_BOOK_INGESTION                          books.ingestion
+#   BOOK_SEARCH_RANKING                              books.ranking
+#   GENRE_TAXONOMY                                   books.genres
+#   TAG_INDEX                                        books.tag_index
+#   MOOD_SCORING                                     books.mood_scoring
+#   RECOMMENDATION_PERSISTENCE                       books.recommendation_writer
+#   RECOMMENDATION_EXCLUSIONS                        books.exclusions
+#   COLLABORATIVE_FILTERING                          books.collaborative
+#   POPULARITY                                       books.popularity
+#   RATING_AGGREGATES                                books.ratings
+#   BOOK_SIMILARITY                                  books.similarity
+#   BOOK_FRAGMENT_CACHE                              books.fragments
+# EXTERNAL_SEARCH_MAX_WORKERS, BOOK_SEARCH_RANKER and
+# SEARCH_SUGGESTIONS_REFRESH_INTERVAL are plain values with defaults where read.
+# Scheduled jobs: decay_popularity, reconcile_ratings, build_item_neighbors
+# and build_similarity_index --incremental.
+
 # Security settings for production
 if not DEBUG:
     SECURE_HSTS_SECONDS = 31536000  # 1 year
@@ -186,17 +217,30 @@ if not DEBUG:
     SECURE_CONTENT_TYPE_NOSNIFF = True
 
 # Caching
+# A SQLite file in WAL mode shared by every worker on the host, bounded by
+# entry count and size. Point CACHE_LOCATION at fast local storage (e.g. /dev/shm).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': 'books.cache_backends.SQLiteCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache.sqlite3'),
         'TIMEOUT': 300,
         'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+            'MAX_ENTRIES': 50000,
+            'MAX_BYTES': 256 * 1024 * 1024,
+            'CULL_FREQUENCY': 10,
         }
     }
 }
 
+# Test runs get a private in-process cache, never the dev server's file
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'test',
+        }
+    }
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -7,10 +7,10 @@ from .models import (
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'genre', 'published_year', 'average_rating', 'popularity_score']
-    list_filter = ['genre', 'published_year', 'average_rating']
+    list_display = ['title', 'author', 'genre', 'canonical_genre', 'published_year', 'average_rating', 'popularity_score']
+    list_filter = ['canonical_genre', 'published_year', 'average_rating']
     search_fields = ['title', 'author', 'isbn']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['canonical_genre', 'created_at', 'updated_at']
     ordering = ['-popularity_score', '-average_rating']
 
 
@@ -28,7 +28,8 @@ class BookMoodAdmin(admin.ModelAdmin):
 
 @admin.register(BookGenre)
 class BookGenreAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_at']
+    list_display = ['name', 'parent', 'created_at']
+    list_filter = ['parent']
     search_fields = ['name']
 
 
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'books'
\ No newline at end of file
+    name = 'books'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,287 @@
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        size INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)",
+    """
+    CREATE TABLE IF NOT EXISTS cache_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL DEFAULT 0,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT OR IGNORE INTO cache_meta (id) VALUES (1)",
+    # Running totals, so enforcing the limits never scans the table
+    """
+    CREATE TRIGGER IF NOT EXISTS cache_entries_ai AFTER INSERT ON cache_entries BEGIN
+        UPDATE cache_meta SET entries = entries + 1, bytes = bytes + new.size WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS cache_entries_ad AFTER DELETE ON cache_entries BEGIN
+        UPDATE cache_meta SET entries = entries - 1, bytes = bytes - old.size WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS cache_entries_au AFTER UPDATE OF size ON cache_entries BEGIN
+        UPDATE cache_meta SET bytes = bytes - old.size + new.size WHERE id = 1;
+    END
+    """,
+]
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache backend stored in a standalone SQLite file in WAL mode, shared by
+    every worker process on the host.
+
+    add() and incr() run inside BEGIN IMMEDIATE transactions, so they are
+    atomic across processes and safe to use as locks and counters. The
+    table is bounded by OPTIONS MAX_ENTRIES and MAX_BYTES: when either is
+    exceeded, expired rows go first, then the rows closest to expiry.
+    Hit and miss counts are kept per process and flushed into the shared
+    file every STATS_FLUSH_EVERY lookups.
+    """
+
+    _counters = {}
+    _counters_lock = threading.Lock()
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._max_bytes = int(options.get('MAX_BYTES', 256 * 1024 * 1024))
+        self._flush_every = int(options.get('STATS_FLUSH_EVERY', 100))
+        self._local = threading.local()
+
+    # Connection handling
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def _write(self, operation):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = operation(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    # Statistics
+
+    def _count(self, hits=0, misses=0):
+        with self._counters_lock:
+            pending = self._counters.setdefault(self._path, [0, 0])
+            pending[0] += hits
+            pending[1] += misses
+            due = pending[0] + pending[1] >= self._flush_every
+        if due:
+            self._flush_counters()
+
+    def _flush_counters(self):
+        with self._counters_lock:
+            hits, misses = self._counters.get(self._path, (0, 0))
+            self._counters[self._path] = [0, 0]
+        if hits or misses:
+            self._connection().execute(
+                'UPDATE cache_meta SET hits = hits + ?, misses = misses + ? WHERE id = 1',
+                (hits, misses)
+            )
+
+    def stats(self):
+        """Entry count, bytes, limits and hit/miss totals across all workers"""
+        self._flush_counters()
+        entries, size, hits, misses = self._connection().execute(
+            'SELECT entries, bytes, hits, misses FROM cache_meta WHERE id = 1'
+        ).fetchone()
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_entries': self._max_entries,
+            'max_bytes': self._max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+        }
+
+    # Helpers
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _is_live(self, expires):
+        return expires is None or expires > time.time()
+
+    def _store(self, conn, key, value, timeout, mode):
+        expires = self._expiry(timeout)
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if mode == 'add':
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key = ? AND expires IS NOT NULL AND expires <= ?',
+                (key, time.time())
+            )
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO cache_entries (key, value, expires, size) VALUES (?, ?, ?, ?)',
+                (key, payload, expires, len(payload))
+            ).rowcount == 1
+        elif mode == 'touch':
+            return conn.execute(
+                'UPDATE cache_entries SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (expires, key, time.time())
+            ).rowcount == 1
+        else:
+            conn.execute(
+                'INSERT INTO cache_entries (key, value, expires, size) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, '
+                'expires = excluded.expires, size = excluded.size',
+                (key, payload, expires, len(payload))
+            )
+            inserted = True
+        if inserted:
+            self._cull(conn)
+        return inserted
+
+    def _over_limit(self, conn):
+        entries, size = conn.execute('SELECT entries, bytes FROM cache_meta WHERE id = 1').fetchone()
+        return entries if entries > self._max_entries or size > self._max_bytes else 0
+
+    def _cull(self, conn):
+        if not self._over_limit(conn):
+            return
+        conn.execute('DELETE FROM cache_entries WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        entries = self._over_limit(conn)
+        while entries:
+            doomed = entries if self._cull_frequency == 0 else max(1, entries // self._cull_frequency)
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (doomed,)
+            )
+            entries = self._over_limit(conn)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or not self._is_live(row[1]):
+            self._count(misses=1)
+            return default
+        self._count(hits=1)
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        placeholders = ', '.join('?' * len(key_map))
+        rows = self._connection().execute(
+            f'SELECT key, value, expires FROM cache_entries WHERE key IN ({placeholders})',
+            list(key_map)
+        ).fetchall()
+        found = {
+            key_map[key]: pickle.loads(value)
+            for key, value, expires in rows if self._is_live(expires)
+        }
+        self._count(hits=len(found), misses=len(key_map) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(lambda conn: self._store(conn, key, value, timeout, 'set'))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda conn: self._store(conn, key, value, timeout, 'add'))
+
+    def add_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        """add() for several keys in one transaction; returns the keys that already existed"""
+        key_map = {self.make_and_validate_key(key, version=version): key for key in data}
+        if not key_map:
+            return []
+        return self._write(lambda conn: [
+            original for key, original in key_map.items()
+            if not self._store(conn, key, data[original], timeout, 'add')
+        ])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda conn: self._store(conn, key, None, timeout, 'touch'))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def increment(conn):
+            row = conn.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or not self._is_live(row[1]):
+                raise ValueError(f"Key '{key}' not found")
+            payload = pickle.dumps(pickle.loads(row[0]) + delta, pickle.HIGHEST_PROTOCOL)
+            conn.execute(
+                'UPDATE cache_entries SET value = ?, size = ? WHERE key = ?',
+                (payload, len(payload), key)
+            )
+            return pickle.loads(payload)
+
+        return self._write(increment)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(
+            lambda conn: conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount == 1
+        )
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if not keys:
+            return
+        placeholders = ', '.join('?' * len(keys))
+        self._write(
+            lambda conn: conn.execute(f'DELETE FROM cache_entries WHERE key IN ({placeholders})', keys)
+        )
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT expires FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        return row is not None and self._is_live(row[0])
+
+    def clear(self):
+        self._write(lambda conn: conn.execute('DELETE FROM cache_entries'))
+
+    def close(self, **kwargs):
+        # Connections are reused for the life of the thread
+        pass
@@ -0,0 +1,78 @@
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.views.decorators.cache import cache_page
+
+# Cache namespaces and what they cover:
+#   catalog       - anything rendered from books, tags, moods and their associations
+#   genres        - the available_genres list
+#   moods         - the available_moods list
+#   fragments     - every pre-rendered book payload (tag and mood renames)
+#   book:<id>     - the pre-rendered payload of one book
+#   exclusions:<id> - the books never recommended to one user
+CATALOG = 'catalog'
+GENRES = 'genres'
+MOODS = 'moods'
+FRAGMENTS = 'fragments'
+
+
+def book_namespace(book_id):
+    return f"book:{book_id}"
+
+
+def exclusions_namespace(user_id):
+    return f"exclusions:{user_id}"
+
+
+def _generation_key(namespace):
+    return f"cache_generation:{namespace}"
+
+
+def get_generations(*namespaces):
+    """Current generation of each namespace, in order"""
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Seed from the clock so an evicted counter never reuses an old stamp;
+        # add rather than set, and read back, so a concurrent seed or bump wins
+        seeds = dict.fromkeys(missing, int(time.time() * 1000))
+        if hasattr(cache, 'add_many'):
+            cache.add_many(seeds, None)
+        else:
+            for key, seed in seeds.items():
+                cache.add(key, seed, None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def versioned_key(base, *namespaces):
+    """Stamp a cache key with the generations of the namespaces it depends on"""
+    stamp = '.'.join(str(generation) for generation in get_generations(*namespaces))
+    return f"{base}:g{stamp}"
+
+
+def bump(*namespaces):
+    """Invalidate every entry stamped with these namespaces once the transaction commits"""
+    def increment():
+        for namespace in namespaces:
+            key = _generation_key(namespace)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, int(time.time() * 1000), None)
+
+    transaction.on_commit(increment)
+
+
+def versioned_cache_page(timeout, *namespaces):
+    """cache_page whose key prefix carries the namespaces' generations"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            key_prefix = versioned_key('page', *namespaces)
+            return cache_page(timeout, key_prefix=key_prefix)(view_func)(request, *args, **kwargs)
+        return wrapped
+    return decorator
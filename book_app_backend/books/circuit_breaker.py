@@ -0,0 +1,128 @@
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CIRCUIT_BREAKER = {
+    'window_seconds': 60,      # rolling window for error and latency rates
+    'buckets': 6,              # window is tracked in this many counters
+    'min_calls': 10,           # calls in the window before the breaker can trip
+    'error_rate': 0.5,
+    'slow_call_seconds': 3.0,
+    'slow_call_rate': 0.5,
+    'open_seconds': 30,        # time before a half-open probe is allowed
+    'probe_timeout': 15,       # how long a probe holds the half-open slot
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+PROBE = 'probe'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker whose state lives in the Django cache, so
+    every worker sharing the cache backend sees the same circuit.
+
+    Outcomes are counted in time buckets with cache.incr. When the error or
+    slow-call rate over the window crosses its threshold the circuit opens
+    and calls are skipped. After open_seconds one caller wins the probe slot
+    (half-open); its success closes the circuit, its failure reopens it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.config = {**DEFAULT_CIRCUIT_BREAKER, **getattr(settings, 'EXTERNAL_CIRCUIT_BREAKER', {})}
+
+    def _key(self, suffix):
+        return f"circuit:{self.name}:{suffix}"
+
+    @property
+    def bucket_seconds(self):
+        return max(1, self.config['window_seconds'] // self.config['buckets'])
+
+    def _bucket_keys(self, counter):
+        current = int(time.time() // self.bucket_seconds)
+        return [
+            self._key(f"{counter}:{bucket}")
+            for bucket in range(current - self.config['buckets'] + 1, current + 1)
+        ]
+
+    def _increment(self, counter):
+        key = self._bucket_keys(counter)[-1]
+        cache.add(key, 0, self.config['window_seconds'] + self.bucket_seconds)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, self.config['window_seconds'] + self.bucket_seconds)
+
+    def _window_count(self, counter):
+        return sum(cache.get_many(self._bucket_keys(counter)).values())
+
+    def state(self):
+        return cache.get(self._key('state'), CLOSED)
+
+    def acquire(self):
+        """
+        Return CLOSED or PROBE if the provider may be called now, else None.
+        Pass the result back to record_success/record_failure.
+        """
+        if self.state() == CLOSED:
+            return CLOSED
+        opened_at = cache.get(self._key('opened_at'), 0)
+        if time.time() - opened_at < self.config['open_seconds']:
+            return None
+        # Half-open: a single probe at a time across all workers
+        if cache.add(self._key('probe'), 1, self.config['probe_timeout']):
+            return PROBE
+        return None
+
+    def record_success(self, latency, permit=CLOSED):
+        self._increment('calls')
+        if latency >= self.config['slow_call_seconds']:
+            self._increment('slow')
+        if permit == PROBE:
+            self._close()
+        else:
+            self._evaluate()
+
+    def record_failure(self, permit=CLOSED):
+        self._increment('calls')
+        self._increment('failures')
+        if permit == PROBE:
+            self._open('half-open probe failed')
+        else:
+            self._evaluate()
+
+    def _evaluate(self):
+        if self.state() != CLOSED:
+            return
+        calls = self._window_count('calls')
+        if calls < self.config['min_calls']:
+            return
+        error_rate = self._window_count('failures') / calls
+        slow_rate = self._window_count('slow') / calls
+        if error_rate >= self.config['error_rate']:
+            self._open(f"error rate {error_rate:.0%} over {calls} calls")
+        elif slow_rate >= self.config['slow_call_rate']:
+            self._open(f"slow call rate {slow_rate:.0%} over {calls} calls")
+
+    def _open(self, reason):
+        ttl = self.config['open_seconds'] * 10
+        cache.set_many({self._key('state'): OPEN, self._key('opened_at'): time.time()}, ttl)
+        cache.delete(self._key('probe'))
+        logger.warning(f"Circuit for {self.name} opened: {reason}")
+
+    def _close(self):
+        cache.delete_many([self._key('state'), self._key('opened_at'), self._key('probe')])
+        # Start the closed circuit with a clean window
+        cache.delete_many(self._bucket_keys('calls') + self._bucket_keys('failures') + self._bucket_keys('slow'))
+        logger.info(f"Circuit for {self.name} closed")
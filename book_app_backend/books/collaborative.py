@@ -0,0 +1,188 @@
+import time
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import BookNeighbors, UserLibrary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLABORATIVE_FILTERING = {
+    # Interest signalled by a shelf status when the book isn't rated
+    'status_weights': {
+        'completed': 1.0,
+        'reading': 0.8,
+        'paused': 0.4,
+        'want_to_read': 0.3,
+        'abandoned': -0.5,
+    },
+    'neighbors': 20,            # neighbors kept per book
+    'min_overlap': 2,           # readers two books must share to be neighbors
+    'shrinkage': 10.0,          # damps similarities backed by few shared readers
+    'max_items_per_user': 1000, # strongest signals kept for very large libraries
+    'chunk_size': 50000,        # library rows read per query
+    'write_batch_size': 1000,
+}
+
+
+def interaction_value(rating, status, status_weights):
+    """
+    Signed interest of one library row: a rating maps 0..5 onto -1..1,
+    otherwise the status weight applies
+    """
+    if rating is not None:
+        return (rating - 2.5) / 2.5
+    return status_weights.get(status, 0.0)
+
+
+class ItemNeighborBuilder:
+    """
+    Builds the BookNeighbors index from UserLibrary.
+
+    Library rows are streamed in primary-key chunks into a sparse user x
+    book matrix held as CSR (by user) and CSC (by book) NumPy arrays. For
+    each book, the rows of its readers are gathered and their dot products
+    with every co-read book are summed with bincount, giving one column of
+    the item-item cosine similarity matrix. Similarities are shrunk towards
+    zero by the number of shared readers and the top-k positive ones kept.
+    """
+
+    def __init__(self, **overrides):
+        self.config = {
+            **DEFAULT_COLLABORATIVE_FILTERING,
+            **getattr(settings, 'COLLABORATIVE_FILTERING', {}),
+            **{key: value for key, value in overrides.items() if value is not None},
+        }
+
+    def load(self):
+        """(user index, book id, value) arrays of every non-neutral library row"""
+        status_weights = self.config['status_weights']
+        users, books, values = [], [], []
+        last_pk = 0
+        while True:
+            rows = list(
+                UserLibrary.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'user_id', 'book_id', 'user_rating', 'status')[:self.config['chunk_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            _, user_ids, book_ids, ratings, statuses = zip(*rows)
+            users.append(np.array(user_ids, dtype=np.int64))
+            books.append(np.array(book_ids, dtype=np.int64))
+            values.append(np.array(
+                [interaction_value(rating, status, status_weights) for rating, status in zip(ratings, statuses)],
+                dtype=np.float64
+            ))
+
+        if not users:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float64)
+        users, books, values = np.concatenate(users), np.concatenate(books), np.concatenate(values)
+        keep = values != 0
+        _, user_index = np.unique(users[keep], return_inverse=True)
+        return user_index, books[keep], values[keep]
+
+    def _cap_users(self, user_index, item_index, values):
+        """Keep each user's max_items_per_user strongest signals"""
+        order = np.lexsort((-np.abs(values), user_index))
+        user_index, item_index, values = user_index[order], item_index[order], values[order]
+        starts = np.searchsorted(user_index, user_index)
+        keep = np.arange(len(user_index)) - starts < self.config['max_items_per_user']
+        return user_index[keep], item_index[keep], values[keep]
+
+    def neighbors(self, user_index, book_ids, values):
+        """Yield (book id, neighbor ids, similarities) for every book with neighbors"""
+        if not len(book_ids):
+            return
+        item_book_ids, item_index = np.unique(book_ids, return_inverse=True)
+        user_index, item_index, values = self._cap_users(user_index, item_index, values)
+        n_users, n_items = int(user_index.max()) + 1, len(item_book_ids)
+
+        # CSR by user (rows come out of _cap_users sorted by user)
+        user_indptr = np.concatenate(([0], np.cumsum(np.bincount(user_index, minlength=n_users))))
+        user_items, user_values = item_index, values
+
+        # CSC by book
+        order = np.argsort(item_index, kind='stable')
+        item_indptr = np.concatenate(([0], np.cumsum(np.bincount(item_index, minlength=n_items))))
+        item_users, item_values = user_index[order], values[order]
+
+        norms = np.sqrt(np.bincount(item_index, weights=values * values, minlength=n_items))
+        k = self.config['neighbors']
+        shrinkage = self.config['shrinkage']
+
+        for item in range(n_items):
+            readers = item_users[item_indptr[item]:item_indptr[item + 1]]
+            weights = item_values[item_indptr[item]:item_indptr[item + 1]]
+
+            # Gather the rows of every reader of this book
+            starts = user_indptr[readers]
+            counts = user_indptr[readers + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            co_items = user_items[offsets]
+            products = user_values[offsets] * np.repeat(weights, counts)
+
+            candidates, inverse = np.unique(co_items, return_inverse=True)
+            dots = np.bincount(inverse, weights=products)
+            overlap = np.bincount(inverse)
+            similarities = dots / (norms[item] * norms[candidates]) * (overlap / (overlap + shrinkage))
+
+            eligible = np.flatnonzero(
+                (candidates != item) & (overlap >= self.config['min_overlap']) & (similarities > 0)
+            )
+            if not len(eligible):
+                continue
+            if len(eligible) > k:
+                eligible = eligible[np.argpartition(-similarities[eligible], k - 1)[:k]]
+            eligible = eligible[np.argsort(-similarities[eligible], kind='stable')]
+            yield (
+                int(item_book_ids[item]),
+                item_book_ids[candidates[eligible]],
+                similarities[eligible].astype(np.float32)
+            )
+
+    def build(self):
+        """Replace the BookNeighbors index; returns the number of books indexed"""
+        started = time.monotonic()
+        user_index, book_ids, values = self.load()
+        loaded = time.monotonic()
+
+        batch_size = self.config['write_batch_size']
+        written = 0
+        with transaction.atomic():
+            BookNeighbors.objects.all().delete()
+            batch = []
+            for book_id, neighbor_ids, similarities in self.neighbors(user_index, book_ids, values):
+                batch.append(BookNeighbors(
+                    book_id=book_id,
+                    neighbor_ids=neighbor_ids.astype(np.int64).tobytes(),
+                    similarities=similarities.tobytes()
+                ))
+                if len(batch) >= batch_size:
+                    BookNeighbors.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            BookNeighbors.objects.bulk_create(batch)
+            written += len(batch)
+
+        logger.info(
+            f"Built item neighbors for {written} books from {len(book_ids)} library rows "
+            f"(load {loaded - started:.2f}s, total {time.monotonic() - started:.2f}s)"
+        )
+        return written
+
+
+def readers_also_liked(book_id, limit=10):
+    """[(book id, similarity)] of the books most co-read with book_id"""
+    row = BookNeighbors.objects.filter(book_id=book_id).values_list('neighbor_ids', 'similarities').first()
+    if row is None:
+        return []
+    neighbor_ids = np.frombuffer(bytes(row[0]), dtype=np.int64)[:limit]
+    similarities = np.frombuffer(bytes(row[1]), dtype=np.float32)[:limit]
+    return [(int(neighbor), float(similarity)) for neighbor, similarity in zip(neighbor_ids, similarities)]
@@ -0,0 +1,102 @@
+import zlib
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import UserLibrary, UserRecommendation
+from .cache_versions import exclusions_namespace, versioned_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECOMMENDATION_EXCLUSIONS = {
+    'ttl': 60 * 60 * 24,
+}
+
+
+class BookBitmap:
+    """
+    Set of book ids stored as a packed bitmap: bit i is set when book i is
+    in the set. Membership is a byte lookup, and mask() tests a whole NumPy
+    array of ids at once.
+    """
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits=None):
+        self.bits = bits if bits is not None else np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def from_ids(cls, book_ids):
+        book_ids = np.fromiter(book_ids, dtype=np.int64)
+        if not len(book_ids):
+            return cls()
+        flags = np.zeros(int(book_ids.max()) + 1, dtype=bool)
+        flags[book_ids] = True
+        return cls(np.packbits(flags))
+
+    @classmethod
+    def from_bytes(cls, payload):
+        return cls(np.frombuffer(zlib.decompress(payload), dtype=np.uint8))
+
+    def to_bytes(self):
+        # Sparse bitmaps are mostly zero bytes, which compress to almost nothing
+        return zlib.compress(self.bits.tobytes())
+
+    def __contains__(self, book_id):
+        byte = book_id >> 3
+        return 0 <= byte < len(self.bits) and bool(self.bits[byte] & (0x80 >> (book_id & 7)))
+
+    def __bool__(self):
+        return bool(self.bits.any())
+
+    def mask(self, book_ids):
+        """Boolean array: which of book_ids are in the set"""
+        byte = book_ids >> 3
+        inside = byte < len(self.bits)
+        found = np.zeros(len(book_ids), dtype=bool)
+        found[inside] = (self.bits[byte[inside]] & (0x80 >> (book_ids[inside] & 7))) != 0
+        return found
+
+
+class RecommendationExclusions:
+    """
+    Per-user bitmaps of the books never to recommend: already in the
+    library, or dismissed or saved from earlier recommendations.
+
+    Bitmaps are cached under the user's exclusions generation, which the
+    UserLibrary and UserRecommendation signals bump on commit, so a change
+    is picked up by the next quiz with one query.
+    """
+
+    def __init__(self):
+        self.config = {
+            **DEFAULT_RECOMMENDATION_EXCLUSIONS,
+            **getattr(settings, 'RECOMMENDATION_EXCLUSIONS', {})
+        }
+
+    def for_user(self, user):
+        if not user.is_authenticated:
+            return BookBitmap()
+        key = versioned_key(f"exclusions:{user.pk}", exclusions_namespace(user.pk))
+        payload = cache.get(key)
+        if payload is not None:
+            return BookBitmap.from_bytes(payload)
+
+        bitmap = BookBitmap.from_ids(self._excluded_ids(user.pk))
+        cache.set(key, bitmap.to_bytes(), self.config['ttl'])
+        return bitmap
+
+    def _excluded_ids(self, user_id):
+        # Default orderings aren't allowed inside a UNION
+        library = UserLibrary.objects.filter(user_id=user_id).order_by().values_list('book_id', flat=True)
+        handled = UserRecommendation.objects.filter(
+            Q(dismissed=True) | Q(saved=True), user_id=user_id
+        ).order_by().values_list('book_id', flat=True)
+        return library.union(handled).iterator()
+
+
+# Global instance
+recommendation_exclusions = RecommendationExclusions()
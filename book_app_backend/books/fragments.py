@@ -0,0 +1,70 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+
+from .cache_versions import FRAGMENTS, book_namespace, get_generations
+from .serializers import BookSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BOOK_FRAGMENTS = {
+    'enabled': True,
+    'ttl': 60 * 60 * 24 * 7,
+}
+
+
+class BookFragmentCache:
+    """
+    Pre-rendered BookSerializer payloads, one cache entry per book.
+
+    Each key carries the book's own generation and the shared FRAGMENTS
+    generation: saving a book or its tag/mood associations retires that
+    book's payload, renaming a tag or mood retires all of them. A page of
+    books costs one get_many; misses are prefetched and serialized together
+    and written back with set_many.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_BOOK_FRAGMENTS, **getattr(settings, 'BOOK_FRAGMENT_CACHE', {})}
+
+    def _keys(self, book_ids):
+        shared, *generations = get_generations(FRAGMENTS, *(book_namespace(book_id) for book_id in book_ids))
+        return {
+            book_id: f"book_fragment:{book_id}:g{shared}.{generation}"
+            for book_id, generation in zip(book_ids, generations)
+        }
+
+    def render(self, books):
+        """Payloads for books, in order"""
+        books = list(books)
+        if not books:
+            return []
+        if not self.config['enabled']:
+            return BookSerializer(books, many=True).data
+
+        keys = self._keys(list(dict.fromkeys(book.pk for book in books)))
+        found = cache.get_many(keys.values())
+
+        missing = list({book.pk: book for book in books if keys[book.pk] not in found}.values())
+        if missing:
+            # Only the misses need their tags and moods loaded
+            prefetch_related_objects(missing, *BookSerializer.eager_loading_lookups())
+            rendered = {
+                keys[book.pk]: dict(payload)
+                for book, payload in zip(missing, BookSerializer(missing, many=True).data)
+            }
+            cache.set_many(rendered, self.config['ttl'])
+            found.update(rendered)
+
+        return [dict(found[keys[book.pk]]) for book in books]
+
+    def render_by_id(self, books):
+        """Payloads keyed by book id, for BookSerializer's book_fragments context"""
+        books = list(books)
+        return {book.pk: payload for book, payload in zip(books, self.render(books))}
+
+
+# Global instance
+book_fragments = BookFragmentCache()
@@ -0,0 +1,187 @@
+import time
+import logging
+import threading
+
+from django.conf import settings
+
+from .models import BookGenre
+from .search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GENRE_TAXONOMY = {
+    # Other workers' new genres only reach this process on a periodic reload
+    'refresh_interval': 600,
+}
+
+# Top-level genres keyed by the mood quiz answer that selects them, and the
+# child genres filed under each
+CANONICAL_GENRES = {
+    'fiction': ('Fiction', ['Literary Fiction', 'Contemporary']),
+    'mystery': ('Mystery', ['Crime', 'Detective', 'Thriller']),
+    'romance': ('Romance', ['Contemporary Romance']),
+    'scifi': ('Science Fiction', ['Dystopian', 'Space Opera']),
+    'nonfiction': ('Nonfiction', ['Biography', 'Self-Help', 'History']),
+    'fantasy': ('Fantasy', ['Epic Fantasy', 'Urban Fantasy', 'Magic']),
+}
+
+QUIZ_GENRES = list(CANONICAL_GENRES)
+
+# Spellings folded together before matching; "non fiction" would otherwise
+# be filed under Fiction
+GENRE_SYNONYMS = {
+    'non fiction': 'nonfiction',
+    'sci fi': 'science fiction',
+    'scifi': 'science fiction',
+}
+
+
+def genre_key(name):
+    """Comparison form of a genre name: 'Non-Fiction' and 'nonfiction' are one genre"""
+    key = f" {' '.join(tokenize(name))} "
+    for spelling, canonical in GENRE_SYNONYMS.items():
+        key = key.replace(f' {spelling} ', f' {canonical} ')
+    return key.strip()
+
+
+class GenreTaxonomy:
+    """
+    Canonical genre tree over BookGenre rows, linked child to parent.
+
+    A free-text genre maps onto the tree by exact name, else onto the
+    longest genre name it contains as whole words ("Dystopian Fiction" is
+    filed under Dystopian, "Juvenile Fiction" under Fiction), else becomes a
+    new top-level genre. Browsing a genre covers its whole subtree, and the
+    descendant id sets are cached so filters are plain id lookups.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_GENRE_TAXONOMY, **getattr(settings, 'GENRE_TAXONOMY', {})}
+        self._lock = threading.RLock()
+        self._ids = None       # genre key -> genre id
+        self._parents = {}     # genre id -> parent id
+        self._descendants = {} # genre id -> frozenset of the ids in its subtree
+        self._matches = {}     # genre key -> matched genre id or None
+        self._loaded_at = 0
+
+    def _load(self):
+        rows = list(BookGenre.objects.order_by('pk').values_list('pk', 'name', 'parent_id'))
+        with self._lock:
+            self._ids = {}
+            for genre_id, name, _ in rows:
+                self._ids.setdefault(genre_key(name), genre_id)
+            self._parents = {genre_id: parent_id for genre_id, _, parent_id in rows}
+            self._descendants = {}
+            self._matches = {}
+            self._loaded_at = time.monotonic()
+
+    def _refresh(self):
+        # Callers hold self._lock, so no invalidate() lands between this and their reads
+        if self._ids is None or time.monotonic() - self._loaded_at > self.config['refresh_interval']:
+            self._load()
+
+    def invalidate(self):
+        """Reload on next use; called once a BookGenre change commits"""
+        with self._lock:
+            self._ids = None
+
+    # Lookups
+
+    def match(self, name):
+        """Id of the genre name maps onto, or None when no genre fits"""
+        key = genre_key(name)
+        if not key:
+            return None
+        with self._lock:
+            self._refresh()
+            if key in self._ids:
+                return self._ids[key]
+            if key not in self._matches:
+                padded = f' {key} '
+                best = max((known for known in self._ids if f' {known} ' in padded), key=len, default=None)
+                self._matches[key] = self._ids[best] if best else None
+            return self._matches[key]
+
+    def resolve(self, name):
+        """
+        Like match, but an unknown genre becomes a new top-level BookGenre.
+        The new row reaches the loaded tree when it commits (see signals), so
+        a rolled back insert never leaves a dangling id behind.
+        """
+        genre_id = self.match(name)
+        if genre_id is None and genre_key(name):
+            genre_id = BookGenre.objects.get_or_create(name=name.strip()[:100])[0].pk
+        return genre_id
+
+    def subtree(self, genre_id):
+        """Ids of genre_id and every genre below it"""
+        with self._lock:
+            self._refresh()
+            if genre_id not in self._descendants:
+                children = {}
+                for child, parent in self._parents.items():
+                    children.setdefault(parent, []).append(child)
+                ids, pending = set(), [genre_id]
+                while pending:
+                    current = pending.pop()
+                    if current not in ids:
+                        ids.add(current)
+                        pending.extend(children.get(current, ()))
+                self._descendants[genre_id] = frozenset(ids)
+            return self._descendants[genre_id]
+
+    def genre_ids(self, name):
+        """Ids of the genres a browse or filter on name covers"""
+        genre_id = self.match(name)
+        return self.subtree(genre_id) if genre_id is not None else frozenset()
+
+    def quiz_genre_ids(self, quiz_genre):
+        return self.genre_ids(CANONICAL_GENRES[quiz_genre][0])
+
+    # Maintenance
+
+    def ensure(self):
+        """
+        Create the CANONICAL_GENRES nodes and file every other parentless
+        BookGenre under the taxonomy genre it names; returns the number of
+        genres created or moved
+        """
+        changed = 0
+        existing = {}
+        for genre in BookGenre.objects.order_by('pk'):
+            existing.setdefault(genre_key(genre.name), genre)
+
+        canonical = {}
+        for root_name, child_names in CANONICAL_GENRES.values():
+            # Reuse a genre spelled differently, such as 'Non-Fiction'
+            root = existing.get(genre_key(root_name))
+            if root is None:
+                root = BookGenre.objects.create(name=root_name)
+                changed += 1
+            canonical[genre_key(root_name)] = root
+            for child_name in child_names:
+                child = existing.get(genre_key(child_name))
+                if child is None:
+                    child = BookGenre.objects.create(name=child_name, parent=root)
+                    changed += 1
+                elif child.parent_id is None:
+                    child.parent = root
+                    child.save(update_fields=['parent'])
+                    changed += 1
+                canonical[genre_key(child_name)] = child
+
+        # Only taxonomy nodes are candidate parents, so no cycle can form
+        for genre in BookGenre.objects.filter(parent__isnull=True).exclude(pk__in=[g.pk for g in canonical.values()]):
+            padded = f' {genre_key(genre.name)} '
+            best = max((key for key in canonical if f' {key} ' in padded), key=len, default=None)
+            if best is not None:
+                genre.parent = canonical[best]
+                genre.save(update_fields=['parent'])
+                changed += 1
+
+        self.invalidate()
+        return changed
+
+
+# Global instance
+genre_taxonomy = GenreTaxonomy()
@@ -0,0 +1,204 @@
+import time
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_CLIENT = {
+    'pool_connections': 4,     # hosts with a cached connection pool
+    'pool_maxsize': 10,        # keep-alive connections per host
+    'pool_block': False,       # open extra (non-pooled) connections when full
+    'retries': 2,
+    'backoff_factor': 0.2,
+    'retry_statuses': [429, 500, 502, 503, 504],
+    'latency_window': 1000,    # samples kept for percentiles
+}
+
+DEFAULT_ADAPTIVE_TIMEOUT = {
+    'percentile': 0.99,
+    'multiplier': 2.0,         # headroom over the observed percentile
+    'min_timeout': 1.0,
+    'min_samples': 20,         # use the configured timeout until then
+}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ProviderStats:
+    """Request counters and a sliding latency window for one provider"""
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.url = None
+
+
+class ProviderClient:
+    """
+    Shared HTTP client for external book providers.
+
+    One requests.Session keeps a keep-alive connection pool per host, so
+    repeated searches skip the TCP and TLS handshakes. Pool sizes and
+    retries come from settings.EXTERNAL_HTTP_CLIENT.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_HTTP_CLIENT, **getattr(settings, 'EXTERNAL_HTTP_CLIENT', {})}
+        self.adaptive = {**DEFAULT_ADAPTIVE_TIMEOUT, **getattr(settings, 'EXTERNAL_ADAPTIVE_TIMEOUT', {})}
+        self.session = self._build_session()
+        self._stats = {}
+        self._breakers = {}
+        self._stats_lock = threading.Lock()
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.config['retries'],
+            backoff_factor=self.config['backoff_factor'],
+            status_forcelist=self.config['retry_statuses'],
+            allowed_methods=['GET'],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.config['pool_connections'],
+            pool_maxsize=self.config['pool_maxsize'],
+            pool_block=self.config['pool_block'],
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        return session
+
+    def _provider_stats(self, provider):
+        with self._stats_lock:
+            if provider not in self._stats:
+                self._stats[provider] = ProviderStats(self.config['latency_window'])
+            return self._stats[provider]
+
+    def breaker(self, provider):
+        with self._stats_lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(provider)
+            return self._breakers[provider]
+
+    def observed_timeout(self, provider):
+        """Timeout derived from the latency percentile, or None without enough samples"""
+        stats = self._provider_stats(provider)
+        with stats.lock:
+            latencies = list(stats.latencies)
+        if len(latencies) < self.adaptive['min_samples']:
+            return None
+        observed = percentile(latencies, self.adaptive['percentile']) * self.adaptive['multiplier']
+        return max(self.adaptive['min_timeout'], observed)
+
+    def adaptive_timeout(self, provider, timeout):
+        """Shrink timeout towards the provider's observed latency"""
+        observed = self.observed_timeout(provider)
+        return timeout if observed is None else min(timeout, observed)
+
+    def get(self, provider, url, params=None, timeout=10):
+        """
+        GET url on behalf of provider; raises requests.RequestException, or
+        CircuitOpenError without making a request while the circuit is open
+        """
+        breaker = self.breaker(provider)
+        permit = breaker.acquire()
+        if permit is None:
+            raise CircuitOpenError(f"Circuit for {provider} is open")
+        timeout = self.adaptive_timeout(provider, timeout)
+
+        stats = self._provider_stats(provider)
+        with stats.lock:
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.url = url
+        started = time.monotonic()
+        try:
+            response = self.session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            breaker.record_success(time.monotonic() - started, permit)
+            return response
+        except requests.RequestException as e:
+            with stats.lock:
+                stats.errors += 1
+            status_code = getattr(e.response, 'status_code', None)
+            if status_code is not None and status_code < 500 and status_code != 429:
+                # Client errors say nothing about the provider's health
+                breaker.record_success(time.monotonic() - started, permit)
+            else:
+                breaker.record_failure(permit)
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with stats.lock:
+                stats.in_flight -= 1
+                stats.latencies.append(elapsed)
+
+    def _connection_counts(self, url):
+        """Connections opened and requests sent by the pools serving url's host"""
+        host = urlparse(url).hostname
+        pools = self.session.get_adapter(url).poolmanager.pools
+        connections = requests_sent = 0
+        for key in pools.keys():
+            if key.key_host == host:
+                pool = pools[key]
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return connections, requests_sent
+
+    def stats(self):
+        """Per-provider request, reuse and latency statistics"""
+        report = {}
+        with self._stats_lock:
+            providers = dict(self._stats)
+        for provider, stats in providers.items():
+            with stats.lock:
+                latencies = list(stats.latencies)
+                entry = {
+                    'requests': stats.requests,
+                    'errors': stats.errors,
+                    'in_flight': stats.in_flight,
+                }
+                url = stats.url
+            p50 = percentile(latencies, 0.50)
+            p99 = percentile(latencies, 0.99)
+            entry['p50_ms'] = round(p50 * 1000, 1) if p50 is not None else None
+            entry['p99_ms'] = round(p99 * 1000, 1) if p99 is not None else None
+
+            connections, pool_requests = self._connection_counts(url) if url else (0, 0)
+            entry['connections_opened'] = connections
+            entry['connection_reuse_ratio'] = (
+                round(1 - connections / pool_requests, 3) if pool_requests else None
+            )
+            entry['circuit'] = self.breaker(provider).state()
+            observed = self.observed_timeout(provider)
+            entry['adaptive_timeout'] = round(observed, 3) if observed is not None else None
+            report[provider] = entry
+        return report
+
+
+# Global instance
+provider_client = ProviderClient()
@@ -0,0 +1,225 @@
+import time
+import queue
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Book
+from . import cache_versions
+from .genres import genre_taxonomy
+from .mood_scoring import mood_scorer
+from .search_index import book_search_index
+from .serializers import ExternalBookSerializer
+from .suggestions import suggestion_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGESTION = {
+    'enabled': True,
+    'batch_size': 100,
+    'flush_interval': 2.0,   # seconds to wait for a batch to fill up
+    'max_queue': 10000,      # external hits dropped beyond this backlog
+}
+
+IDENTIFIERS = ['isbn', 'google_books_id', 'openlibrary_id']
+
+# Columns refreshed on existing rows when the provider knows more than we do
+FILLABLE_FIELDS = ['description', 'page_count', 'cover_image_url', 'isbn', 'google_books_id', 'openlibrary_id']
+
+
+def external_to_book_fields(data):
+    """Map a validated ExternalBookSerializer payload onto Book columns"""
+    helper = ExternalBookSerializer()
+    cover_image_url = helper.get_cover_image_url(data)
+    fields = {
+        'title': (data.get('title') or '')[:255],
+        'author': helper.get_author(data)[:255],
+        'isbn': helper.get_isbn(data),
+        'description': data.get('description') or '',
+        'genre': helper.get_genre(data)[:100],
+        'published_year': helper.get_year(data),
+        'page_count': data.get('page_count'),
+        'cover_image_url': cover_image_url if cover_image_url and len(cover_image_url) <= 200 else None,
+        'google_books_id': (data.get('google_books_id') or '')[:100] or None,
+        'openlibrary_id': (data.get('openlibrary_id') or '')[:100] or None,
+        'average_rating': min(5.0, max(0.0, data.get('average_rating') or 0.0)),
+        'rating_count': data.get('ratings_count') or 0,
+    }
+    if fields['isbn'] and len(fields['isbn']) > 13:
+        fields['isbn'] = None
+    return fields
+
+
+class ExternalBookIngestor:
+    """
+    Writes external search hits back into the local catalog.
+
+    Hits are queued from the request thread and a background worker drains
+    the queue in batches: each batch is deduplicated by ISBN, Google Books
+    ID and Open Library ID, matched against existing rows with one query per
+    identifier, and upserted with bulk_create / bulk_update.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_INGESTION, **getattr(settings, 'EXTERNAL_BOOK_INGESTION', {})}
+        self._queue = queue.Queue(maxsize=self.config['max_queue'])
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, books):
+        """Queue external hits for ingestion without blocking the caller"""
+        if not self.config['enabled'] or not books:
+            return
+        self._ensure_worker()
+        for book in books:
+            try:
+                self._queue.put_nowait(book)
+            except queue.Full:
+                logger.warning("External book ingestion queue is full; dropping hits")
+                break
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='external-book-ingestion', daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.config['flush_interval']
+            while len(batch) < self.config['batch_size']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                close_old_connections()
+                self.ingest(batch)
+            except Exception as e:
+                logger.error(f"External book ingestion failed: {e}")
+            finally:
+                close_old_connections()
+
+    def ingest(self, books):
+        """Upsert a batch of external hits; returns (created, updated) counts"""
+        candidates = self._deduplicate(
+            fields for fields in map(external_to_book_fields, books)
+            if fields['title'] and fields['published_year']
+        )
+        if not candidates:
+            return 0, 0
+
+        existing = self._match_existing(candidates)
+        to_create, to_update = [], {}
+        for fields in candidates:
+            book = next(
+                (existing[(identifier, fields[identifier])]
+                 for identifier in IDENTIFIERS
+                 if (identifier, fields[identifier]) in existing),
+                None
+            )
+            if book is None:
+                # bulk_create skips the pre_save signal that maps the genre
+                to_create.append(Book(**fields, canonical_genre_id=genre_taxonomy.resolve(fields['genre'])))
+                continue
+            changed = False
+            for field in FILLABLE_FIELDS:
+                if fields[field] and not getattr(book, field):
+                    setattr(book, field, fields[field])
+                    changed = True
+            if changed:
+                to_update[book.pk] = book
+
+        created = self._create(to_create)
+        updated = self._update(to_update.values())
+
+        # bulk operations bypass post_save, so index explicitly
+        for book in [*created, *updated]:
+            book_search_index.index_book(book)
+            suggestion_index.update_book(book, tag_names=[] if book in created else None)
+            mood_scorer.update_book(book)
+
+        if created or updated:
+            cache_versions.bump(
+                cache_versions.CATALOG, cache_versions.GENRES,
+                *(cache_versions.book_namespace(book.pk) for book in updated)
+            )
+            logger.info(f"Ingested external books: {len(created)} created, {len(updated)} updated")
+        return len(created), len(updated)
+
+    def _deduplicate(self, rows):
+        seen = set()
+        unique = []
+        for fields in rows:
+            keys = {(identifier, fields[identifier]) for identifier in IDENTIFIERS if fields[identifier]}
+            if not keys or keys & seen:
+                continue
+            seen |= keys
+            unique.append(fields)
+        return unique
+
+    def _match_existing(self, candidates):
+        existing = {}
+        for identifier in IDENTIFIERS:
+            values = {fields[identifier] for fields in candidates if fields[identifier]}
+            if not values:
+                continue
+            for book in Book.objects.filter(**{f'{identifier}__in': values}):
+                existing[(identifier, getattr(book, identifier))] = book
+        return existing
+
+    def _create(self, books):
+        if not books:
+            return []
+        try:
+            with transaction.atomic():
+                return Book.objects.bulk_create(books)
+        except IntegrityError:
+            # A concurrent writer took one of the ISBNs; fall back to row by row
+            created = []
+            for book in books:
+                try:
+                    with transaction.atomic():
+                        book.save()
+                    created.append(book)
+                except IntegrityError:
+                    continue
+            return created
+
+    def _update(self, books):
+        books = list(books)
+        if not books:
+            return []
+        # bulk_update skips auto_now; other workers sync on updated_at
+        now = timezone.now()
+        for book in books:
+            book.updated_at = now
+        fields = [*FILLABLE_FIELDS, 'updated_at']
+        try:
+            with transaction.atomic():
+                Book.objects.bulk_update(books, fields)
+            return books
+        except IntegrityError:
+            # A filled-in identifier is already taken; keep the rows that still fit
+            updated = []
+            for book in books:
+                try:
+                    with transaction.atomic():
+                        book.save(update_fields=fields)
+                    updated.append(book)
+                except IntegrityError:
+                    continue
+            return updated
+
+
+# Global instance
+external_book_ingestor = ExternalBookIngestor()
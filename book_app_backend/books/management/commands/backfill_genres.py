@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from books.models import Book
+from books import cache_versions
+from books.genres import genre_taxonomy
+
+
+class Command(BaseCommand):
+    help = 'Build the canonical genre taxonomy and map free-text book genres onto it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Remap books that already have a canonical genre',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Books mapped per transaction')
+
+    def handle(self, *args, **options):
+        changed = genre_taxonomy.ensure()
+        self.stdout.write(f'Genre taxonomy ready ({changed} genres created or filed)')
+
+        books = Book.objects.all() if options['all'] else Book.objects.filter(canonical_genre__isnull=True)
+        mapped = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                books.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'genre')[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            by_genre = {}
+            for pk, genre in rows:
+                by_genre.setdefault(genre_taxonomy.resolve(genre), []).append(pk)
+            with transaction.atomic():
+                # update() skips auto_now; other workers sync on updated_at
+                now = timezone.now()
+                for genre_id, pks in by_genre.items():
+                    mapped += Book.objects.filter(pk__in=pks).update(canonical_genre_id=genre_id, updated_at=now)
+            self.stdout.write(f'  mapped {mapped} books')
+
+        cache_versions.bump(cache_versions.CATALOG, cache_versions.GENRES)
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully mapped {mapped} books onto the genre taxonomy!')
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from books.collaborative import ItemNeighborBuilder
+
+
+class Command(BaseCommand):
+    help = 'Build the "readers also liked" item-item neighbor index from user libraries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbors', type=int, help='Neighbors kept per book')
+        parser.add_argument('--min-overlap', type=int, help='Readers two books must share')
+        parser.add_argument('--chunk-size', type=int, help='Library rows read per query')
+
+    def handle(self, *args, **options):
+        builder = ItemNeighborBuilder(
+            neighbors=options['neighbors'],
+            min_overlap=options['min_overlap'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write('Building item neighbors from user libraries...')
+
+        written = builder.build()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully built neighbors for {written} books!')
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from books.similarity import book_similarity_index
+
+
+class Command(BaseCommand):
+    help = 'Build the content-based "similar books" vector index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only re-index books changed since the last build or update',
+        )
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            self.stdout.write('Updating the book similarity index...')
+            written = book_similarity_index.update()
+        else:
+            self.stdout.write('Building the book similarity index...')
+            written = book_similarity_index.build()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {written} books!')
+        )
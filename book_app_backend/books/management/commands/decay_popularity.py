@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from books.popularity import popularity_engine
+
+
+class Command(BaseCommand):
+    help = 'Rescale every book\'s popularity_score to the present; run on a schedule, e.g. hourly from cron'
+
+    def handle(self, *args, **options):
+        updated = popularity_engine.decay()
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully decayed the popularity of {updated} books!')
+        )
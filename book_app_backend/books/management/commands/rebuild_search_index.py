@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from books.models import Book
+from books.search_index import book_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all books'
+
+    def handle(self, *args, **options):
+        backend = type(book_search_index.backend).__name__
+        self.stdout.write(f'Rebuilding search index using {backend}...')
+
+        book_search_index.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {Book.objects.count()} books!')
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from books.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute our readers\' rating aggregates from the library and correct drifted books; run on a schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Books reconciled per transaction')
+
+    def handle(self, *args, **options):
+        corrected = reconcile_ratings(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully reconciled ratings ({corrected} books corrected)')
+        )
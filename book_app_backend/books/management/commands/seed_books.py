@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from books.models import Book, BookTag, BookMood, BookGenre, BookTagAssociation, BookMoodAssociation
+from books.genres import genre_taxonomy
 
 
 class Command(BaseCommand):
@@ -19,6 +20,7 @@ class Command(BaseCommand):
 
         for genre_name in genres:
             BookGenre.objects.get_or_create(name=genre_name)
+        genre_taxonomy.ensure()
 
         # Create moods
         moods = [
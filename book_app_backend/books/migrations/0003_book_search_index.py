@@ -0,0 +1,117 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:24
+
+import re
+import unicodedata
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+
+FTS_TABLE = 'books_book_fts'
+
+# Frozen copies of books.search_index as of this migration
+SEARCH_FIELDS = ['title', 'author', 'description', 'genre']
+
+MAX_TERM_LENGTH = 64
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    if not text:
+        return []
+    folded = unicodedata.normalize('NFKD', str(text))
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN_RE.findall(folded.lower())]
+
+
+FTS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, description, genre,
+        content='books_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_ai AFTER INSERT ON books_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, description, genre)
+        VALUES (new.id, new.title, new.author, new.description, new.genre);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_ad AFTER DELETE ON books_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.genre);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_au AFTER UPDATE OF title, author, description, genre ON books_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, description, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.genre);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, description, genre)
+        VALUES (new.id, new.title, new.author, new.description, new.genre);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')",
+]
+
+FTS_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS books_book_fts_ai",
+    "DROP TRIGGER IF EXISTS books_book_fts_ad",
+    "DROP TRIGGER IF EXISTS books_book_fts_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Create the FTS5 index on SQLite, otherwise backfill the term table"""
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in FTS_SQL:
+            schema_editor.execute(statement)
+        return
+
+    Book = apps.get_model('books', 'Book')
+    BookSearchTerm = apps.get_model('books', 'BookSearchTerm')
+    batch = []
+    for book in Book.objects.only(*SEARCH_FIELDS).order_by('pk').iterator(chunk_size=1000):
+        for field in SEARCH_FIELDS:
+            for term, frequency in Counter(tokenize(getattr(book, field))).items():
+                batch.append(BookSearchTerm(book_id=book.pk, term=term, field=field, frequency=frequency))
+        if len(batch) >= 1000:
+            BookSearchTerm.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BookSearchTerm.objects.bulk_create(batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in FTS_DROP_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_userrecommendation_book_energy_level_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('field', models.CharField(choices=[('title', 'Title'), ('author', 'Author'), ('description', 'Description'), ('genre', 'Genre')], max_length=20)),
+                ('frequency', models.PositiveIntegerField(default=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='books.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'book'], name='books_books_term_ca50ad_idx')],
+                'unique_together': {('book', 'term', 'field')},
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
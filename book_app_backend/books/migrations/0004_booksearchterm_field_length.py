@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:25
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+
+
+def backfill_field_length(apps, schema_editor):
+    """A field's length is the total frequency of its terms"""
+    BookSearchTerm = apps.get_model('books', 'BookSearchTerm')
+    lengths = BookSearchTerm.objects.filter(
+        book_id=OuterRef('book_id'),
+        field=OuterRef('field')
+    ).order_by().values('book_id', 'field').annotate(total=Sum('frequency')).values('total')
+    BookSearchTerm.objects.update(field_length=Subquery(lengths))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booksearchterm',
+            name='field_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_field_length, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_booksearchterm_field_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookNeighbors',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbors', serialize=False, to='books.book')),
+                ('neighbor_ids', models.BinaryField()),
+                ('similarities', models.BinaryField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
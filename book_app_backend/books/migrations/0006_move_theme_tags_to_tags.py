@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+def theme_names(theme_tags):
+    """Distinct normalized names in a comma-separated theme_tags value"""
+    names = (' '.join(theme.lower().split())[:50] for theme in theme_tags.split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def move_theme_tags(apps, schema_editor):
+    """Link every comma-separated theme to its book through BookTag rows"""
+    Book = apps.get_model('books', 'Book')
+    BookTag = apps.get_model('books', 'BookTag')
+    BookTagAssociation = apps.get_model('books', 'BookTagAssociation')
+
+    # Themes reuse existing tags whatever their casing
+    tag_ids = {}
+    for tag_id, name in BookTag.objects.order_by('pk').values_list('pk', 'name'):
+        tag_ids.setdefault(' '.join(name.lower().split()), tag_id)
+
+    last_pk = 0
+    while True:
+        rows = list(
+            Book.objects.filter(pk__gt=last_pk).exclude(theme_tags='').order_by('pk')
+            .values_list('pk', 'theme_tags')[:1000]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        links = []
+        for book_id, theme_tags in rows:
+            for name in theme_names(theme_tags):
+                if name not in tag_ids:
+                    tag_ids[name] = BookTag.objects.create(name=name).pk
+                links.append(BookTagAssociation(book_id=book_id, tag_id=tag_ids[name]))
+        BookTagAssociation.objects.bulk_create(links, ignore_conflicts=True)
+    # Cached payloads are retired by the post_migrate handler in books.signals
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_book_neighbors'),
+    ]
+
+    operations = [
+        # Themes can't be told apart from other tags afterwards, so the
+        # column comes back empty when this is reversed
+        migrations.RunPython(move_theme_tags, migrations.RunPython.noop),
+    ]
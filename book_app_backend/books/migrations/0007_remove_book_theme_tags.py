@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_move_theme_tags_to_tags'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='book',
+            name='theme_tags',
+        ),
+    ]
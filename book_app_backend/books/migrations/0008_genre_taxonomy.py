@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_remove_book_theme_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='canonical_genre',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='books', to='books.bookgenre'),
+        ),
+        migrations.AddField(
+            model_name='bookgenre',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='books.bookgenre'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['canonical_genre', '-popularity_score'], name='books_book_canonic_ccd24c_idx'),
+        ),
+    ]
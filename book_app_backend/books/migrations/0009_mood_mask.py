@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:01
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# The FTS5 triggers created with the search index
+search_index_migration = import_module('books.migrations.0003_book_search_index')
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    SQLite adds a NOT NULL column by rebuilding books_book, which drops the
+    triggers keeping the FTS5 index in sync; the rows and their ids are
+    copied as they were, so the index itself is still valid
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in search_index_migration.FTS_SQL:
+            if 'CREATE TRIGGER' in statement:
+                schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_genre_taxonomy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='mood_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='bookmood',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Book.mood_mask is a signed 64-bit column; the sign bit is never used
+MAX_MOOD_BITS = 63
+
+
+def backfill_mood_masks(apps, schema_editor):
+    """Give every mood a bit and every book the mask of its moods"""
+    Book = apps.get_model('books', 'Book')
+    BookMood = apps.get_model('books', 'BookMood')
+    BookMoodAssociation = apps.get_model('books', 'BookMoodAssociation')
+
+    for bit, mood in enumerate(BookMood.objects.order_by('pk')[:MAX_MOOD_BITS]):
+        mood.bit = bit
+        mood.save(update_fields=['bit'])
+
+    masks = {}
+    rows = BookMoodAssociation.objects.filter(mood__bit__isnull=False).values_list('book_id', 'mood__bit')
+    for book_id, bit in rows.iterator():
+        masks[book_id] = masks.get(book_id, 0) | (1 << bit)
+
+    # Books sharing a mask are updated together
+    by_mask = {}
+    for book_id, mask in masks.items():
+        by_mask.setdefault(mask, []).append(book_id)
+    for mask, book_ids in by_mask.items():
+        for start in range(0, len(book_ids), 500):
+            Book.objects.filter(pk__in=book_ids[start:start + 500]).update(mood_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_mood_mask'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_mood_masks, migrations.RunPython.noop),
+    ]
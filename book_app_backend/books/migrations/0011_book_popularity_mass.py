@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_backfill_mood_masks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='popularity_mass',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:08
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Adding NOT NULL columns rebuilds books_book on SQLite, like 0009
+restore_search_triggers = import_module('books.migrations.0009_mood_mask').restore_search_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_book_popularity_mass'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='user_rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='user_rating_sum',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def fold_user_ratings(apps, schema_editor, sign):
+    """
+    Add (sign 1) or take back out (sign -1) our readers' ratings in
+    average_rating and rating_count, which held the provider's figures only
+    """
+    Book = apps.get_model('books', 'Book')
+    UserLibrary = apps.get_model('books', 'UserLibrary')
+
+    aggregates = (
+        UserLibrary.objects.filter(user_rating__isnull=False).order_by()
+        .values('book_id').annotate(rating_sum=Sum('user_rating'), count=Count('pk'))
+    )
+    for row in aggregates.iterator():
+        book = Book.objects.filter(pk=row['book_id']).first()
+        if book is None:
+            continue
+        total = book.average_rating * book.rating_count + sign * row['rating_sum']
+        book.rating_count = max(book.rating_count + sign * row['count'], 0)
+        book.average_rating = min(max(total / book.rating_count, 0.0), 5.0) if book.rating_count else 0.0
+        book.user_rating_sum = row['rating_sum'] if sign > 0 else 0.0
+        book.user_rating_count = row['count'] if sign > 0 else 0
+        book.save(update_fields=['average_rating', 'rating_count', 'user_rating_sum', 'user_rating_count'])
+
+
+def backfill_user_ratings(apps, schema_editor):
+    fold_user_ratings(apps, schema_editor, 1)
+
+
+def remove_user_ratings(apps, schema_editor):
+    fold_user_ratings(apps, schema_editor, -1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_book_user_ratings'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_ratings, remove_user_ratings),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'books_booksearchterm_term_pattern_idx'
+
+
+def create_pattern_index(apps, schema_editor):
+    """
+    term__startswith compiles to LIKE 'prefix%', which PostgreSQL only
+    serves from a btree built with a pattern operator class unless the
+    database uses the C collation
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+            "ON books_booksearchterm (term varchar_pattern_ops, book_id)"
+        )
+
+
+def drop_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_backfill_user_ratings'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pattern_index, drop_pattern_index),
+    ]
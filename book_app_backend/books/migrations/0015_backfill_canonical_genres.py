@@ -0,0 +1,97 @@
+import re
+import unicodedata
+
+from django.db import migrations
+from django.db.models.functions import Now
+
+# Frozen copies of books.genres as of this migration
+CANONICAL_GENRES = [
+    ('Fiction', ['Literary Fiction', 'Contemporary']),
+    ('Mystery', ['Crime', 'Detective', 'Thriller']),
+    ('Romance', ['Contemporary Romance']),
+    ('Science Fiction', ['Dystopian', 'Space Opera']),
+    ('Nonfiction', ['Biography', 'Self-Help', 'History']),
+    ('Fantasy', ['Epic Fantasy', 'Urban Fantasy', 'Magic']),
+]
+
+GENRE_SYNONYMS = {
+    'non fiction': 'nonfiction',
+    'sci fi': 'science fiction',
+    'scifi': 'science fiction',
+}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def genre_key(name):
+    folded = unicodedata.normalize('NFKD', str(name or ''))
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    key = f" {' '.join(token[:64] for token in _TOKEN_RE.findall(folded.lower()))} "
+    for spelling, canonical in GENRE_SYNONYMS.items():
+        key = key.replace(f' {spelling} ', f' {canonical} ')
+    return key.strip()
+
+
+def longest_contained(key, keys):
+    padded = f' {key} '
+    return max((known for known in keys if f' {known} ' in padded), key=len, default=None)
+
+
+def backfill_canonical_genres(apps, schema_editor):
+    """
+    Build the genre tree and map the free-text genre of every book onto it,
+    as the backfill_genres command does, so no existing book drops out of
+    genre browsing and filters
+    """
+    Book = apps.get_model('books', 'Book')
+    BookGenre = apps.get_model('books', 'BookGenre')
+
+    ids = {}
+    for genre in BookGenre.objects.order_by('pk'):
+        ids.setdefault(genre_key(genre.name), genre.pk)
+
+    canonical = {}
+    for root_name, child_names in CANONICAL_GENRES:
+        root_id = ids.get(genre_key(root_name)) or BookGenre.objects.create(name=root_name).pk
+        ids.setdefault(genre_key(root_name), root_id)
+        canonical[genre_key(root_name)] = root_id
+        for child_name in child_names:
+            child_id = ids.get(genre_key(child_name))
+            if child_id is None:
+                child_id = BookGenre.objects.create(name=child_name, parent_id=root_id).pk
+                ids[genre_key(child_name)] = child_id
+            else:
+                BookGenre.objects.filter(pk=child_id, parent__isnull=True).update(parent_id=root_id)
+            canonical[genre_key(child_name)] = child_id
+
+    for genre in BookGenre.objects.filter(parent__isnull=True).exclude(pk__in=canonical.values()):
+        best = longest_contained(genre_key(genre.name), canonical)
+        if best is not None:
+            BookGenre.objects.filter(pk=genre.pk).update(parent_id=canonical[best])
+
+    genres = Book.objects.filter(canonical_genre__isnull=True).order_by().values_list('genre', flat=True).distinct()
+    for name in list(genres):
+        key = genre_key(name)
+        if not key:
+            continue
+        genre_id = ids.get(key)
+        if genre_id is None:
+            best = longest_contained(key, ids)
+            if best is not None:
+                genre_id = ids[best]
+            else:
+                genre_id = ids[key] = BookGenre.objects.get_or_create(name=name.strip()[:100])[0].pk
+        Book.objects.filter(canonical_genre__isnull=True, genre=name).update(
+            canonical_genre_id=genre_id, updated_at=Now()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_booksearchterm_term_pattern_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_canonical_genres, migrations.RunPython.noop),
+    ]
@@ -29,6 +29,15 @@ class Book(models.Model):
     isbn = models.CharField(max_length=13, unique=True, null=True, blank=True)
     description = models.TextField(blank=True)
     genre = models.CharField(max_length=100)
+    # Derived from genre on save; indexed together with popularity below
+    canonical_genre = models.ForeignKey(
+        'BookGenre',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name='books'
+    )
     published_year = models.IntegerField()
     page_count = models.IntegerField(null=True, blank=True)
     cover_image_url = models.URLField(null=True, blank=True)
@@ -41,7 +50,15 @@ class Book(models.Model):
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
     rating_count = models.IntegerField(default=0)
+    # Our readers' share of the two above, kept in step with
+    # UserLibrary.user_rating (see books.ratings)
+    user_rating_sum = models.FloatField(default=0.0, editable=False)
+    user_rating_count = models.IntegerField(default=0, editable=False)
     popularity_score = models.FloatField(default=0.0)
+    # Reader activity as a forward-decayed sum relative to the fixed
+    # POPULARITY landmark (see books.popularity); popularity_score is this
+    # scaled to the present. Null until the book is first rescored.
+    popularity_mass = models.FloatField(null=True, blank=True, editable=False)
 
     # Mood-based metadata
     energy_level = models.CharField(
@@ -66,11 +83,9 @@ class Book(models.Model):
         help_text="Overall pacing of the narrative"
     )
 
-    # Theme tags (comma-separated for quick filtering)
-    theme_tags = models.TextField(
-        blank=True,
-        help_text="Comma-separated theme tags (e.g., 'adventure, romance, coming-of-age')"
-    )
+    # Bit set of the book's moods (BookMood.bit), kept in step with
+    # BookMoodAssociation so mood filters need no join
+    mood_mask = models.BigIntegerField(default=0, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -81,6 +96,7 @@ class Book(models.Model):
             models.Index(fields=['title']),
             models.Index(fields=['author']),
             models.Index(fields=['genre']),
+            models.Index(fields=['canonical_genre', '-popularity_score']),
             models.Index(fields=['isbn']),
             models.Index(fields=['google_books_id']),
             models.Index(fields=['energy_level']),
@@ -102,6 +118,8 @@ class BookTag(models.Model):
 
 class BookMood(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    # Position of this mood in Book.mood_mask; assigned on first save
+    bit = models.PositiveSmallIntegerField(unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -109,7 +127,18 @@ class BookMood(models.Model):
 
 
 class BookGenre(models.Model):
+    """
+    Node of the canonical genre taxonomy; free-text Book.genre values are
+    mapped onto it as Book.canonical_genre (see books.genres)
+    """
     name = models.CharField(max_length=100, unique=True)
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='children'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -134,6 +163,48 @@ class BookMoodAssociation(models.Model):
         unique_together = ['book', 'mood']
 
 
+class BookSearchTerm(models.Model):
+    """
+    Inverted index entry used for full-text search on backends without FTS5
+    """
+    FIELD_CHOICES = [
+        ('title', 'Title'),
+        ('author', 'Author'),
+        ('description', 'Description'),
+        ('genre', 'Genre'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    frequency = models.PositiveIntegerField(default=1)
+    field_length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['book', 'term', 'field']
+        indexes = [
+            models.Index(fields=['term', 'book']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} ({self.field}) -> {self.book_id}"
+
+
+class BookNeighbors(models.Model):
+    """
+    Item-item collaborative filtering neighbors of a book, written by the
+    build_item_neighbors command. Neighbor book ids (int64) and their
+    similarities (float32) are packed arrays, most similar first.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='neighbors')
+    neighbor_ids = models.BinaryField()
+    similarities = models.BinaryField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Neighbors of {self.book_id}"
+
+
 class UserLibrary(models.Model):
     STATUS_CHOICES = [
         ('want_to_read', 'Want to Read'),
@@ -0,0 +1,86 @@
+import logging
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
+
+from .models import Book, BookMood, BookMoodAssociation
+from .cache_versions import MOODS, versioned_key
+
+logger = logging.getLogger(__name__)
+
+# Book.mood_mask is a signed 64-bit column; the sign bit is never used
+MAX_MOOD_BITS = 63
+
+# Attempts at claiming a bit when concurrent saves race for the same one
+CLAIM_ATTEMPTS = 5
+
+
+def free_mood_bit():
+    """Lowest bit no mood holds yet, or None once all are taken"""
+    taken = set(BookMood.objects.select_for_update().filter(bit__isnull=False).values_list('bit', flat=True))
+    return next((bit for bit in range(MAX_MOOD_BITS) if bit not in taken), None)
+
+
+def claim_mood_bit(mood):
+    """
+    Give a saved mood the lowest free bit. Two moods saved at once can pick
+    the same one; the unique constraint rejects the second, which retries.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                bit = free_mood_bit()
+                if bit is None:
+                    return None
+                if not BookMood.objects.filter(pk=mood.pk, bit__isnull=True).update(bit=bit):
+                    # Already claimed for this mood
+                    bit = BookMood.objects.values_list('bit', flat=True).get(pk=mood.pk)
+        except IntegrityError:
+            continue
+        mood.bit = bit
+        return bit
+    logger.warning(f"Mood {mood.pk} got no mood_mask bit after {CLAIM_ATTEMPTS} attempts")
+    return None
+
+
+def refresh_mood_mask(book_id):
+    """Recompute one book's mood_mask from its BookMoodAssociation rows"""
+    bits = BookMoodAssociation.objects.filter(
+        book_id=book_id, mood__bit__isnull=False
+    ).values_list('mood__bit', flat=True)
+    # update() skips auto_now; other workers sync on updated_at
+    Book.objects.filter(pk=book_id).update(mood_mask=sum(1 << bit for bit in set(bits)), updated_at=Now())
+
+
+def _moods():
+    """(id, name, bit) of every mood, cached until a mood changes"""
+    key = versioned_key('mood_bits', MOODS)
+    moods = cache.get(key)
+    if moods is None:
+        moods = list(BookMood.objects.values_list('id', 'name', 'bit'))
+        cache.set(key, moods, 60 * 60 * 24)
+    return moods
+
+
+def filter_by_moods(queryset, terms):
+    """
+    Books of queryset with at least one mood whose name contains one of
+    terms (case-insensitive), as a single bitwise predicate on mood_mask
+    """
+    terms = [term.lower() for term in terms]
+    mask, unmapped = 0, []
+    for mood_id, name, bit in _moods():
+        if any(term in name.lower() for term in terms):
+            if bit is None:
+                unmapped.append(mood_id)
+            else:
+                mask |= 1 << bit
+
+    condition = Q(mood_hits__gt=0)
+    if unmapped:
+        # Moods past MAX_MOOD_BITS have no bit; a subquery still avoids the join fan-out
+        logger.warning(f"{len(unmapped)} moods have no mood_mask bit; filtering them by subquery")
+        condition |= Q(pk__in=BookMoodAssociation.objects.filter(mood_id__in=unmapped).values('book_id'))
+    return queryset.alias(mood_hits=F('mood_mask').bitand(mask)).filter(condition)
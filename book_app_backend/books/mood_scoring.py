@@ -0,0 +1,489 @@
+import math
+import time
+import bisect
+import logging
+import threading
+from datetime import timedelta
+from itertools import product
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import Book
+from .exclusions import BookBitmap
+from .genres import QUIZ_GENRES, genre_taxonomy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MOOD_SCORING = {
+    'sync_interval': 30,       # seconds between pulls of rows other workers changed
+    'sync_overlap': 5,         # seconds re-read on each pull, for slow transactions
+    'rebuild_interval': 600,   # seconds between full rebuilds, which drop deleted rows
+    'materialized_depth': 100, # ranked candidates kept per quiz combination
+}
+
+QUIZ_ENERGIES = ['high', 'medium', 'low']
+QUIZ_DEPTHS = ['light', 'medium', 'deep']
+
+# Categorical columns are stored as small codes; 0 means unset
+ENERGY_CODES = {'high': 1, 'medium': 2, 'low': 3}
+DEPTH_CODES = {'light': 1, 'medium': 2, 'deep': 3}
+PACE_CODES = {'fast': 1, 'moderate': 2, 'slow': 3}
+
+SNAPSHOT_FIELDS = [
+    'id', 'average_rating', 'rating_count', 'energy_level', 'reading_depth',
+    'reading_pace', 'page_count', 'description_length', 'canonical_genre_id'
+]
+
+# Ratings are stored on a 2 ** -20 grid (which holds the 3.5 and 4.0 score
+# thresholds exactly) so score, rating and rating count pack into one int64
+# sort key: 7, 23 and 33 bits
+RATING_SCALE = 1 << 20
+SCORE_SHIFT = 56
+RATING_SHIFT = 33
+MAX_RATING_COUNT = (1 << RATING_SHIFT) - 1
+
+COLUMN_TYPES = {
+    'id': np.int64,
+    'alive': np.bool_,
+    'rating': np.float64,
+    'rating_count': np.int64,
+    'energy': np.int8,
+    'depth': np.int8,
+    'pace': np.int8,
+    'has_pages': np.bool_,
+    'pages': np.int64,
+    'description_length': np.int64,
+}
+
+
+class _RankedList:
+    """
+    Best entries of one candidate set, kept sorted. Entries are
+    (-score, -rating, -rating_count, book_id) tuples, so ascending order is
+    best first. count is the size of the whole candidate set: when it equals
+    len(entries) the list holds every candidate.
+    """
+
+    __slots__ = ('entries', 'count')
+
+    def __init__(self, entries, count):
+        self.entries = entries
+        self.count = count
+
+    @property
+    def complete(self):
+        return len(self.entries) == self.count
+
+    def remove(self, book_id):
+        self.count -= 1
+        for i, entry in enumerate(self.entries):
+            if entry[3] == book_id:
+                del self.entries[i]
+                return
+
+    def add(self, entry, depth):
+        # Past the end of a truncated list, unlisted books may rank higher
+        if self.complete or (self.entries and entry < self.entries[-1]):
+            bisect.insort(self.entries, entry)
+            del self.entries[depth:]
+        self.count += 1
+
+
+class MoodScorer:
+    """
+    Columnar snapshot of the book attributes _calculate_match_score reads,
+    one NumPy array per attribute, so a mood quiz scores the whole catalog
+    in one vectorized pass and takes its top-k with argpartition.
+
+    Rows are updated in place from model signals in this process. Rows other
+    workers changed are pulled by updated_at every sync_interval, and the
+    snapshot is rebuilt every rebuild_interval to drop deleted books. That
+    rebuild runs on one background thread while quizzes keep scoring the
+    current arrays; rows written meanwhile are replayed onto the new arrays
+    before they are swapped in.
+
+    For every quiz combination the best materialized_depth candidates are
+    kept ranked, both for the books matching every answer and for the
+    genre-only fallback. Each row write moves the book within those lists,
+    so answering a quiz is a walk down a list skipping the user's excluded
+    books; a list is re-ranked from the arrays only when writes drain it.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_MOOD_SCORING, **getattr(settings, 'MOOD_SCORING', {})}
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()  # held by the one build in progress
+        self._replay = None    # edits to reapply to the snapshot being built
+        self._columns = None
+        self._genre_masks = {}
+        self._quiz_genre_ids = {}  # quiz genre -> canonical genre ids it covers
+        self._positions = {}   # book id -> row
+        self._lists = {}       # (energy, genre, depth) -> (matching, fallback) _RankedLists
+        self._size = 0
+        self._built_at = 0
+        self._checked_at = 0
+        self._synced_at = None
+
+    def is_built(self):
+        return self._columns is not None
+
+    def _snapshot_rows(self):
+        return Book.objects.annotate(description_length=Length('description')).values_list(*SNAPSHOT_FIELDS)
+
+    def build(self):
+        """Load the scoring attributes of every book into fresh arrays and swap them in"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        started = time.monotonic()
+        with self._lock:
+            self._replay = []
+        try:
+            synced_at = timezone.now()
+            rows = list(self._snapshot_rows().iterator())
+            fresh = MoodScorer()
+            fresh._load(rows)
+            with self._lock:
+                for edit in self._replay:
+                    edit(fresh)
+                for name in ('_columns', '_genre_masks', '_quiz_genre_ids', '_positions', '_lists', '_size'):
+                    setattr(self, name, getattr(fresh, name))
+                self._built_at = self._checked_at = time.monotonic()
+                self._synced_at = synced_at
+        finally:
+            with self._lock:
+                self._replay = None
+        logger.info(f"Built mood scoring snapshot of {len(rows)} books in {time.monotonic() - started:.2f}s")
+
+    def _load(self, rows):
+        self._allocate(max(16, len(rows) + len(rows) // 4))
+        self._quiz_genre_ids = {genre: genre_taxonomy.quiz_genre_ids(genre) for genre in QUIZ_GENRES}
+        for row in rows:
+            self._write_row(row)
+        self._materialize()
+
+    def sync(self):
+        """Pull the rows changed since the last build or sync"""
+        since = self._synced_at - timedelta(seconds=self.config['sync_overlap'])
+        synced_at = timezone.now()
+        rows = list(self._snapshot_rows().filter(updated_at__gte=since))
+        with self._lock:
+            for row in rows:
+                self._write_row(row)
+            self._checked_at = time.monotonic()
+            self._synced_at = synced_at
+
+    def _refresh(self):
+        now = time.monotonic()
+        if not self.is_built():
+            # Nothing to score yet: concurrent first quizzes wait for one build
+            with self._build_lock:
+                if not self.is_built():
+                    self._build()
+        elif now - self._built_at > self.config['rebuild_interval'] and self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._build_in_background, name='mood-scoring-build', daemon=True).start()
+        elif now - self._checked_at > self.config['sync_interval']:
+            self.sync()
+
+    def _build_in_background(self):
+        try:
+            close_old_connections()
+            self._build()
+        except Exception as e:
+            logger.error(f"Rebuilding the mood scoring snapshot failed: {e}")
+        finally:
+            self._build_lock.release()
+            close_old_connections()
+
+    # Incremental maintenance
+
+    def _edit(self, edit):
+        """Apply edit(scorer) to the live snapshot and to the one being built, if any"""
+        with self._lock:
+            if self.is_built():
+                edit(self)
+            if self._replay is not None:
+                self._replay.append(edit)
+
+    def update_book(self, book):
+        if not self.is_built() and self._replay is None:
+            return
+        row = (
+            book.pk, book.average_rating, book.rating_count, book.energy_level,
+            book.reading_depth, book.reading_pace, book.page_count,
+            len(book.description or ''), book.canonical_genre_id
+        )
+        self._edit(lambda scorer: scorer._write_row(row))
+
+    def remove_book(self, book_id):
+        if self.is_built() or self._replay is not None:
+            self._edit(lambda scorer: scorer._remove_row(book_id))
+
+    # Scoring
+
+    def recommend(self, energy, genre, depth, limit, exclude=()):
+        """
+        Same result as top_books, read from the materialized list of the
+        quiz combination when it still holds enough candidates
+        """
+        if limit <= 0:
+            return []
+        self._refresh()
+        exclude = self._exclusion(exclude)
+        with self._lock:
+            lists = self._lists.get((energy, genre, depth))
+            if lists is not None:
+                matching, fallback = lists
+                picked = self._take(matching, limit, exclude)
+                if picked is not None and len(picked) < limit:
+                    # Fewer than limit books match every answer
+                    picked = self._take(fallback, limit, exclude)
+                if picked is not None:
+                    return picked
+        # Exclusions ran past the end of a truncated list
+        return self.top_books(energy, genre, depth, limit, exclude)
+
+    @staticmethod
+    def _take(ranked, limit, exclude):
+        """
+        The best limit (book_id, score) pairs of ranked not in exclude; fewer
+        only if that is every candidate, None if the list can't tell
+        """
+        picked = []
+        for entry in ranked.entries:
+            if entry[3] in exclude:
+                continue
+            picked.append((entry[3], -entry[0]))
+            if len(picked) == limit:
+                return picked
+        return picked if ranked.complete else None
+
+    def top_books(self, energy, genre, depth, limit, exclude=()):
+        """
+        [(book_id, score)] of the best limit books for the quiz answers,
+        best first; ties go to the higher rated, then more rated book.
+
+        Candidates pass the same filters the ORM query used to apply, with
+        the same fallback to genre-only filtering when fewer than limit
+        books match every answer. Books in exclude (a BookBitmap or any
+        iterable of ids) are never candidates.
+        """
+        self._refresh()
+        exclude = self._exclusion(exclude)
+        with self._lock:
+            columns = self._view()
+            candidates = columns['alive'] & self._genre_mask(genre)
+            if exclude:
+                candidates = candidates & ~exclude.mask(columns['id'])
+            matching = candidates & self._quiz_mask(columns, energy, depth)
+            if np.count_nonzero(matching) < limit:
+                matching = candidates
+            return self._rank(columns, matching, self.scores(columns, energy, depth), limit)
+
+    @staticmethod
+    def _exclusion(exclude):
+        return exclude if isinstance(exclude, BookBitmap) else BookBitmap.from_ids(exclude)
+
+    def _view(self):
+        return {name: column[:self._size] for name, column in self._columns.items()}
+
+    def _genre_mask(self, genre):
+        if genre not in self._genre_masks:
+            return True
+        return self._genre_masks[genre][:self._size]
+
+    @classmethod
+    def _rank(cls, columns, mask, scores, k):
+        """[(book_id, score)] of the best k rows in mask"""
+        return [(int(columns['id'][row]), int(scores[row])) for row in cls._top_rows(columns, mask, scores, k)]
+
+    @staticmethod
+    def _top_rows(columns, mask, scores, k):
+        """Positions of the best k rows in mask, best first"""
+        rows = np.flatnonzero(mask)
+        k = min(k, len(rows))
+        if k <= 0:
+            return rows[:0]
+        keys = (
+            (scores[rows].astype(np.int64) << SCORE_SHIFT) |
+            ((columns['rating'][rows] * RATING_SCALE).astype(np.int64) << RATING_SHIFT) |
+            np.minimum(columns['rating_count'][rows], MAX_RATING_COUNT)
+        )
+        ids = columns['id'][rows]
+        threshold = keys[np.argpartition(-keys, k - 1)[k - 1]]
+        above = np.flatnonzero(keys > threshold)
+        tied = np.flatnonzero(keys == threshold)
+        if len(above) + len(tied) > k:
+            # Rows equal on every key but the id: the lowest ids take the last places
+            tied = tied[np.argpartition(ids[tied], k - len(above) - 1)[:k - len(above)]]
+        picked = np.concatenate([above, tied])
+        return rows[picked[np.lexsort((ids[picked], -keys[picked]))]]
+
+    @staticmethod
+    def _quiz_mask(columns, energy, depth):
+        energy_level, pace = columns['energy'], columns['pace']
+        reading_depth, pages, has_pages = columns['depth'], columns['pages'], columns['has_pages']
+        mask = np.ones(len(energy_level), dtype=bool)
+        if energy == 'high':
+            mask &= (energy_level == ENERGY_CODES['high']) | (pace == PACE_CODES['fast'])
+        elif energy == 'low':
+            mask &= (energy_level == ENERGY_CODES['low']) | (pace == PACE_CODES['slow'])
+        if depth == 'light':
+            mask &= (reading_depth == DEPTH_CODES['light']) | (has_pages & (pages < 300))
+        elif depth == 'deep':
+            mask &= (reading_depth == DEPTH_CODES['deep']) | (has_pages & (pages > 400))
+        return mask
+
+    @staticmethod
+    def scores(columns, energy, depth):
+        """Vectorized _calculate_match_score over every row of columns"""
+        rating, rating_count = columns['rating'], columns['rating_count']
+        energy_level, pace, reading_depth = columns['energy'], columns['pace'], columns['depth']
+        # A page count of 0 is falsy in the Python scorer, just like a missing one
+        pages = np.where(columns['has_pages'], columns['pages'], 0)
+        short_read = (pages != 0) & (pages < 300)
+        long_read = (pages != 0) & (pages > 400)
+
+        score = np.where(rating >= 4.0, 15, np.where(rating >= 3.5, 10, 0))
+
+        if energy == 'high':
+            score += np.where((energy_level == ENERGY_CODES['high']) | (pace == PACE_CODES['fast']), 20, 0)
+        elif energy == 'low':
+            score += np.where((energy_level == ENERGY_CODES['low']) | (pace == PACE_CODES['slow']), 20, 0)
+        elif energy == 'medium':
+            score += 15
+
+        if depth == 'light':
+            score += np.where((reading_depth == DEPTH_CODES['light']) | short_read, 15, 0)
+            score += np.where(short_read, 5, 0)
+        elif depth == 'deep':
+            score += np.where((reading_depth == DEPTH_CODES['deep']) | long_read, 15, 0)
+            score += np.where(long_read, 5, 0)
+        elif depth == 'medium':
+            score += 10
+
+        score += np.where(rating_count > 1000, 10, np.where(rating_count > 100, 5, 0))
+        score += np.where(columns['description_length'] > 200, 5, 0)
+        return score
+
+    # Internals (callers hold the lock)
+
+    def _materialize(self, combinations=None):
+        """Rank the candidates of the given quiz combinations (all by default) from the arrays"""
+        columns = self._view()
+        depth_limit = self.config['materialized_depth']
+        wanted = set(combinations or product(QUIZ_ENERGIES, QUIZ_GENRES, QUIZ_DEPTHS))
+        for energy, depth in product(QUIZ_ENERGIES, QUIZ_DEPTHS):
+            genres = [genre for genre in QUIZ_GENRES if (energy, genre, depth) in wanted]
+            if not genres:
+                continue
+            scores = self.scores(columns, energy, depth)
+            quiz = self._quiz_mask(columns, energy, depth)
+            for genre in genres:
+                candidates = columns['alive'] & self._genre_mask(genre)
+                self._lists[(energy, genre, depth)] = tuple(
+                    _RankedList(
+                        [self._entry(row, scores[row]) for row in self._top_rows(columns, mask, scores, depth_limit)],
+                        int(np.count_nonzero(mask))
+                    )
+                    for mask in (candidates & quiz, candidates)
+                )
+
+    def _entry(self, position, score):
+        columns = self._columns
+        return (
+            -int(score), -float(columns['rating'][position]),
+            -int(columns['rating_count'][position]), int(columns['id'][position])
+        )
+
+    def _memberships(self, position):
+        """{combination: (entry, matches every answer, matches the genre)} for one row"""
+        if not self._lists:
+            return {}
+        row = {name: column[position:position + 1] for name, column in self._columns.items()}
+        alive = bool(row['alive'][0])
+        memberships = {}
+        for energy, depth in product(QUIZ_ENERGIES, QUIZ_DEPTHS):
+            entry = self._entry(position, self.scores(row, energy, depth)[0])
+            quiz = bool(self._quiz_mask(row, energy, depth)[0])
+            for genre, mask in self._genre_masks.items():
+                candidate = alive and bool(mask[position])
+                memberships[(energy, genre, depth)] = (entry, candidate and quiz, candidate)
+        return memberships
+
+    def _rerank(self, position, before):
+        """Move one changed row within every materialized list"""
+        after = self._memberships(position)
+        if not after:
+            return
+        book_id = int(self._columns['id'][position])
+        depth_limit = self.config['materialized_depth']
+        drained = []
+        for combination, lists in self._lists.items():
+            old = before.get(combination)
+            entry = after[combination][0]
+            for index, ranked in enumerate(lists, start=1):
+                if old is not None and old[index]:
+                    ranked.remove(book_id)
+                if after[combination][index]:
+                    ranked.add(entry, depth_limit)
+                if not ranked.complete and len(ranked.entries) < depth_limit // 2:
+                    drained.append(combination)
+        if drained:
+            self._materialize(drained)
+
+    def _remove_row(self, book_id):
+        position = self._positions.pop(book_id, None)
+        if position is not None:
+            before = self._memberships(position)
+            self._columns['alive'][position] = False
+            self._rerank(position, before)
+
+    def _allocate(self, capacity):
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMN_TYPES.items()}
+        self._genre_masks = {genre: np.zeros(capacity, dtype=bool) for genre in QUIZ_GENRES}
+
+    def _grow(self):
+        capacity = len(self._columns['id']) * 2
+        for arrays in (self._columns, self._genre_masks):
+            for name, column in arrays.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:len(column)] = column
+                arrays[name] = grown
+
+    def _write_row(self, row):
+        book_id, rating, rating_count, energy, depth, pace, pages, description_length, genre_id = row
+        position = self._positions.get(book_id)
+        before = self._memberships(position) if position is not None else {}
+        if position is None:
+            if self._size == len(self._columns['id']):
+                self._grow()
+            position = self._positions[book_id] = self._size
+            self._size += 1
+
+        values = {
+            'id': book_id,
+            'alive': True,
+            'rating': math.floor((rating or 0.0) * RATING_SCALE) / RATING_SCALE,
+            'rating_count': rating_count or 0,
+            'energy': ENERGY_CODES.get(energy, 0),
+            'depth': DEPTH_CODES.get(depth, 0),
+            'pace': PACE_CODES.get(pace, 0),
+            'has_pages': pages is not None,
+            'pages': pages or 0,
+            'description_length': description_length or 0,
+        }
+        for name, value in values.items():
+            self._columns[name][position] = value
+        for quiz_genre, mask in self._genre_masks.items():
+            mask[position] = genre_id in self._quiz_genre_ids[quiz_genre]
+        self._rerank(position, before)
+
+
+# Global instance
+mood_scorer = MoodScorer()
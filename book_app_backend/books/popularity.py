@@ -0,0 +1,176 @@
+import math
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Coalesce, Now
+
+from .models import Book
+from . import cache_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POPULARITY = {
+    'half_life_days': 14,
+    # Stored masses are relative to this instant and must be rescored from
+    # scratch if it moves; 2 ** (elapsed / half-life) stays within a float
+    # for about 38 years at a 14 day half-life
+    'landmark': '2026-01-01T00:00:00+00:00',
+    # Popularity points per reader event
+    'event_weights': {
+        'added': 1.0,        # a book shelved in a library
+        'reading': 1.0,      # status changed to reading
+        'completed': 2.0,    # status changed to completed
+        'saved': 0.5,        # a mood recommendation saved
+    },
+    'mode': 'background',    # 'sync' writes each event before the response
+    'flush_interval': 60,    # seconds between batched writes
+    'batch_size': 500,       # books updated per statement
+    'decay_batch_size': 10000,
+}
+
+
+class PopularityEngine:
+    """
+    Time-decayed popularity from reader activity, using forward decay.
+
+    An event of weight w at time t contributes w * 2 ** ((t - landmark) / h)
+    to Book.popularity_mass, where h is the half-life. Contributions never
+    change after the fact, so recording an event is one addition and no
+    other book is touched; the decayed popularity at time now is
+    popularity_mass * 2 ** -((now - landmark) / h), the same factor for
+    every book. Events are summed per book in memory and added with one
+    UPDATE per batch; decay() rescales popularity_score across the catalog
+    on a schedule so books without new events cool down too. A book's
+    existing popularity_score (the seeded or provider value) becomes its
+    starting mass the first time it is rescored.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_POPULARITY, **getattr(settings, 'POPULARITY', {})}
+        self.half_life = self.config['half_life_days'] * 24 * 60 * 60
+        self.landmark = datetime.fromisoformat(self.config['landmark']).timestamp()
+        self._lock = threading.Lock()
+        self._pending = {}   # book id -> forward-decayed weight not yet written
+        self._wake = threading.Event()
+        self._worker = None
+
+    def growth(self, at=None):
+        """2 ** ((at - landmark) / half-life): forward weight of one point at `at`"""
+        at = time.time() if at is None else at
+        return math.pow(2.0, (at - self.landmark) / self.half_life)
+
+    # Events
+
+    def record(self, book_id, *events):
+        """Count reader events on a book once the current transaction commits"""
+        weights = self.config['event_weights']
+        weight = sum(weights.get(event, 0.0) for event in events)
+        if weight:
+            transaction.on_commit(lambda: self._add(book_id, weight * self.growth()))
+
+    def _add(self, book_id, amount):
+        with self._lock:
+            self._pending[book_id] = self._pending.get(book_id, 0.0) + amount
+            backlog = len(self._pending)
+        if self.config['mode'] != 'background':
+            self.flush()
+            return
+        self._ensure_worker()
+        if backlog >= self.config['batch_size']:
+            self._wake.set()
+
+    # Writes
+
+    def flush(self):
+        """Add the buffered events to their books; returns the number of books updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        scale = 1.0 / self.growth()
+        book_ids = sorted(pending)
+        updated = 0
+        for start in range(0, len(book_ids), self.config['batch_size']):
+            chunk = book_ids[start:start + self.config['batch_size']]
+            try:
+                updated += self._write(chunk, pending, scale)
+            except Exception:
+                # Keep the unwritten events for the next flush
+                with self._lock:
+                    for book_id in book_ids[start:]:
+                        self._pending[book_id] = self._pending.get(book_id, 0.0) + pending[book_id]
+                raise
+        # Popular and search pages follow the new order
+        cache_versions.bump(cache_versions.CATALOG)
+        logger.info(f"Flushed reader activity of {updated} books")
+        return updated
+
+    def _write(self, chunk, pending, scale):
+        mass = Coalesce(F('popularity_mass'), F('popularity_score') / Value(scale)) + Case(
+            *[When(pk=book_id, then=Value(pending[book_id])) for book_id in chunk],
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+        with transaction.atomic():
+            # update() skips auto_now and post_save; other workers sync on updated_at
+            updated = Book.objects.filter(pk__in=chunk).update(
+                popularity_mass=mass,
+                popularity_score=mass * Value(scale),
+                updated_at=Now()
+            )
+            cache_versions.bump(*(cache_versions.book_namespace(book_id) for book_id in chunk))
+        return updated
+
+    def decay(self):
+        """
+        Rescale popularity_score of every book to the present, in primary
+        key ranges; books never rescored keep their current score as their
+        starting mass. Returns the number of books updated.
+        """
+        scale = 1.0 / self.growth()
+        batch_size = self.config['decay_batch_size']
+        last_pk = Book.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        updated = 0
+        for start in range(0, last_pk, batch_size):
+            with transaction.atomic():
+                updated += Book.objects.filter(pk__gt=start, pk__lte=start + batch_size).update(
+                    popularity_mass=Coalesce(F('popularity_mass'), F('popularity_score') / Value(scale)),
+                    popularity_score=Coalesce(F('popularity_mass') * Value(scale), F('popularity_score')),
+                    updated_at=Now()
+                )
+        # Every book payload carries popularity_score
+        cache_versions.bump(cache_versions.CATALOG, cache_versions.FRAGMENTS)
+        logger.info(f"Decayed popularity of {updated} books")
+        return updated
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                # Events buffered at shutdown are written on the way out
+                atexit.register(self.flush)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='popularity-flush', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.config['flush_interval'])
+            self._wake.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Flushing popularity failed: {e}")
+            finally:
+                close_old_connections()
+
+
+# Global instance
+popularity_engine = PopularityEngine()
@@ -0,0 +1,82 @@
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_CACHE = {
+    'fresh_ttl': 60 * 60,        # serve without revalidating
+    'stale_ttl': 60 * 60 * 24,   # serve stale while refreshing in the background
+    'negative_ttl': 60,          # empty or failed responses
+    'refresh_lock_ttl': 30,
+}
+
+# Background revalidation runs off the request thread
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='provider-refresh')
+
+
+def normalize_query(query):
+    return ' '.join(str(query).lower().split())
+
+
+class ProviderResultCache:
+    """
+    Cache of raw provider search results keyed on (provider, normalized query,
+    result count), independent of the filters and sort order of the request.
+
+    Entries are served as-is while fresh, served stale while a single
+    background refresh replaces them, and empty results are cached only for
+    negative_ttl so a provider outage is not remembered for long.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_PROVIDER_CACHE, **getattr(settings, 'EXTERNAL_SEARCH_CACHE', {})}
+
+    def make_key(self, provider, query, max_results):
+        digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+        return f"provider_search:{provider}:{max_results}:{digest}"
+
+    def get_or_fetch(self, provider, query, max_results, fetch):
+        """Return cached books for the query, calling fetch() on a miss"""
+        key = self.make_key(provider, query, max_results)
+        entry = cache.get(key)
+
+        if entry is not None:
+            age = time.time() - entry['fetched_at']
+            if age >= self.config['fresh_ttl']:
+                self._refresh_in_background(key, fetch)
+            return entry['books']
+
+        return self._fetch_and_store(key, fetch)
+
+    def _fetch_and_store(self, key, fetch):
+        books = fetch()
+        timeout = self.config['stale_ttl'] if books else self.config['negative_ttl']
+        cache.set(key, {'books': books, 'fetched_at': time.time()}, timeout)
+        return books
+
+    def _refresh_in_background(self, key, fetch):
+        lock_key = f"{key}:refreshing"
+        if not cache.add(lock_key, 1, self.config['refresh_lock_ttl']):
+            return  # another request is already revalidating
+
+        def refresh():
+            try:
+                books = fetch()
+                # Keep serving the stale entry rather than replacing it with a failure
+                if books:
+                    cache.set(key, {'books': books, 'fetched_at': time.time()}, self.config['stale_ttl'])
+            except Exception as e:
+                logger.error(f"Background refresh failed for {key}: {e}")
+            finally:
+                cache.delete(lock_key)
+
+        refresh_executor.submit(refresh)
+
+
+# Global instance
+provider_result_cache = ProviderResultCache()
@@ -0,0 +1,168 @@
+import math
+import heapq
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, When, IntegerField
+from django.utils.module_loading import import_string
+
+from .models import Book, BookSearchTerm
+from .search_index import (
+    book_search_index, tokenize, SQLiteFTSIndex, SEARCH_FIELDS, FTS_TABLE
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RANKING = {
+    # Per-field boosts: title > author > genre > description
+    'field_weights': {
+        'title': 10.0,
+        'author': 6.0,
+        'genre': 3.0,
+        'description': 1.0,
+    },
+    'k1': 1.2,
+    'b': 0.75,
+    # Blend weights for the static quality signals
+    'popularity_weight': 0.02,  # popularity_score is 0-100
+    'rating_weight': 0.4,       # average_rating is 0-5
+}
+
+
+def preserve_order(queryset, ids):
+    """Restrict queryset to ids and keep them in the given order"""
+    if not ids:
+        return queryset.none()
+    ordering = Case(
+        *[When(id=book_id, then=position) for position, book_id in enumerate(ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(id__in=ids).order_by(ordering)
+
+
+class BM25Ranker:
+    """
+    Ranks full-text matches with field-weighted BM25 blended with
+    popularity_score and average_rating. Only the top `offset + limit`
+    candidates are materialized; the rest of the match set is never sorted.
+    """
+
+    def __init__(self, **options):
+        config = {**DEFAULT_RANKING, **getattr(settings, 'BOOK_SEARCH_RANKING', {}), **options}
+        self.field_weights = {**DEFAULT_RANKING['field_weights'], **config['field_weights']}
+        self.k1 = config['k1']
+        self.b = config['b']
+        self.popularity_weight = config['popularity_weight']
+        self.rating_weight = config['rating_weight']
+
+    def rank(self, queryset, query, limit=20, offset=0):
+        """Return books offset to offset + limit of queryset for query, best first"""
+        if isinstance(book_search_index.backend, SQLiteFTSIndex):
+            ids = self._top_ids_fts(queryset, query, limit, offset)
+        else:
+            ids = self._top_ids_terms(queryset, query, limit, offset)
+        return preserve_order(Book.objects.all(), ids)
+
+    def quality_score(self, popularity_score, average_rating):
+        return (
+            (popularity_score or 0) * self.popularity_weight +
+            (average_rating or 0) * self.rating_weight
+        )
+
+    def _top_ids_fts(self, queryset, query, limit, offset):
+        """Let SQLite's bm25() score the matches and keep a top-k sorter"""
+        expression = book_search_index.backend.match_expression(query)
+        if not expression:
+            return []
+
+        candidates = queryset.order_by().values('id', 'popularity_score', 'average_rating')
+        candidate_sql, candidate_params = candidates.query.sql_with_params()
+        weights = ', '.join(str(float(self.field_weights[field])) for field in SEARCH_FIELDS)
+
+        sql = f"""
+            SELECT c.id
+            FROM {FTS_TABLE}
+            JOIN ({candidate_sql}) c ON c.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY -bm25({FTS_TABLE}, {weights})
+                + c.popularity_score * %s + c.average_rating * %s DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [
+            *candidate_params, expression,
+            self.popularity_weight, self.rating_weight, limit, offset
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def corpus_stats(self):
+        """Book count and average length of each field over the whole catalog"""
+        stats = cache.get('book_search:corpus_stats')
+        if stats is None:
+            total_books = Book.objects.count()
+            stats = {
+                'total_books': total_books,
+                'average_length': {
+                    field: total / total_books
+                    for field, total in book_search_index.backend.field_totals().items()
+                    if total_books and total
+                },
+            }
+            cache.set('book_search:corpus_stats', stats, 3600)
+        return stats
+
+    def _top_ids_terms(self, queryset, query, limit, offset):
+        """BM25F over the BookSearchTerm postings of the candidate books"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        candidates = {
+            book_id: self.quality_score(popularity, rating)
+            for book_id, popularity, rating in queryset.order_by().values_list(
+                'id', 'popularity_score', 'average_rating'
+            )
+        }
+        if not candidates:
+            return []
+
+        stats = self.corpus_stats()
+        total_books = stats['total_books']
+        average_length = defaultdict(lambda: 1.0, stats['average_length'])
+
+        # (book, query term) -> field -> term frequency, plus field lengths
+        frequencies = defaultdict(lambda: defaultdict(int))
+        field_lengths = {}
+        document_frequency = {}
+        for term in terms:
+            postings = BookSearchTerm.objects.filter(term__startswith=term)
+            document_frequency[term] = postings.values('book_id').distinct().count()
+            rows = postings.filter(book_id__in=queryset.order_by().values('id')).values_list(
+                'book_id', 'field', 'frequency', 'field_length'
+            )
+            for book_id, field, frequency, field_length in rows:
+                frequencies[(book_id, term)][field] += frequency
+                field_lengths[(book_id, field)] = field_length
+
+        scores = dict(candidates)
+        for (book_id, term), fields in frequencies.items():
+            weighted_tf = 0.0
+            for field, frequency in fields.items():
+                length = field_lengths[(book_id, field)] or average_length[field]
+                norm = 1 - self.b + self.b * length / average_length[field]
+                weighted_tf += self.field_weights.get(field, 1.0) * frequency / norm
+            df = document_frequency[term]
+            idf = math.log(1 + (total_books - df + 0.5) / (df + 0.5))
+            scores[book_id] += idf * weighted_tf / (self.k1 + weighted_tf)
+
+        return heapq.nlargest(offset + limit, scores, key=scores.get)[offset:]
+
+
+def get_search_ranker():
+    """Instantiate the ranker configured by BOOK_SEARCH_RANKER"""
+    ranker_path = getattr(settings, 'BOOK_SEARCH_RANKER', 'books.ranking.BM25Ranker')
+    return import_string(ranker_path)()
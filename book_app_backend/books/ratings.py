@@ -0,0 +1,84 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Greatest, Least, Now
+
+from .models import Book, UserLibrary
+from . import cache_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATING_AGGREGATES = {
+    'reconcile_batch_size': 1000,  # books reconciled per transaction
+}
+
+
+def shifted_ratings(rating_sum, count):
+    """
+    Update kwargs adding rating_sum and count to a book's running
+    aggregates. average_rating and rating_count cover the provider's ratings
+    and ours; user_rating_sum and user_rating_count only ours. updated_at is
+    stamped by hand since update() skips auto_now and other workers sync on it.
+    """
+    total = F('average_rating') * F('rating_count') + Value(rating_sum)
+    return {
+        'user_rating_sum': F('user_rating_sum') + Value(rating_sum),
+        'user_rating_count': F('user_rating_count') + count,
+        'rating_count': F('rating_count') + count,
+        'average_rating': Case(
+            When(
+                rating_count__gt=-count,
+                then=Least(Greatest(total / (F('rating_count') + count), Value(0.0)), Value(5.0))
+            ),
+            default=Value(0.0),
+            output_field=FloatField()
+        ),
+        'updated_at': Now(),
+    }
+
+
+def record_rating(book_id, old_rating, new_rating):
+    """Fold one UserLibrary.user_rating change (None meaning unrated) into the book's aggregates"""
+    rating_sum = (new_rating or 0.0) - (old_rating or 0.0)
+    count = (new_rating is not None) - (old_rating is not None)
+    if rating_sum or count:
+        Book.objects.filter(pk=book_id).update(**shifted_ratings(rating_sum, count))
+        # update() skips post_save; listings show and sort by the rating too
+        cache_versions.bump(cache_versions.book_namespace(book_id), cache_versions.CATALOG)
+
+
+def reconcile_ratings(batch_size=None):
+    """
+    Recompute user_rating_sum and user_rating_count from UserLibrary one
+    range of book ids at a time and correct the books that drifted (writes
+    that skipped signals, failed updates); returns the number corrected.
+    """
+    config = {**DEFAULT_RATING_AGGREGATES, **getattr(settings, 'RATING_AGGREGATES', {})}
+    batch_size = batch_size or config['reconcile_batch_size']
+    last_pk = Book.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    corrected = 0
+    for start in range(0, last_pk, batch_size):
+        with transaction.atomic():
+            books = Book.objects.select_for_update().filter(pk__gt=start, pk__lte=start + batch_size)
+            exact = {
+                row['book_id']: (row['rating_sum'], row['count'])
+                for row in UserLibrary.objects.filter(
+                    book_id__gt=start, book_id__lte=start + batch_size, user_rating__isnull=False
+                ).order_by().values('book_id').annotate(rating_sum=Sum('user_rating'), count=Count('pk'))
+            }
+            stored = books.order_by().values_list('pk', 'user_rating_sum', 'user_rating_count')
+            for book_id, rating_sum, count in stored:
+                exact_sum, exact_count = exact.get(book_id, (0.0, 0))
+                if exact_count != count or abs(exact_sum - rating_sum) > 1e-6:
+                    Book.objects.filter(pk=book_id).update(
+                        **shifted_ratings(exact_sum - rating_sum, exact_count - count)
+                    )
+                    cache_versions.bump(cache_versions.book_namespace(book_id))
+                    corrected += 1
+    if corrected:
+        # Listings show and sort by the rating; one bump covers the whole run
+        cache_versions.bump(cache_versions.CATALOG)
+        logger.warning(f"Corrected drifted rating aggregates of {corrected} books")
+    return corrected
@@ -0,0 +1,182 @@
+import time
+import queue
+import atexit
+import logging
+import itertools
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .models import UserRecommendation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECOMMENDATION_PERSISTENCE = {
+    'mode': 'background',    # 'sync' writes before the response, 'background' after it
+    'batch_size': 500,       # rows upserted per statement
+    'flush_interval': 0.5,   # seconds to wait for a batch to fill up
+    'max_queue': 10000,      # beyond this backlog rows are written inline
+    'drain_timeout': 5.0,    # seconds to wait for queued rows at shutdown
+}
+
+UNIQUE_FIELDS = ['user', 'book', 'mood_energy', 'mood_genre', 'mood_depth']
+UPDATED_FIELDS = ['match_score', 'match_percentage', 'match_reasons']
+
+
+class RecommendationWriter:
+    """
+    Persists scored mood recommendations with one bulk upsert
+    (INSERT ... ON CONFLICT DO UPDATE) on the UserRecommendation
+    unique_together key, so repeated quizzes refresh the scores while the
+    dismissed/saved/viewed flags survive.
+
+    In background mode rows are queued from the request thread and a worker
+    upserts them in batches that can span several quiz submissions. A batch
+    failing on an integrity error (a book deleted after it was queued) is
+    retried one submission at a time, and a failing submission one row at
+    a time, so only the offending rows are dropped. Rows still queued at
+    interpreter exit are drained before the process goes away.
+    """
+
+    def __init__(self):
+        self.config = {
+            **DEFAULT_RECOMMENDATION_PERSISTENCE,
+            **getattr(settings, 'RECOMMENDATION_PERSISTENCE', {})
+        }
+        self._queue = queue.Queue(maxsize=self.config['max_queue'])
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._submissions = itertools.count()
+
+    def submit(self, user, mood_data, recommendations):
+        """Persist one quiz result, now or in the background depending on mode"""
+        rows = [
+            UserRecommendation(
+                user_id=user.pk,
+                book_id=rec['id'],
+                mood_energy=mood_data['energy'],
+                mood_genre=mood_data['genre'],
+                mood_depth=mood_data['depth'],
+                match_score=rec['match_score'],
+                match_percentage=rec['match_percentage'],
+                match_reasons=rec['match_reasons']
+            )
+            for rec in recommendations
+        ]
+        if not rows:
+            return
+        if self.config['mode'] != 'background':
+            self.write(rows)
+            return
+
+        self._ensure_worker()
+        submission = next(self._submissions)
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put_nowait((submission, row))
+            except queue.Full:
+                logger.warning("Recommendation write queue is full; writing inline")
+                self.write(rows[i:])
+                break
+
+    def write(self, rows):
+        """Upsert rows in one transaction; returns the number of rows written"""
+        # One statement can't update the same row twice; the latest result wins
+        unique = {
+            (row.user_id, row.book_id, row.mood_energy, row.mood_genre, row.mood_depth): row
+            for row in rows
+        }
+        with transaction.atomic():
+            UserRecommendation.objects.bulk_create(
+                unique.values(),
+                batch_size=self.config['batch_size'],
+                update_conflicts=True,
+                unique_fields=UNIQUE_FIELDS,
+                update_fields=UPDATED_FIELDS
+            )
+        return len(unique)
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                # Rows queued at shutdown are written on the way out
+                atexit.register(self.drain)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='recommendation-writer', daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.config['flush_interval']
+            while len(batch) < self.config['batch_size']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                close_old_connections()
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Persisting recommendations failed: {e}")
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def drain(self):
+        """Write every queued row, waiting for the worker's batch in flight"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if batch:
+                self._write_batch(batch)
+        except Exception as e:
+            logger.error(f"Persisting recommendations failed: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+        with self._queue.all_tasks_done:
+            if not self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, self.config['drain_timeout']
+            ):
+                logger.warning("Gave up waiting for queued recommendations at shutdown")
+
+    def _write_batch(self, batch):
+        """Upsert queued (submission, row) pairs, isolating rows that violate a constraint"""
+        try:
+            self.write([row for _, row in batch])
+            return
+        except IntegrityError as e:
+            logger.warning(f"Recommendation batch of {len(batch)} rows failed ({e}); retrying per submission")
+
+        submissions = {}
+        for submission, row in batch:
+            submissions.setdefault(submission, []).append(row)
+        for rows in submissions.values():
+            try:
+                self.write(rows)
+                continue
+            except IntegrityError:
+                pass
+            for row in rows:
+                try:
+                    self.write([row])
+                except IntegrityError as e:
+                    logger.error(
+                        f"Dropped recommendation of book {row.book_id} for user {row.user_id}: {e}"
+                    )
+
+
+# Global instance
+recommendation_writer = RecommendationWriter()
@@ -0,0 +1,175 @@
+import re
+import logging
+import unicodedata
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.expressions import RawSQL
+
+from .models import Book, BookSearchTerm
+
+logger = logging.getLogger(__name__)
+
+# Columns that make up the searchable document, in FTS column order
+SEARCH_FIELDS = ['title', 'author', 'description', 'genre']
+
+FTS_TABLE = 'books_book_fts'
+
+MAX_TERM_LENGTH = 64
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase, accent-folded search terms.
+    Mirrors the FTS5 'unicode61 remove_diacritics 2' tokenizer so both
+    backends agree on what a term is.
+    """
+    if not text:
+        return []
+    folded = unicodedata.normalize('NFKD', str(text))
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN_RE.findall(folded.lower())]
+
+
+class SQLiteFTSIndex:
+    """
+    Full-text index backed by an SQLite FTS5 external-content table.
+    The table and the triggers that keep it in sync with books_book are
+    created by migration 0003, so saves, deletes and bulk updates are all
+    indexed without any Python-side bookkeeping.
+    """
+
+    def match_expression(self, query):
+        """Build a safe FTS5 MATCH expression: every term must match (prefix)"""
+        terms = tokenize(query)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [expression]
+        ))
+
+    def index_book(self, book):
+        # Maintained by database triggers
+        pass
+
+    def remove_book(self, book_id):
+        # Maintained by database triggers
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+
+class TermTableIndex:
+    """
+    Portable inverted index stored in the BookSearchTerm table.
+    Each (term, field) pair of a book is one row; lookups go through the
+    (term, book) index instead of scanning books_book. On PostgreSQL the
+    prefix match needs the varchar_pattern_ops index of migration 0014.
+    """
+
+    def terms_for_book(self, book):
+        rows = []
+        for field in SEARCH_FIELDS:
+            tokens = tokenize(getattr(book, field, ''))
+            for term, frequency in Counter(tokens).items():
+                rows.append(BookSearchTerm(
+                    book_id=book.pk,
+                    term=term,
+                    field=field,
+                    frequency=frequency,
+                    field_length=len(tokens)
+                ))
+        return rows
+
+    def filter(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        for term in dict.fromkeys(terms):
+            queryset = queryset.filter(id__in=BookSearchTerm.objects.filter(
+                term__startswith=term
+            ).values('book_id'))
+        return queryset
+
+    def field_totals(self):
+        """Number of terms in each field across the corpus"""
+        # A field's frequencies sum to its length, so no per-book pass is needed
+        return dict(
+            BookSearchTerm.objects.order_by().values('field')
+            .annotate(total=Sum('frequency')).values_list('field', 'total')
+        )
+
+    def index_book(self, book):
+        with transaction.atomic():
+            BookSearchTerm.objects.filter(book_id=book.pk).delete()
+            BookSearchTerm.objects.bulk_create(self.terms_for_book(book))
+
+    def remove_book(self, book_id):
+        BookSearchTerm.objects.filter(book_id=book_id).delete()
+
+    def rebuild(self, batch_size=1000):
+        BookSearchTerm.objects.all().delete()
+        batch = []
+        for book in Book.objects.only(*SEARCH_FIELDS).order_by('pk').iterator(chunk_size=batch_size):
+            batch.extend(self.terms_for_book(book))
+            if len(batch) >= batch_size:
+                BookSearchTerm.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            BookSearchTerm.objects.bulk_create(batch)
+
+
+def fts5_available():
+    """Check whether the FTS5 table was created for the current database"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+class BookSearchIndex:
+    """
+    Dispatches to the FTS5 index on SQLite and to the term table elsewhere.
+    The backend is resolved lazily because the database connection is not
+    available at import time.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = SQLiteFTSIndex() if fts5_available() else TermTableIndex()
+        return self._backend
+
+    def filter(self, queryset, query):
+        """Restrict queryset to books matching every term of query"""
+        return self.backend.filter(queryset, query)
+
+    def index_book(self, book):
+        self.backend.index_book(book)
+
+    def remove_book(self, book_id):
+        self.backend.remove_book(book_id)
+
+    def rebuild(self):
+        self.backend.rebuild()
+
+
+# Global instance
+book_search_index = BookSearchIndex()
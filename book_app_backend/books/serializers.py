@@ -1,5 +1,9 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Book, BookTag, BookMood, BookGenre, UserLibrary, UserRecommendation
+from .models import (
+    Book, BookTag, BookMood, BookGenre, UserLibrary, UserRecommendation,
+    BookTagAssociation, BookMoodAssociation
+)
 
 
 class BookTagSerializer(serializers.ModelSerializer):
@@ -27,15 +31,101 @@ class BookSerializer(serializers.ModelSerializer):
             'average_rating', 'rating_count', 'popularity_score',
             'tags', 'moods', 'google_books_id', 'openlibrary_id',
             # Mood-based fields
-            'energy_level', 'reading_depth', 'reading_pace', 'theme_tags'
+            'energy_level', 'reading_depth', 'reading_pace'
         ]
 
+    # What ?view=compact returns: enough for a cover grid
+    COMPACT_FIELDS = ['id', 'title', 'author', 'cover_image_url', 'average_rating', 'year']
+
+    # Payload fields whose column differs from their name
+    FIELD_SOURCES = {'year': 'published_year'}
+
+    def __init__(self, *args, **kwargs):
+        # Restrict the payload to these fields; nested books read 'book_fields' from the context
+        self.requested_fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.requested_fields or self.context.get('book_fields')
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+    @classmethod
+    def requested_fields_from(cls, params):
+        """
+        Fields asked for with ?fields=title,author or ?view=compact.
+        Unknown names are ignored and 'id' is always included; None means
+        the full representation.
+        """
+        if params.get('fields'):
+            names = {name.strip() for name in params['fields'].split(',')}
+            fields = [name for name in cls.Meta.fields if name in names]
+        elif params.get('view') == 'compact':
+            fields = list(cls.COMPACT_FIELDS)
+        else:
+            return None
+        return fields if 'id' in fields else ['id', *fields]
+
+    @classmethod
+    def setup_sparse_loading(cls, queryset, fields, prefix=''):
+        """
+        Defer the book columns that fields doesn't need and prefetch tags
+        and moods only when they are asked for.
+        """
+        needed = {cls.FIELD_SOURCES.get(name, name) for name in fields}
+        deferred = [
+            f'{prefix}{field.attname}' for field in Book._meta.concrete_fields
+            if not field.primary_key and field.name not in needed
+        ]
+        lookups = [
+            lookup for name, lookup in zip(['tags', 'moods'], cls.eager_loading_lookups(prefix))
+            if name in fields
+        ]
+        return queryset.defer(*deferred).prefetch_related(*lookups)
+
+    @staticmethod
+    def eager_loading_lookups(prefix=''):
+        return [
+            Prefetch(
+                f'{prefix}tag_associations',
+                queryset=BookTagAssociation.objects.select_related('tag').order_by('id')
+            ),
+            Prefetch(
+                f'{prefix}mood_associations',
+                queryset=BookMoodAssociation.objects.select_related('mood').order_by('id')
+            ),
+        ]
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """
+        Prefetch tags and moods for every book in queryset in two queries.
+        Use prefix='book__' for querysets of models pointing at Book.
+        """
+        return queryset.prefetch_related(*BookSerializer.eager_loading_lookups(prefix))
+
+    def to_representation(self, instance):
+        # Nested books use payloads pre-rendered by the fragment cache when given
+        fragments = self.context.get('book_fragments')
+        if fragments and instance.pk in fragments:
+            fragment = fragments[instance.pk]
+            return {name: fragment[name] for name in self.fields}
+        return super().to_representation(instance)
+
+    def _associations(self, obj, name, related):
+        if name in getattr(obj, '_prefetched_objects_cache', {}):
+            return getattr(obj, name).all()
+        # Not prefetched: still avoid a query per association
+        return getattr(obj, name).select_related(related).all()
+
     def get_tags(self, obj):
-        tags = obj.tag_associations.select_related('tag').all()
+        tags = self._associations(obj, 'tag_associations', 'tag')
         return [tag_assoc.tag.name for tag_assoc in tags]
 
     def get_moods(self, obj):
-        moods = obj.mood_associations.select_related('mood').all()
+        moods = self._associations(obj, 'mood_associations', 'mood')
         return [mood_assoc.mood.name for mood_assoc in moods]
 
 
@@ -77,6 +167,7 @@ class BookSearchSerializer(serializers.Serializer):
         required=False
     )
     limit = serializers.IntegerField(min_value=1, max_value=100, default=20, required=False)
+    offset = serializers.IntegerField(min_value=0, default=0, required=False)
 
 
 class ExternalBookSerializer(serializers.Serializer):
@@ -97,6 +188,7 @@ class ExternalBookSerializer(serializers.Serializer):
     industry_identifiers = serializers.ListField(required=False)
     isbn = serializers.SerializerMethodField()
     google_books_id = serializers.CharField(required=False)
+    openlibrary_id = serializers.CharField(required=False)
 
     def get_author(self, obj):
         authors = obj.get('authors', [])
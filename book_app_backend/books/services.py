@@ -1,24 +1,48 @@
 import requests
 import logging
-from django.db.models import Q, F
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.db.models import F
 from django.db.models.functions import Lower
 from django.conf import settings
 from .models import Book, BookTag, BookMood, BookGenre
+from .circuit_breaker import CircuitOpenError
+from .http_client import provider_client
+from .ingestion import external_book_ingestor
+from .provider_cache import provider_result_cache
+from .genres import genre_taxonomy
+from .mood_masks import filter_by_moods
+from .search_index import book_search_index
+from .ranking import get_search_ranker
+from .suggestions import suggestion_index
 from .serializers import ExternalBookSerializer
 
 logger = logging.getLogger(__name__)
 
+# Shared pool for querying external providers concurrently
+provider_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'EXTERNAL_SEARCH_MAX_WORKERS', 8),
+    thread_name_prefix='book-provider'
+)
+
 
 class GoogleBooksService:
     """Service for interacting with Google Books API"""
     
+    name = 'google_books'
     BASE_URL = "https://www.googleapis.com/books/v1/volumes"
     
     def __init__(self):
         self.api_key = getattr(settings, 'GOOGLE_BOOKS_API_KEY', None)
     
-    def search_books(self, query, max_results=20):
+    def search_books(self, query, max_results=20, timeout=10):
         """Search books using Google Books API"""
+        return provider_result_cache.get_or_fetch(
+            self.name, query, max_results,
+            lambda: self.fetch_books(query, max_results, timeout)
+        )
+    
+    def fetch_books(self, query, max_results=20, timeout=10):
+        """Query the Google Books API, bypassing the result cache"""
         try:
             params = {
                 'q': query,
@@ -30,8 +54,7 @@ class GoogleBooksService:
             if self.api_key:
                 params['key'] = self.api_key
             
-            response = requests.get(self.BASE_URL, params=params, timeout=10)
-            response.raise_for_status()
+            response = provider_client.get(self.name, self.BASE_URL, params=params, timeout=timeout)
             
             data = response.json()
             books = []
@@ -60,6 +83,9 @@ class GoogleBooksService:
             
             return books
             
+        except CircuitOpenError:
+            logger.info("Skipping Google Books: circuit open")
+            return []
         except requests.RequestException as e:
             logger.error(f"Google Books API error: {e}")
             return []
@@ -71,10 +97,18 @@ class GoogleBooksService:
 class OpenLibraryService:
     """Service for interacting with Open Library API"""
     
+    name = 'open_library'
     SEARCH_URL = "https://openlibrary.org/search.json"
     
-    def search_books(self, query, limit=20):
+    def search_books(self, query, limit=20, timeout=10):
         """Search books using Open Library API"""
+        return provider_result_cache.get_or_fetch(
+            self.name, query, limit,
+            lambda: self.fetch_books(query, limit, timeout)
+        )
+    
+    def fetch_books(self, query, limit=20, timeout=10):
+        """Query the Open Library API, bypassing the result cache"""
         try:
             params = {
                 'q': query,
@@ -82,8 +116,7 @@ class OpenLibraryService:
                 'fields': 'key,title,author_name,first_publish_year,subject,isbn,cover_i'
             }
             
-            response = requests.get(self.SEARCH_URL, params=params, timeout=10)
-            response.raise_for_status()
+            response = provider_client.get(self.name, self.SEARCH_URL, params=params, timeout=timeout)
             
             data = response.json()
             books = []
@@ -112,6 +145,9 @@ class OpenLibraryService:
             
             return books
             
+        except CircuitOpenError:
+            logger.info("Skipping Open Library: circuit open")
+            return []
         except requests.RequestException as e:
             logger.error(f"Open Library API error: {e}")
             return []
@@ -126,37 +162,25 @@ class BookSearchService:
     def __init__(self):
         self.google_books = GoogleBooksService()
         self.open_library = OpenLibraryService()
+        self.ranker = get_search_ranker()
     
     def search_local_books(self, query, filters=None):
-        """Search books in local database"""
+        """Search books in local database; returns the page at filters' offset and limit"""
         if not query or len(query.strip()) < 2:
             return Book.objects.none()
         
         filters = filters or {}
         query = query.strip()
         
-        # Build search query
-        search_query = (
-            Q(title__icontains=query) |
-            Q(author__icontains=query) |
-            Q(description__icontains=query) |
-            Q(genre__icontains=query)
-        )
-        
-        # Apply filters
-        queryset = Book.objects.filter(search_query)
+        # Match query terms against the full-text index
+        queryset = book_search_index.filter(Book.objects.all(), query)
         
         if filters.get('genre'):
-            genre_filter = Q()
-            for genre in filters['genre']:
-                genre_filter |= Q(genre__icontains=genre)
-            queryset = queryset.filter(genre_filter)
+            genre_ids = set().union(*(genre_taxonomy.genre_ids(genre) for genre in filters['genre']))
+            queryset = queryset.filter(canonical_genre_id__in=genre_ids)
         
         if filters.get('mood'):
-            mood_filter = Q()
-            for mood in filters['mood']:
-                mood_filter |= Q(mood_associations__mood__name__icontains=mood)
-            queryset = queryset.filter(mood_filter)
+            queryset = filter_by_moods(queryset, filters['mood'])
         
         if filters.get('rating'):
             queryset = queryset.filter(average_rating__gte=filters['rating'])
@@ -167,6 +191,9 @@ class BookSearchService:
         if filters.get('year_to'):
             queryset = queryset.filter(published_year__lte=filters['year_to'])
         
+        limit = filters.get('limit', 20)
+        offset = filters.get('offset', 0)
+        
         # Apply sorting
         sort_by = filters.get('sort_by', 'relevance')
         if sort_by == 'popularity':
@@ -180,35 +207,35 @@ class BookSearchService:
         elif sort_by == 'title':
             queryset = queryset.order_by(Lower('title'))
         else:  # relevance (default)
-            # Calculate relevance score
-            queryset = queryset.extra(
-                select={
-                    'relevance_score': """
-                        CASE 
-                            WHEN LOWER(title) = LOWER(%s) THEN 100
-                            WHEN LOWER(title) LIKE LOWER(%s) THEN 80
-                            WHEN LOWER(author) LIKE LOWER(%s) THEN 60
-                            WHEN LOWER(genre) LIKE LOWER(%s) THEN 40
-                            ELSE 20
-                        END + popularity_score * 0.1 + average_rating * 2
-                    """
-                },
-                select_params=[query, f'%{query}%', f'%{query}%', f'%{query}%']
-            ).order_by('-relevance_score')
+            # Score only the top-k matches with the configured ranker
+            return self.ranker.rank(queryset, query, limit, offset)
         
-        return queryset.distinct()
+        return queryset[offset:offset + limit]
     
     def search_external_books(self, query, max_results=20):
-        """Search books from external APIs"""
-        all_books = []
+        """Search books from external APIs concurrently"""
+        providers = [self.google_books, self.open_library]
+        budgets = getattr(settings, 'EXTERNAL_SEARCH_TIMEOUTS', {})
+        deadline = getattr(settings, 'EXTERNAL_SEARCH_DEADLINE', 5.0)
         
-        # Search Google Books
-        google_books = self.google_books.search_books(query, max_results // 2)
-        all_books.extend(google_books)
+        futures = {
+            provider: provider_executor.submit(
+                provider.search_books,
+                query,
+                max_results // 2,
+                timeout=budgets.get(provider.name, deadline)
+            )
+            for provider in providers
+        }
+        done, _ = wait(futures.values(), timeout=deadline)
         
-        # Search Open Library
-        open_library_books = self.open_library.search_books(query, max_results // 2)
-        all_books.extend(open_library_books)
+        # Keep provider order so Google Books wins ties in deduplication
+        all_books = []
+        for provider, future in futures.items():
+            if future in done:
+                all_books.extend(future.result())
+            else:
+                logger.warning(f"{provider.name} missed the {deadline}s search deadline")
         
         # Remove duplicates based on title and author
         seen = set()
@@ -220,6 +247,9 @@ class BookSearchService:
                 seen.add(key)
                 unique_books.append(book)
         
+        # Write the hits back to the local catalog in the background
+        external_book_ingestor.submit(unique_books)
+        
         return unique_books[:max_results]
     
     def combined_search(self, query, filters=None, include_external=True):
@@ -237,8 +267,10 @@ class BookSearchService:
         results['local_books'] = local_books[:limit]
         results['total_count'] = len(results['local_books'])
         
-        # Search external books if we have room and it's enabled
-        if include_external and results['total_count'] < limit:
+        # Search external books if the first page has room and it's enabled;
+        # later pages would only repeat them
+        offset = filters.get('offset', 0) if filters else 0
+        if include_external and not offset and results['total_count'] < limit:
             remaining_slots = limit - results['total_count']
             external_books = self.search_external_books(query, remaining_slots)
             results['external_books'] = external_books
@@ -251,29 +283,8 @@ class BookSearchService:
         if not query or len(query.strip()) < 2:
             return []
         
-        query = query.strip()
-        suggestions = []
-        
-        # Title suggestions
-        title_suggestions = Book.objects.filter(
-            title__icontains=query
-        ).values_list('title', flat=True)[:3]
-        suggestions.extend(title_suggestions)
-        
-        # Author suggestions
-        author_suggestions = Book.objects.filter(
-            author__icontains=query
-        ).values_list('author', flat=True).distinct()[:3]
-        suggestions.extend(author_suggestions)
-        
-        # Genre suggestions
-        genre_suggestions = BookGenre.objects.filter(
-            name__icontains=query
-        ).values_list('name', flat=True)[:2]
-        suggestions.extend(genre_suggestions)
-        
-        # Remove duplicates and limit
-        return list(dict.fromkeys(suggestions))[:8]
+        # Served from the in-memory completion index
+        return suggestion_index.suggest(query.strip(), limit=8)
 
 
 # Global instance
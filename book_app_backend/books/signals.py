@@ -0,0 +1,223 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.db.models.functions import Now
+from django.dispatch import receiver
+
+from .models import (
+    Book, BookGenre, BookMood, BookTag, BookTagAssociation,
+    BookMoodAssociation, UserLibrary, UserRecommendation
+)
+from . import cache_versions
+from .genres import genre_taxonomy
+from .mood_masks import claim_mood_bit, refresh_mood_mask
+from .mood_scoring import mood_scorer
+from .popularity import popularity_engine
+from .ratings import record_rating
+from .search_index import book_search_index
+from .similarity import book_similarity_index
+from .suggestions import suggestion_index
+from .tag_index import tag_index
+
+# Cache namespaces invalidated by writes to each model
+INVALIDATES = {
+    Book: [cache_versions.CATALOG, cache_versions.GENRES],
+    BookTag: [cache_versions.CATALOG],
+    BookMood: [cache_versions.CATALOG, cache_versions.MOODS],
+    BookGenre: [cache_versions.GENRES],
+    BookTagAssociation: [cache_versions.CATALOG],
+    BookMoodAssociation: [cache_versions.CATALOG],
+}
+
+# Fields whose previous value post_save receivers compare against
+TRACKED_FIELDS = {
+    UserLibrary: ['status', 'book_id', 'user_rating'],
+    UserRecommendation: ['saved'],
+}
+
+
+@receiver(pre_save, sender=Book)
+def map_canonical_genre(sender, instance, raw=False, update_fields=None, **kwargs):
+    """canonical_genre is derived from the free-text genre"""
+    if not raw and (update_fields is None or 'genre' in update_fields):
+        instance.canonical_genre_id = genre_taxonomy.resolve(instance.genre)
+
+
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, **kwargs):
+    """Keep the full-text index in sync with the saved book"""
+    # Deletes cascade to BookSearchTerm (or fire the FTS5 trigger)
+    book_search_index.index_book(instance)
+    suggestion_index.update_book(instance)
+    mood_scorer.update_book(instance)
+    tag_index.update_book(instance)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book_on_delete(sender, instance, **kwargs):
+    suggestion_index.remove_book(instance.pk)
+    mood_scorer.remove_book(instance.pk)
+    tag_index.remove_book(instance.pk)
+    book_similarity_index.forget(instance.pk)
+
+
+@receiver(post_save, sender=BookTagAssociation)
+@receiver(post_delete, sender=BookTagAssociation)
+def reindex_book_tags(sender, instance, **kwargs):
+    """Tags are completion entries of their book"""
+    book = Book.objects.filter(pk=instance.book_id).first()
+    if book is None:
+        suggestion_index.remove_book(instance.book_id)
+    else:
+        suggestion_index.update_book(book)
+
+
+@receiver(post_save, sender=BookTagAssociation)
+@receiver(post_delete, sender=BookTagAssociation)
+def touch_tagged_book(sender, instance, **kwargs):
+    """Tags feed the similarity vectors, which are refreshed by updated_at"""
+    # Mood associations stamp it through refresh_mood_mask
+    Book.objects.filter(pk=instance.book_id).update(updated_at=Now())
+
+
+@receiver(post_save, sender=BookTagAssociation)
+def index_tag_association(sender, instance, **kwargs):
+    tag_index.add_tag(instance.book_id, instance.tag_id)
+
+
+@receiver(post_delete, sender=BookTagAssociation)
+def unindex_tag_association(sender, instance, **kwargs):
+    tag_index.remove_tag(instance.book_id, instance.tag_id)
+
+
+@receiver(post_save, sender=BookTag)
+def index_tag_name(sender, instance, **kwargs):
+    tag_index.rename_tag(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=BookTag)
+def unindex_tag(sender, instance, **kwargs):
+    tag_index.drop_tag(instance.pk)
+
+
+@receiver(post_save, sender=BookMood)
+def assign_mood_bit(sender, instance, raw=False, **kwargs):
+    # After the insert, so a lost race retries the bit rather than failing the save
+    if not raw and instance.bit is None:
+        claim_mood_bit(instance)
+
+
+@receiver(post_save, sender=BookMoodAssociation)
+@receiver(post_delete, sender=BookMoodAssociation)
+def update_book_mood_mask(sender, instance, **kwargs):
+    """Book.mood_mask mirrors the book's mood associations"""
+    refresh_mood_mask(instance.book_id)
+
+
+@receiver(pre_save, sender=UserLibrary)
+@receiver(pre_save, sender=UserRecommendation)
+def remember_previous_values(sender, instance, raw=False, **kwargs):
+    """Stash the stored values of TRACKED_FIELDS as instance._previous (None for new rows)"""
+    instance._previous = None
+    if not raw and instance.pk is not None:
+        instance._previous = sender.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS[sender]).first()
+
+
+@receiver(post_save, sender=UserLibrary)
+def record_library_activity(sender, instance, created, raw=False, **kwargs):
+    """Shelving a book and moving it to a new status count towards its popularity"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    events = ['added'] if created else []
+    if previous is None or previous['status'] != instance.status:
+        events.append(instance.status)
+    popularity_engine.record(instance.book_id, *events)
+
+
+@receiver(post_save, sender=UserLibrary)
+def update_rating_aggregates(sender, instance, raw=False, **kwargs):
+    """Book rating aggregates follow each user_rating write in O(1)"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and previous['book_id'] != instance.book_id:
+        record_rating(previous['book_id'], previous['user_rating'], None)
+        previous = None
+    record_rating(instance.book_id, previous['user_rating'] if previous else None, instance.user_rating)
+
+
+@receiver(post_delete, sender=UserLibrary)
+def remove_rating_from_aggregates(sender, instance, **kwargs):
+    record_rating(instance.book_id, instance.user_rating, None)
+
+
+@receiver(post_save, sender=UserRecommendation)
+def record_saved_recommendation(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if not raw and instance.saved and not (previous and previous['saved']):
+        popularity_engine.record(instance.book_id, 'saved')
+
+
+@receiver(post_save, sender=BookGenre)
+def index_genre_on_save(sender, instance, **kwargs):
+    suggestion_index.add_genre(instance.name)
+    transaction.on_commit(genre_taxonomy.invalidate)
+
+
+@receiver(post_delete, sender=BookGenre)
+def unindex_genre_on_delete(sender, instance, **kwargs):
+    suggestion_index.remove_genre(instance.name)
+    transaction.on_commit(genre_taxonomy.invalidate)
+
+
+@receiver(post_migrate)
+def retire_cache_after_migrations(sender, plan=None, **kwargs):
+    """
+    Data migrations write through historical models, which send no signals;
+    once any books migration has run, drop every cached book payload and page
+    """
+    if sender.name == 'books' and any(migration.app_label == 'books' for migration, _ in plan or ()):
+        cache_versions.bump(cache_versions.CATALOG, cache_versions.GENRES, cache_versions.MOODS, cache_versions.FRAGMENTS)
+
+
+def bump_cache_generations(sender, instance, **kwargs):
+    """Invalidate the cached responses that depend on the changed model"""
+    cache_versions.bump(*INVALIDATES[sender])
+
+
+def bump_exclusions_generation(sender, instance, **kwargs):
+    """Shelved, saved and dismissed books drop out of the user's recommendations"""
+    cache_versions.bump(cache_versions.exclusions_namespace(instance.user_id))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def retire_book_fragment(sender, instance, **kwargs):
+    """The pre-rendered payload of a book goes stale with the row"""
+    cache_versions.bump(cache_versions.book_namespace(instance.pk))
+
+
+@receiver(post_save, sender=BookTagAssociation)
+@receiver(post_delete, sender=BookTagAssociation)
+@receiver(post_save, sender=BookMoodAssociation)
+@receiver(post_delete, sender=BookMoodAssociation)
+def retire_associated_book_fragment(sender, instance, **kwargs):
+    cache_versions.bump(cache_versions.book_namespace(instance.book_id))
+
+
+@receiver(post_save, sender=BookTag)
+@receiver(post_delete, sender=BookTag)
+@receiver(post_save, sender=BookMood)
+@receiver(post_delete, sender=BookMood)
+def retire_all_book_fragments(sender, instance, **kwargs):
+    """Tag and mood names appear in the payload of every book using them"""
+    cache_versions.bump(cache_versions.FRAGMENTS)
+
+
+for model in INVALIDATES:
+    post_save.connect(bump_cache_generations, sender=model, dispatch_uid=f'bump_cache_{model.__name__}_save')
+    post_delete.connect(bump_cache_generations, sender=model, dispatch_uid=f'bump_cache_{model.__name__}_delete')
+
+for model in [UserLibrary, UserRecommendation]:
+    post_save.connect(bump_exclusions_generation, sender=model, dispatch_uid=f'bump_exclusions_{model.__name__}_save')
+    post_delete.connect(bump_exclusions_generation, sender=model, dispatch_uid=f'bump_exclusions_{model.__name__}_delete')
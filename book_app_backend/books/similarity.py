@@ -0,0 +1,435 @@
+import os
+import math
+import time
+import zlib
+import fcntl
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from .models import Book, BookMoodAssociation, BookTagAssociation
+from .search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BOOK_SIMILARITY = {
+    'path': Path(settings.BASE_DIR) / 'similarity_index',
+    'dimensions': 256,        # hashed feature space
+    'batch_size': 5000,       # books featurized per query batch
+    'max_lists': 4096,        # IVF lists; sqrt(catalog size) below this
+    'nprobe': 8,              # lists scanned per query
+    'kmeans_sample': 50000,   # vectors the coarse quantizer is trained on
+    'kmeans_iterations': 15,
+    'max_delta_ratio': 0.1,   # incremental rows, relative to the base, before a full rebuild
+    'sync_overlap': 5,        # seconds re-read on each incremental update
+}
+
+# Per-source feature weights
+FEATURE_WEIGHTS = {
+    'description': 1.0,
+    'genre': 3.0,
+    'genre_word': 1.0,
+    'tag': 2.0,
+    'mood': 2.0,
+}
+
+# Description words that carry no content
+STOP_WORDS = frozenset(
+    'about after all also and are been before being but can could for from had has have her '
+    'him his how into its just more most not one only other our out over she should some '
+    'than that the their them then there these they this those through very was were what '
+    'when where which while who will with would you your'.split()
+)
+
+
+def book_features(description, genre, tags, moods):
+    """Weighted features of one book, keyed by '<source>:<value>'"""
+    features = Counter()
+    words = Counter(
+        token for token in tokenize(description)
+        if len(token) > 2 and token not in STOP_WORDS and not token.isdigit()
+    )
+    for word, count in words.items():
+        # Sublinear term frequency, so long descriptions don't drown the rest
+        features[f'description:{word}'] += FEATURE_WEIGHTS['description'] * (1 + math.log(count))
+    genre_words = tokenize(genre)
+    if genre_words:
+        features[f"genre:{' '.join(genre_words)}"] += FEATURE_WEIGHTS['genre']
+        for word in genre_words:
+            features[f'genre_word:{word}'] += FEATURE_WEIGHTS['genre_word']
+    for source, names in (('tag', tags), ('mood', moods)):
+        for name in names:
+            name = ' '.join(tokenize(name))
+            if name:
+                features[f'{source}:{name}'] += FEATURE_WEIGHTS[source]
+    return features
+
+
+def hash_features(features, dimensions):
+    """Signed feature hashing into a unit-length float32 vector"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in features.items():
+        digest = zlib.crc32(feature.encode('utf-8'))
+        vector[digest % dimensions] += weight if digest & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class BookSimilarityIndex:
+    """
+    Content-based nearest-neighbour index over hashed book features.
+
+    Vectors live in an append-only float32 file that readers memory-map, so
+    a query only pages in what it scans. Full builds featurize the catalog
+    in batches, train a spherical k-means coarse quantizer and write the
+    vectors grouped by IVF list, making each probed list one contiguous
+    slice. Incremental updates append the vectors of changed books after
+    the base region and mark their old rows dead; queries scan that small
+    delta region in full. Deleted books are appended to a tombstones file by
+    a signal and marked dead on the next update. meta.npz describes the
+    current file and is replaced atomically, and readers reload it when it
+    changes. Builds and updates hold an exclusive flock on build.lock, so
+    writers in different processes never interleave.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_BOOK_SIMILARITY, **getattr(settings, 'BOOK_SIMILARITY', {})}
+        self._lock = threading.Lock()
+        self._state = None
+        self._meta_mtime = None
+        self._checked_at = 0
+
+    @property
+    def path(self):
+        return Path(self.config['path'])
+
+    @property
+    def meta_path(self):
+        return self.path / 'meta.npz'
+
+    @property
+    def tombstones_path(self):
+        return self.path / 'tombstones'
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the writer lock; closing the file releases it"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / 'build.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    # Featurization
+
+    def _vectors(self, rows):
+        """(book ids, vectors) for (id, description, genre) rows"""
+        book_ids = [row[0] for row in rows]
+        tags, moods = {}, {}
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            for book_id, name in BookTagAssociation.objects.filter(book_id__in=chunk).values_list('book_id', 'tag__name'):
+                tags.setdefault(book_id, []).append(name)
+            for book_id, name in BookMoodAssociation.objects.filter(book_id__in=chunk).values_list('book_id', 'mood__name'):
+                moods.setdefault(book_id, []).append(name)
+
+        dimensions = self.config['dimensions']
+        vectors = np.zeros((len(rows), dimensions), dtype=np.float32)
+        for i, (book_id, description, genre) in enumerate(rows):
+            features = book_features(description, genre, tags.get(book_id, []), moods.get(book_id, []))
+            vectors[i] = hash_features(features, dimensions)
+        return np.array(book_ids, dtype=np.int64), vectors
+
+    def _book_rows(self, queryset):
+        return queryset.values_list('id', 'description', 'genre')
+
+    # Reading
+
+    def _current(self):
+        now = time.monotonic()
+        if self._state is not None and now - self._checked_at < 1.0:
+            return self._state
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._state = None
+            return None
+        with self._lock:
+            self._checked_at = now
+            if mtime != self._meta_mtime:
+                self._state = self._load()
+                self._meta_mtime = mtime
+        return self._state
+
+    def _read_meta(self):
+        with np.load(self.meta_path) as meta:
+            return {name: meta[name] for name in meta.files}
+
+    def _load(self):
+        state = self._read_meta()
+        state['vectors'] = np.memmap(
+            self.path / str(state['vectors_file']), dtype=np.float32, mode='r',
+            shape=(len(state['ids']), int(state['dimensions']))
+        )
+        live_rows = np.flatnonzero(~state['dead'])
+        order = np.argsort(state['ids'][live_rows], kind='stable')
+        state['lookup_ids'] = state['ids'][live_rows][order]
+        state['lookup_rows'] = live_rows[order]
+        return state
+
+    def _row(self, state, book_id):
+        i = np.searchsorted(state['lookup_ids'], book_id)
+        if i < len(state['lookup_ids']) and state['lookup_ids'][i] == book_id:
+            return int(state['lookup_rows'][i])
+        return None
+
+    def similar(self, book_id, limit=10):
+        """[(book id, cosine similarity)] of the books most like book_id"""
+        state = self._current()
+        if state is None:
+            logger.warning("Book similarity index has not been built")
+            return []
+
+        row = self._row(state, book_id)
+        if row is not None:
+            query = np.asarray(state['vectors'][row])
+        else:
+            # Added since the last build: featurize it on the fly
+            rows = list(self._book_rows(Book.objects.filter(pk=book_id)))
+            if not rows:
+                return []
+            query = self._vectors(rows)[1][0]
+        if not query.any():
+            return []
+
+        # Probe the lists whose centroids are closest to the query
+        centroid_scores = state['centroids'] @ query
+        nprobe = min(self.config['nprobe'], len(centroid_scores))
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        offsets = state['list_offsets']
+        blocks = [(int(offsets[i]), int(offsets[i + 1])) for i in probed]
+        blocks.append((int(state['base_rows']), len(state['ids'])))
+
+        rows, scores = [], []
+        for start, end in blocks:
+            if end > start:
+                rows.append(np.arange(start, end))
+                scores.append(state['vectors'][start:end] @ query)
+        if not rows:
+            return []
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        keep = ~state['dead'][rows] & (state['ids'][rows] != book_id)
+        rows, scores = rows[keep], scores[keep]
+
+        k = min(limit, len(rows))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(state['ids'][rows[i]]), float(scores[i])) for i in top]
+
+    # Deletes
+
+    def forget(self, book_id):
+        """Drop a deleted book from this process's results now and from the index on the next update"""
+        if not self.meta_path.exists():
+            return
+        # One short O_APPEND write per id, so concurrent workers don't interleave
+        with open(self.tombstones_path, 'a') as tombstones:
+            tombstones.write(f'{book_id}\n')
+        state = self._state
+        if state is not None:
+            rows = np.flatnonzero(state['ids'] == book_id)
+            state['dead'][rows] = True
+
+    def _take_tombstones(self):
+        """
+        (book ids, files) of the deletes recorded so far; the files are
+        removed once the index no longer needs them, and deletes recorded
+        meanwhile go to a fresh tombstones file
+        """
+        try:
+            os.replace(self.tombstones_path, self.path / f'tombstones-{time.time_ns()}.taken')
+        except FileNotFoundError:
+            pass
+        files = sorted(self.path.glob('tombstones-*.taken'))
+        book_ids = [int(line) for path in files for line in path.read_text().split()]
+        return np.array(book_ids, dtype=np.int64), files
+
+    # Building
+
+    def build(self):
+        """Featurize every book and write a fresh index; returns the number of books"""
+        with self._exclusive():
+            return self._build()
+
+    def update(self):
+        """
+        Re-featurize books changed since the last build or update and append
+        them to the index; falls back to a full build when there is no index
+        or the appended region outgrows max_delta_ratio. Returns the number
+        of books written.
+        """
+        with self._exclusive():
+            return self._update()
+
+    def _build(self):
+        started = time.monotonic()
+        synced_at = time.time()
+        # Books deleted from here on are recorded for the next update
+        _, tombstone_files = self._take_tombstones()
+        stamp = time.time_ns()
+        dimensions = self.config['dimensions']
+
+        # Pass 1: featurize in primary-key batches, in catalog order
+        unsorted_path = self.path / f'vectors-{stamp}.unsorted'
+        id_chunks = []
+        last_pk = 0
+        with open(unsorted_path, 'wb') as unsorted:
+            while True:
+                rows = list(self._book_rows(
+                    Book.objects.filter(pk__gt=last_pk).order_by('pk')
+                )[:self.config['batch_size']])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                book_ids, vectors = self._vectors(rows)
+                id_chunks.append(book_ids)
+                unsorted.write(vectors.tobytes())
+
+        ids = np.concatenate(id_chunks) if id_chunks else np.zeros(0, dtype=np.int64)
+        count = len(ids)
+        try:
+            vectors = np.memmap(unsorted_path, dtype=np.float32, mode='r', shape=(count, dimensions)) if count else np.zeros((0, dimensions), dtype=np.float32)
+
+            # Pass 2: coarse quantizer and list assignment
+            nlist = max(1, min(self.config['max_lists'], int(math.sqrt(count))))
+            centroids = self._train_centroids(vectors, nlist)
+            assignments = self._assign(vectors, centroids)
+            order = np.argsort(assignments, kind='stable')
+            list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist))))
+
+            # Pass 3: write the vectors grouped by list
+            vectors_file = f'vectors-{stamp}.f32'
+            with open(self.path / vectors_file, 'wb') as out:
+                for start in range(0, count, self.config['batch_size']):
+                    out.write(np.asarray(vectors[order[start:start + self.config['batch_size']]]).tobytes())
+        finally:
+            del vectors
+            unsorted_path.unlink(missing_ok=True)
+
+        self._write_meta(
+            vectors_file=vectors_file,
+            dimensions=dimensions,
+            ids=ids[order],
+            dead=np.zeros(count, dtype=bool),
+            centroids=centroids,
+            list_offsets=list_offsets,
+            base_rows=count,
+            synced_at=synced_at,
+        )
+        self._remove_stale_files(vectors_file)
+        for path in tombstone_files:
+            path.unlink(missing_ok=True)
+        logger.info(
+            f"Built book similarity index of {count} books in {nlist} lists "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return count
+
+    def _update(self):
+        if not self.meta_path.exists():
+            return self._build()
+        meta = self._read_meta()
+        synced_at = time.time()
+        since = datetime.fromtimestamp(float(meta['synced_at']), tz=dt_timezone.utc)
+        since -= timedelta(seconds=self.config['sync_overlap'])
+
+        deleted, tombstone_files = self._take_tombstones()
+        # Association signals stamp Book.updated_at; bulk-created associations don't
+        changed = set(Book.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+        for model in (BookTagAssociation, BookMoodAssociation):
+            changed.update(model.objects.filter(created_at__gte=since).values_list('book_id', flat=True))
+        changed = sorted(changed)
+
+        ids, dead = meta['ids'], meta['dead'].copy()
+        if len(ids) + len(changed) - int(meta['base_rows']) > self.config['max_delta_ratio'] * max(1, int(meta['base_rows'])):
+            return self._build()
+
+        new_ids = []
+        with open(self.path / str(meta['vectors_file']), 'ab') as out:
+            for start in range(0, len(changed), self.config['batch_size']):
+                rows = list(self._book_rows(
+                    Book.objects.filter(pk__in=changed[start:start + self.config['batch_size']]).order_by('pk')
+                ))
+                book_ids, vectors = self._vectors(rows)
+                out.write(vectors.tobytes())
+                new_ids.append(book_ids)
+
+        new_ids = np.concatenate(new_ids) if new_ids else np.zeros(0, dtype=np.int64)
+        # Earlier rows of changed books, base or appended, are superseded;
+        # rows of deleted books go with nothing to replace them
+        dead |= np.isin(ids, new_ids) | np.isin(ids, deleted)
+        meta.update(
+            ids=np.concatenate((ids, new_ids)),
+            dead=np.concatenate((dead, np.zeros(len(new_ids), dtype=bool))),
+            synced_at=synced_at,
+        )
+        self._write_meta(**meta)
+        for path in tombstone_files:
+            path.unlink(missing_ok=True)
+        logger.info(
+            f"Appended {len(new_ids)} changed books to the book similarity index "
+            f"and dropped {len(deleted)} deleted ones"
+        )
+        return len(new_ids)
+
+    def _train_centroids(self, vectors, nlist):
+        """Spherical k-means on a sample of the vectors"""
+        count, dimensions = vectors.shape
+        if count == 0:
+            return np.zeros((1, dimensions), dtype=np.float32)
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, size=min(count, self.config['kmeans_sample']), replace=False))
+        sample = np.asarray(vectors[sample_rows])
+        centroids = sample[rng.choice(len(sample), size=min(nlist, len(sample)), replace=False)].copy()
+
+        for _ in range(self.config['kmeans_iterations']):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=len(centroids))
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)))[filled]
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty lists keep their previous centroid
+            centroids[filled] = sums / np.where(norms == 0, 1, norms)
+        return centroids.astype(np.float32)
+
+    def _assign(self, vectors, centroids):
+        assignments = np.zeros(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), self.config['batch_size']):
+            block = np.asarray(vectors[start:start + self.config['batch_size']])
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def _write_meta(self, **arrays):
+        temporary = self.path / 'meta.tmp.npz'
+        with open(temporary, 'wb') as out:
+            np.savez(out, **arrays)
+        os.replace(temporary, self.meta_path)
+
+    def _remove_stale_files(self, current):
+        # Readers that still map an old file keep it alive until they reload
+        for stale in self.path.glob('vectors-*.f32'):
+            if stale.name != current:
+                stale.unlink(missing_ok=True)
+
+
+# Global instance
+book_similarity_index = BookSimilarityIndex()
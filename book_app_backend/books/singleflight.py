@@ -0,0 +1,103 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SINGLE_FLIGHT = {
+    'lock_ttl': 30,          # upper bound on a leader's computation
+    'result_ttl': 10,        # how long the shared result stays for waiters
+    'wait_timeout': 15,      # waiters give up and compute themselves after this
+    'poll_interval': 0.05,
+}
+
+
+def canonical_key(prefix, params):
+    """Stable digest of a dict of parameters, identical in every process"""
+    payload = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return f"{prefix}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent computations of the same key.
+
+    Within a process, the first caller computes and later callers block on
+    an Event. Across processes, the computing worker holds a cache.add lock
+    and publishes its result under the key; workers that lose the lock poll
+    for that result instead of repeating the work.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_SINGLE_FLIGHT, **getattr(settings, 'SEARCH_SINGLE_FLIGHT', {})}
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.config['wait_timeout']):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            return compute()
+
+        try:
+            call.result = self._do_shared(key, compute)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_shared(self, key, compute):
+        lock_key = f"singleflight:{key}:lock"
+        result_key = f"singleflight:{key}:result"
+
+        if cache.add(lock_key, 1, self.config['lock_ttl']):
+            try:
+                result = compute()
+                cache.set(result_key, result, self.config['result_ttl'])
+                return result
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.monotonic() + self.config['wait_timeout']
+        while time.monotonic() < deadline:
+            result = cache.get(result_key)
+            if result is not None:
+                return result
+            if cache.get(lock_key) is None:
+                # The leader finished without publishing (it failed)
+                break
+            time.sleep(self.config['poll_interval'])
+
+        result = cache.get(result_key)
+        if result is not None:
+            return result
+        logger.info(f"Single-flight wait for {key} ended without a result; computing locally")
+        return compute()
+
+
+# Global instance
+search_single_flight = SingleFlight()
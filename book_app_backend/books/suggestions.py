@@ -0,0 +1,273 @@
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Book, BookGenre, BookTagAssociation
+from .search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Completions kept at every trie node
+TOP_K = 10
+
+# Contribution key for BookGenre rows, which are not tied to a book
+GENRE_SOURCE = 'genre'
+
+
+class _Node:
+    __slots__ = ('children', 'top', 'entries', 'dirty')
+
+    def __init__(self):
+        self.children = {}
+        self.top = {}         # text -> weight, best TOP_K in this subtree
+        self.entries = set()  # texts whose key ends at this node
+        self.dirty = False
+
+
+class SuggestionIndex:
+    """
+    Prefix completion trie over book titles, authors, genres and tags.
+
+    Every word position of an entry is inserted as a key, so "pott" completes
+    "Harry Potter". Each node caches the TOP_K completions of its subtree by
+    popularity_score, making a lookup a walk down the query prefix. Entries are
+    added and removed incrementally from model signals; removals only mark the
+    affected nodes dirty and their top-k is rebuilt from the children on the
+    next lookup.
+
+    Once refresh_interval has passed, one background thread rebuilds the trie
+    while lookups keep using the old one; edits made meanwhile are replayed
+    onto the new trie before it is swapped in.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()  # held by the one build in progress
+        self._root = None
+        self._built_at = 0
+        self._contributions = {}  # text -> {source: weight}
+        self._book_texts = {}     # book id -> set of texts
+        self._replay = None       # edits to reapply to the trie being built
+
+    @property
+    def refresh_interval(self):
+        # Other workers' edits only reach this process on a periodic rebuild
+        return getattr(settings, 'SEARCH_SUGGESTIONS_REFRESH_INTERVAL', 600)
+
+    def is_built(self):
+        return self._root is not None
+
+    def build(self):
+        """Load every entry from the database into a fresh trie and swap it in"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        started = time.monotonic()
+        with self._lock:
+            self._replay = []
+        try:
+            fresh = SuggestionIndex()
+            fresh._root = _Node()
+
+            tags_by_book = {}
+            for book_id, tag_name in BookTagAssociation.objects.values_list('book_id', 'tag__name').iterator():
+                tags_by_book.setdefault(book_id, []).append(tag_name)
+
+            books = Book.objects.values_list('id', 'title', 'author', 'genre', 'popularity_score')
+            for book_id, title, author, genre, popularity in books.iterator():
+                texts = [title, author, genre, *tags_by_book.get(book_id, [])]
+                fresh._add_book(book_id, texts, popularity)
+
+            for name in BookGenre.objects.values_list('name', flat=True):
+                fresh._contribute(name, GENRE_SOURCE, 0.0)
+
+            with self._lock:
+                for edit in self._replay:
+                    edit(fresh)
+                self._root = fresh._root
+                self._contributions = fresh._contributions
+                self._book_texts = fresh._book_texts
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._replay = None
+
+        logger.info(
+            f"Built suggestion index with {len(self._contributions)} entries "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+
+    def _refresh(self):
+        if not self.is_built():
+            # Nothing to serve yet: concurrent first lookups wait for one build
+            with self._build_lock:
+                if not self.is_built():
+                    self._build()
+        elif time.monotonic() - self._built_at > self.refresh_interval and self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._build_in_background, name='suggestion-index-build', daemon=True).start()
+
+    def _build_in_background(self):
+        try:
+            close_old_connections()
+            self._build()
+        except Exception as e:
+            logger.error(f"Rebuilding the suggestion index failed: {e}")
+        finally:
+            self._build_lock.release()
+            close_old_connections()
+
+    def suggest(self, query, limit=8):
+        """Return up to limit completions for query, most popular first"""
+        key = ' '.join(tokenize(query))
+        if not key:
+            return []
+
+        self._refresh()
+
+        with self._lock:
+            node = self._root
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            top = self._top(node)
+            ranked = sorted(top.items(), key=lambda item: (-item[1], item[0]))
+
+        # Tags and genres often repeat with different casing
+        suggestions = {}
+        for text, _ in ranked:
+            suggestions.setdefault(text.lower(), text)
+        return list(suggestions.values())[:limit]
+
+    # Incremental maintenance
+
+    def _edit(self, edit):
+        """Apply edit(index) to the live trie and to the one being built, if any"""
+        with self._lock:
+            if self.is_built():
+                edit(self)
+            if self._replay is not None:
+                self._replay.append(edit)
+
+    def _tracking(self):
+        return self.is_built() or self._replay is not None
+
+    def update_book(self, book, tag_names=None):
+        """Replace the entries contributed by book"""
+        if not self._tracking():
+            return
+        if tag_names is None:
+            tag_names = list(book.tag_associations.values_list('tag__name', flat=True))
+        book_id, popularity = book.pk, book.popularity_score
+        texts = [book.title, book.author, book.genre, *tag_names]
+
+        def replace(index):
+            index._remove_book(book_id)
+            index._add_book(book_id, texts, popularity)
+        self._edit(replace)
+
+    def remove_book(self, book_id):
+        if self._tracking():
+            self._edit(lambda index: index._remove_book(book_id))
+
+    def add_genre(self, name):
+        if self._tracking():
+            self._edit(lambda index: index._contribute(name, GENRE_SOURCE, 0.0))
+
+    def remove_genre(self, name):
+        if self._tracking():
+            self._edit(lambda index: index._withdraw(name, GENRE_SOURCE))
+
+    # Internals (callers hold the lock)
+
+    def _add_book(self, book_id, texts, popularity):
+        texts = {text.strip() for text in texts if text and text.strip()}
+        self._book_texts[book_id] = texts
+        for text in texts:
+            self._contribute(text, book_id, popularity or 0.0)
+
+    def _remove_book(self, book_id):
+        for text in self._book_texts.pop(book_id, ()):
+            self._withdraw(text, book_id)
+
+    def _contribute(self, text, source, weight):
+        sources = self._contributions.setdefault(text, {})
+        previous = max(sources.values()) if sources else None
+        sources[source] = weight
+        current = max(sources.values())
+        if previous is None or current > previous:
+            self._insert(text, current)
+        elif current < previous:
+            self._delete(text)
+            self._insert(text, current)
+
+    def _withdraw(self, text, source):
+        sources = self._contributions.get(text)
+        if not sources or source not in sources:
+            return
+        previous = max(sources.values())
+        del sources[source]
+        if not sources:
+            del self._contributions[text]
+            self._delete(text)
+        elif max(sources.values()) < previous:
+            self._delete(text)
+            self._insert(text, max(sources.values()))
+
+    def _keys(self, text):
+        tokens = tokenize(text)
+        return {' '.join(tokens[position:]) for position in range(len(tokens))}
+
+    def _insert(self, text, weight):
+        for key in self._keys(text):
+            node = self._root
+            self._offer(node, text, weight)
+            for char in key:
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, text, weight)
+            node.entries.add(text)
+
+    def _delete(self, text):
+        for key in self._keys(text):
+            node = self._root
+            path = [node]
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                node.entries.discard(text)
+            for visited in path:
+                if visited.top.pop(text, None) is not None:
+                    visited.dirty = True
+
+    def _offer(self, node, text, weight):
+        if node.dirty:
+            # Recomputed from scratch on the next lookup
+            return
+        node.top[text] = weight
+        if len(node.top) > TOP_K:
+            weakest = min(node.top, key=node.top.get)
+            del node.top[weakest]
+
+    def _top(self, node):
+        if node.dirty:
+            merged = {
+                text: max(self._contributions[text].values())
+                for text in node.entries
+            }
+            for child in node.children.values():
+                merged.update(self._top(child))
+            ranked = sorted(merged.items(), key=lambda item: -item[1])[:TOP_K]
+            node.top = dict(ranked)
+            node.dirty = False
+        return node.top
+
+
+# Global instance
+suggestion_index = SuggestionIndex()
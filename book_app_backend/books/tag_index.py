@@ -0,0 +1,327 @@
+import time
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Book, BookTag, BookTagAssociation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAG_INDEX = {
+    # Other workers' edits only reach this process on a periodic rebuild
+    'refresh_interval': 600,
+}
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def normalize_tag(name):
+    return ' '.join((name or '').lower().split())
+
+
+class TagMatches:
+    """
+    Book ids matching a tag filter, ordered by popularity, then rating, then
+    id. Slicing ranks only as far as the slice reaches, so a page of a huge
+    result costs a partition rather than a full sort.
+    """
+
+    def __init__(self, book_ids, popularity, rating):
+        self.book_ids = book_ids
+        self._keys = [-popularity, -rating, book_ids]
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0] if index >= 0 else self[len(self) + index]
+        start, stop, step = index.indices(len(self))
+        return self.book_ids[self._smallest(self._keys, np.arange(len(self)), stop)][start:stop:step]
+
+    @classmethod
+    def _smallest(cls, keys, rows, k):
+        """The k of rows smallest by keys, in order"""
+        if k <= 0:
+            return rows[:0]
+        if k >= len(rows) or len(keys) == 1:
+            return rows[np.lexsort(tuple(key[rows] for key in reversed(keys)))][:k]
+        primary = keys[0][rows]
+        kth = np.partition(primary, k - 1)[k - 1]
+        ahead = rows[primary < kth]
+        ahead = ahead[np.lexsort(tuple(key[ahead] for key in reversed(keys)))]
+        # Rows tied with the k-th are equal on this key; the next one decides
+        tied = cls._smallest(keys[1:], rows[primary == kth], k - len(ahead))
+        return np.concatenate((ahead, tied))
+
+
+class TagIndex:
+    """
+    In-memory posting lists answering tag filters with AND/OR/NOT.
+
+    Each tag maps to the sorted array of the book ids carrying it. A filter
+    starts from the rarest required tag and tests the candidates against
+    bitmaps over the book id space built from the other posting lists, so
+    AND, OR and NOT are array lookups rather than joins. Popularity and
+    rating are kept in arrays indexed by book id, so matches are ranked like
+    Book's default ordering without touching the database.
+
+    Model signals apply this process's edits as they happen. Every
+    refresh_interval one background thread rebuilds the index while filters
+    keep using the current one; edits made meanwhile are replayed onto the
+    new index before it is swapped in.
+    """
+
+    def __init__(self):
+        self.config = {**DEFAULT_TAG_INDEX, **getattr(settings, 'TAG_INDEX', {})}
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()  # held by the one build in progress
+        self._replay = None    # edits to reapply to the index being built
+        self._postings = None  # tag id -> sorted book ids
+        self._tag_ids = {}     # normalized name -> {tag id}
+        self._tag_names = {}   # tag id -> normalized name
+        self._alive = np.zeros(0, dtype=bool)
+        self._popularity = np.zeros(0, dtype=np.float64)
+        self._rating = np.zeros(0, dtype=np.float64)
+        self._built_at = 0
+
+    def is_built(self):
+        return self._postings is not None
+
+    def build(self):
+        """Load every tag association and the ranking columns of every book and swap them in"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        started = time.monotonic()
+        with self._lock:
+            self._replay = []
+        try:
+            fresh = TagIndex()
+            tags, links = fresh._load()
+            with self._lock:
+                for edit in self._replay:
+                    edit(fresh)
+                for name in ('_postings', '_tag_ids', '_tag_names', '_alive', '_popularity', '_rating'):
+                    setattr(self, name, getattr(fresh, name))
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._replay = None
+
+        logger.info(
+            f"Built tag index of {tags} tags and {links} associations "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+
+    def _load(self):
+        """Fill this index from the database; returns the tag and association counts"""
+        links = np.array(
+            list(BookTagAssociation.objects.order_by().values_list('tag_id', 'book_id').iterator()),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        tags = list(BookTag.objects.values_list('id', 'name'))
+        books = list(Book.objects.order_by().values_list('id', 'popularity_score', 'average_rating').iterator())
+
+        # Group the association rows by tag, book ids ascending within a tag
+        links = links[np.lexsort((links[:, 1], links[:, 0]))]
+        tag_ids, starts = np.unique(links[:, 0], return_index=True)
+        postings = {
+            int(tag_id): book_ids
+            for tag_id, book_ids in zip(tag_ids, np.split(links[:, 1], starts[1:]))
+        }
+
+        # Links can name a book that was deleted before the book rows were read
+        capacity = max(
+            max((book_id for book_id, _, _ in books), default=0),
+            int(links[:, 1].max(initial=0))
+        ) + 1
+        alive = np.zeros(capacity, dtype=bool)
+        popularity = np.zeros(capacity, dtype=np.float64)
+        rating = np.zeros(capacity, dtype=np.float64)
+        if books:
+            book_ids, popularity_scores, ratings = (np.array(column) for column in zip(*books))
+            alive[book_ids] = True
+            popularity[book_ids] = popularity_scores
+            rating[book_ids] = ratings
+
+        self._postings = postings
+        for tag_id, name in tags:
+            self._name_tag(tag_id, name)
+        self._alive, self._popularity, self._rating = alive, popularity, rating
+        return len(tags), len(links)
+
+    def _refresh(self):
+        if not self.is_built():
+            # Nothing to serve yet: concurrent first filters wait for one build
+            with self._build_lock:
+                if not self.is_built():
+                    self._build()
+        elif (time.monotonic() - self._built_at > self.config['refresh_interval']
+              and self._build_lock.acquire(blocking=False)):
+            threading.Thread(target=self._build_in_background, name='tag-index-build', daemon=True).start()
+
+    def _build_in_background(self):
+        try:
+            close_old_connections()
+            self._build()
+        except Exception as e:
+            logger.error(f"Rebuilding the tag index failed: {e}")
+        finally:
+            self._build_lock.release()
+            close_old_connections()
+
+    # Querying
+
+    def filter(self, all_tags=(), any_tags=(), none_tags=()):
+        """
+        TagMatches of the books carrying every tag in all_tags, at least one
+        of any_tags and none of none_tags, most popular first. Tag names are
+        matched case-insensitively; with neither all_tags nor any_tags every
+        book is a candidate.
+        """
+        self._refresh()
+        with self._lock:
+            result = None
+            if all_tags:
+                # Start from the rarest tag and test the rest against bitmaps
+                required = sorted(
+                    (self._postings_of(name) for name in set(all_tags)),
+                    key=lambda postings: sum(len(book_ids) for book_ids in postings)
+                )
+                rarest = required[0]
+                result = rarest[0] if len(rarest) == 1 else np.flatnonzero(self._mask(rarest))
+                for postings in required[1:]:
+                    if not len(result):
+                        break
+                    result = result[self._mask(postings)[result]]
+            if any_tags:
+                alternatives = self._mask(self._postings_of(*set(any_tags)))
+                result = np.flatnonzero(alternatives) if result is None else result[alternatives[result]]
+            if result is None:
+                result = np.flatnonzero(self._alive)
+            else:
+                result = result[self._alive[result]]
+            if none_tags and len(result):
+                result = result[~self._mask(self._postings_of(*set(none_tags)))[result]]
+            return TagMatches(result, self._popularity[result], self._rating[result])
+
+    def _postings_of(self, *names):
+        """Posting lists of the tags named, including tags differing only in casing"""
+        return [
+            self._postings[tag_id]
+            for name in names
+            for tag_id in self._tag_ids.get(normalize_tag(name), ())
+            if tag_id in self._postings
+        ]
+
+    def _mask(self, postings):
+        """Boolean array over book ids: which carry at least one of postings"""
+        mask = np.zeros(len(self._alive), dtype=bool)
+        for book_ids in postings:
+            mask[book_ids] = True
+        return mask
+
+    # Incremental maintenance
+
+    def _edit(self, edit):
+        """Apply edit(index) to the live index and to the one being built, if any"""
+        with self._lock:
+            if self.is_built():
+                edit(self)
+            if self._replay is not None:
+                self._replay.append(edit)
+
+    def _tracking(self):
+        return self.is_built() or self._replay is not None
+
+    def update_book(self, book):
+        if self._tracking():
+            book_id, popularity, rating = book.pk, book.popularity_score or 0.0, book.average_rating or 0.0
+            self._edit(lambda index: index._set_book(book_id, popularity, rating))
+
+    def remove_book(self, book_id):
+        if self._tracking():
+            self._edit(lambda index: index._kill_book(book_id))
+
+    def add_tag(self, book_id, tag_id):
+        if self._tracking():
+            self._edit(lambda index: index._add_posting(book_id, tag_id))
+
+    def remove_tag(self, book_id, tag_id):
+        if self._tracking():
+            self._edit(lambda index: index._remove_posting(book_id, tag_id))
+
+    def rename_tag(self, tag_id, name):
+        if self._tracking():
+            self._edit(lambda index: index._rename_tag(tag_id, name))
+
+    def drop_tag(self, tag_id):
+        if self._tracking():
+            self._edit(lambda index: index._drop_tag(tag_id))
+
+    # Internals (callers hold the lock)
+
+    def _set_book(self, book_id, popularity, rating):
+        self._ensure_capacity(book_id)
+        self._alive[book_id] = True
+        self._popularity[book_id] = popularity
+        self._rating[book_id] = rating
+
+    def _kill_book(self, book_id):
+        if book_id < len(self._alive):
+            self._alive[book_id] = False
+
+    def _add_posting(self, book_id, tag_id):
+        self._ensure_capacity(book_id)
+        book_ids = self._postings.get(tag_id, EMPTY)
+        i = np.searchsorted(book_ids, book_id)
+        if i == len(book_ids) or book_ids[i] != book_id:
+            self._postings[tag_id] = np.insert(book_ids, i, book_id)
+
+    def _remove_posting(self, book_id, tag_id):
+        book_ids = self._postings.get(tag_id, EMPTY)
+        i = np.searchsorted(book_ids, book_id)
+        if i < len(book_ids) and book_ids[i] == book_id:
+            self._postings[tag_id] = np.delete(book_ids, i)
+
+    def _rename_tag(self, tag_id, name):
+        self._unname_tag(tag_id)
+        self._name_tag(tag_id, name)
+
+    def _drop_tag(self, tag_id):
+        self._unname_tag(tag_id)
+        self._postings.pop(tag_id, None)
+
+    def _name_tag(self, tag_id, name):
+        name = normalize_tag(name)
+        self._tag_names[tag_id] = name
+        self._tag_ids.setdefault(name, set()).add(tag_id)
+
+    def _unname_tag(self, tag_id):
+        name = self._tag_names.pop(tag_id, None)
+        if name is not None:
+            self._tag_ids[name].discard(tag_id)
+            if not self._tag_ids[name]:
+                del self._tag_ids[name]
+
+    def _ensure_capacity(self, book_id):
+        if book_id < len(self._alive):
+            return
+        capacity = max(book_id + 1, len(self._alive) * 2)
+        for name in ('_alive', '_popularity', '_rating'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+
+# Global instance
+tag_index = TagIndex()
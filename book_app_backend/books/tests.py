@@ -0,0 +1,757 @@
+import json
+import time
+import fcntl
+import random
+import tempfile
+import threading
+from io import StringIO
+from itertools import product
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from . import popularity
+from .collaborative import DEFAULT_COLLABORATIVE_FILTERING, interaction_value, readers_also_liked
+from .cache_versions import FRAGMENTS, get_generations
+from .genres import QUIZ_GENRES, genre_taxonomy
+from .models import (
+    Book, BookGenre, BookMood, BookMoodAssociation, BookTag, BookTagAssociation,
+    UserLibrary, UserRecommendation
+)
+from .http_client import provider_client
+from .ingestion import external_book_ingestor
+from .mood_scoring import QUIZ_DEPTHS, QUIZ_ENERGIES, mood_scorer
+from .popularity import PopularityEngine, popularity_engine
+from .recommendation_writer import RecommendationWriter
+from .search_index import TermTableIndex, book_search_index
+from .services import GoogleBooksService, OpenLibraryService, book_search_service
+from .similarity import BookSimilarityIndex
+from .suggestions import suggestion_index
+from .tag_index import tag_index
+from .views import _calculate_match_score
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTestCase(TestCase):
+    """TestCase whose in-process catalog indexes start from this class's data"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Rolled back rows of earlier tests never committed, so nothing retired them
+        genre_taxonomy.invalidate()
+        super().setUpClass()
+
+
+class ListingQueryCountTests(CatalogTestCase):
+    """Book listings run the same number of queries whatever the page size"""
+
+    SMALL, LARGE = 3, 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='reader', email='reader@example.com', password='secret'
+        )
+        tags = [BookTag.objects.create(name=f'tag {i}') for i in range(3)]
+        moods = [BookMood.objects.create(name=f'mood {i}') for i in range(3)]
+        for i in range(cls.LARGE + 3):
+            book = Book.objects.create(
+                title=f'Lighthouse Chronicle {i}',
+                author=f'Author {i}',
+                genre='Fantasy',
+                description='A keeper tends a lighthouse.',
+                published_year=2000 + i,
+                popularity_score=float(i),
+            )
+            for tag in tags[:1 + i % 3]:
+                BookTagAssociation.objects.create(book=book, tag=tag)
+            for mood in moods[:1 + i % 2]:
+                BookMoodAssociation.objects.create(book=book, mood=mood)
+            UserLibrary.objects.create(user=cls.user, book=book, user_rating=4.0)
+            UserRecommendation.objects.create(
+                user=cls.user, book=book, mood_energy='high', mood_genre='fantasy',
+                mood_depth='deep', saved=i < cls.LARGE
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url, **params):
+        # Every request renders from the database rather than a cached page or fragment
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries), response.data
+
+    def assert_constant_queries(self, url, **params):
+        small, small_data = self.count_queries(url, limit=self.SMALL, **params)
+        large, large_data = self.count_queries(url, limit=self.LARGE, **params)
+        self.assertNotEqual(small_data, large_data)
+        self.assertEqual(small, large)
+
+    def test_popular_books(self):
+        self.assert_constant_queries(reverse('books:popular_books'))
+
+    def test_genre_books(self):
+        self.assert_constant_queries(reverse('books:books_by_genre', args=['Fantasy']))
+
+    def test_search(self):
+        with mock.patch.object(book_search_service, 'search_external_books', return_value=[]):
+            self.assert_constant_queries(reverse('books:search_books'), q='lighthouse')
+            self.assert_constant_queries(reverse('books:search_books'), q='lighthouse', sort_by='popularity')
+
+    def test_relevance_search_pages(self):
+        url = reverse('books:search_books')
+
+        def titles(**params):
+            return [book['title'] for book in self.count_queries(url, q='lighthouse', **params)[1]['local_books']]
+
+        with mock.patch.object(book_search_service, 'search_external_books', return_value=[]):
+            for backend in [book_search_index.backend, TermTableIndex()]:
+                with self.subTest(backend=type(backend).__name__), \
+                        mock.patch.object(book_search_index, '_backend', backend):
+                    backend.rebuild()
+                    first, second = titles(limit=5), titles(limit=5, offset=5)
+                    self.assertEqual(len(second), 5)
+                    self.assertEqual(first + second, titles(limit=10))
+
+    def test_library(self):
+        self.assert_constant_queries(reverse('books:user_library'))
+
+    def test_saved_recommendations(self):
+        url = reverse('books:saved_recommendations')
+        large, large_data = self.count_queries(url)
+        kept = [rec['id'] for rec in large_data['recommendations'][:self.SMALL]]
+        UserRecommendation.objects.filter(user=self.user).exclude(pk__in=kept).update(saved=False)
+        small, small_data = self.count_queries(url)
+        self.assertEqual(len(large_data['recommendations']), self.LARGE)
+        self.assertEqual(len(small_data['recommendations']), self.SMALL)
+        self.assertEqual(small, large)
+
+
+# Responses of the fake providers, keyed by URL path
+PROVIDER_PAYLOADS = {
+    'google': {'items': [{
+        'id': 'g1',
+        'volumeInfo': {
+            'title': 'Google Lighthouse', 'authors': ['G. Author'], 'publishedDate': '2001',
+            'pageCount': 300, 'averageRating': 4.0, 'ratingsCount': 10,
+        },
+    }]},
+    'openlibrary': {'docs': [{
+        'key': '/works/OL1W', 'title': 'Open Library Lighthouse',
+        'author_name': ['O. Author'], 'first_publish_year': 1999,
+    }]},
+}
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Answers each provider path after that provider's configured delay"""
+
+    def do_GET(self):
+        provider = urlparse(self.path).path.strip('/')
+        time.sleep(self.server.delays[provider])
+        body = json.dumps(PROVIDER_PAYLOADS[provider]).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client gave up
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    EXTERNAL_SEARCH_DEADLINE=0.5,
+    EXTERNAL_SEARCH_TIMEOUTS={'google_books': 3.0, 'open_library': 3.0},
+)
+class ExternalSearchDeadlineTests(SimpleTestCase):
+    """Providers are queried concurrently and cut off at the search deadline"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProviderHandler)
+        cls.server.daemon_threads = True
+        cls.server.block_on_close = False
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        for patcher in [
+            mock.patch.object(GoogleBooksService, 'BASE_URL', f'{base}/google'),
+            mock.patch.object(OpenLibraryService, 'SEARCH_URL', f'{base}/openlibrary'),
+            mock.patch.object(external_book_ingestor, 'submit'),
+        ]:
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        # Start every test with closed circuits and no latency history
+        provider_client._breakers.clear()
+        provider_client._stats.clear()
+
+    def search(self, google_delay, openlibrary_delay):
+        self.server.delays = {'google': google_delay, 'openlibrary': openlibrary_delay}
+        started = time.monotonic()
+        books = book_search_service.search_external_books(f'lighthouse {google_delay} {openlibrary_delay}')
+        return {book['title'] for book in books}, time.monotonic() - started
+
+    def test_fast_providers_both_answer(self):
+        titles, elapsed = self.search(0.05, 0.1)
+        self.assertEqual(titles, {'Google Lighthouse', 'Open Library Lighthouse'})
+        self.assertLess(elapsed, 0.5)
+
+    def test_slow_open_library_is_cut_off(self):
+        titles, elapsed = self.search(0.05, 2.0)
+        self.assertEqual(titles, {'Google Lighthouse'})
+        self.assertLess(elapsed, 1.0)
+
+    def test_slow_google_books_is_cut_off(self):
+        titles, elapsed = self.search(2.0, 0.05)
+        self.assertEqual(titles, {'Open Library Lighthouse'})
+        self.assertLess(elapsed, 1.0)
+
+    def test_both_slow_returns_nothing_at_the_deadline(self):
+        titles, elapsed = self.search(2.0, 2.0)
+        self.assertEqual(titles, set())
+        self.assertGreaterEqual(elapsed, 0.5)
+        self.assertLess(elapsed, 1.0)
+
+
+class MoodBitTests(CatalogTestCase):
+    """Every mood gets its own Book.mood_mask bit"""
+
+    def test_lost_race_retries_with_the_next_free_bit(self):
+        first = BookMood.objects.create(name='cosy')
+        # A concurrent save picked the same free bit a moment earlier
+        with mock.patch('books.mood_masks.free_mood_bit', side_effect=[first.bit, first.bit + 1]):
+            second = BookMood.objects.create(name='eerie')
+        self.assertEqual(second.bit, first.bit + 1)
+        self.assertEqual(BookMood.objects.get(pk=second.pk).bit, first.bit + 1)
+
+
+class IngestionTests(CatalogTestCase):
+    """External hits are upserted in batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clashing, cls.fitting = (
+            Book.objects.create(
+                title=title, author='Author', genre='Fiction', published_year=2000, google_books_id=google_books_id
+            )
+            for title, google_books_id in (('Clashing', 'g1'), ('Fitting', 'g2'))
+        )
+
+    def hit(self, title, google_books_id, isbn=None):
+        return {
+            'title': title, 'authors': ['Author'], 'published_date': '2000', 'categories': ['Fiction'],
+            'description': f'About {title}', 'google_books_id': google_books_id,
+            'industry_identifiers': [{'type': 'ISBN_13', 'identifier': isbn}] if isbn else [],
+        }
+
+    def test_taken_isbn_only_skips_its_own_row(self):
+        match_existing = external_book_ingestor._match_existing
+
+        def race(candidates):
+            existing = match_existing(candidates)
+            # A concurrent writer takes the ISBN after the batch was matched
+            Book.objects.create(title='Racer', author='Author', genre='Fiction', published_year=2000, isbn='9780000000001')
+            return existing
+
+        hits = [self.hit('Clashing', 'g1', '9780000000001'), self.hit('Fitting', 'g2'), self.hit('Fresh', 'g3')]
+        with mock.patch.object(external_book_ingestor, '_match_existing', side_effect=race):
+            self.assertEqual(external_book_ingestor.ingest(hits), (1, 1))
+        self.assertEqual(Book.objects.get(pk=self.clashing.pk).description, '')
+        self.assertEqual(Book.objects.get(pk=self.fitting.pk).description, 'About Fitting')
+        self.assertTrue(Book.objects.filter(google_books_id='g3').exists())
+
+
+class RecommendationWriterTests(CatalogTestCase):
+    """Queued quiz results are upserted in batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='quizzer', email='quizzer@example.com', password='secret'
+        )
+        cls.books = [
+            Book.objects.create(title=f'Book {i}', author='Author', genre='Fiction', published_year=2000)
+            for i in range(3)
+        ]
+
+    def test_drain_writes_queued_rows(self):
+        writer = RecommendationWriter()
+        recommendations = [
+            {'id': book.pk, 'match_score': 5, 'match_percentage': 50, 'match_reasons': []} for book in self.books
+        ]
+        # Rows stay queued as they would behind a worker still collecting its batch
+        with mock.patch.object(writer, '_ensure_worker'):
+            for depth in ('light', 'deep'):
+                writer.submit(self.user, {'energy': 'calm', 'genre': 'Fiction', 'depth': depth}, recommendations)
+        writer.drain()
+        self.assertEqual(writer._queue.qsize(), 0)
+        self.assertEqual(
+            sorted(UserRecommendation.objects.filter(user=self.user).values_list('book_id', 'mood_depth')),
+            sorted((book.pk, depth) for book in self.books for depth in ('deep', 'light'))
+        )
+
+
+class RatingAggregateTests(CatalogTestCase):
+    """Book rating aggregates follow UserLibrary.user_rating writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.readers = [
+            get_user_model().objects.create_user(username=f'rater{i}', email=f'rater{i}@example.com', password='secret')
+            for i in range(2)
+        ]
+        # Two ratings from the provider averaging 4.0
+        cls.book = Book.objects.create(
+            title='Tidewater', author='Author', genre='Fantasy', published_year=2001,
+            average_rating=4.0, rating_count=2
+        )
+
+    def setUp(self):
+        cache.clear()
+        # Shelving counts towards popularity, which isn't under test here
+        patcher = mock.patch.object(popularity_engine, 'record')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rate(self, reader, rating):
+        entry, _ = UserLibrary.objects.get_or_create(user=reader, book=self.book)
+        entry.user_rating = rating
+        entry.save()
+
+    def assert_aggregates(self, average, count, user_sum, user_count):
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertAlmostEqual(book.average_rating, average)
+        self.assertEqual(book.rating_count, count)
+        self.assertAlmostEqual(book.user_rating_sum, user_sum)
+        self.assertEqual(book.user_rating_count, user_count)
+
+    def test_rate_rerate_unrate_and_delete(self):
+        first, second = self.readers
+        self.rate(first, 5.0)
+        self.assert_aggregates(13 / 3, 3, 5.0, 1)
+        self.rate(first, 2.0)
+        self.assert_aggregates(10 / 3, 3, 2.0, 1)
+        self.rate(second, 3.0)
+        self.assert_aggregates(13 / 4, 4, 5.0, 2)
+        self.rate(first, None)
+        self.assert_aggregates(11 / 3, 3, 3.0, 1)
+        UserLibrary.objects.get(user=second).delete()
+        self.assert_aggregates(4.0, 2, 0.0, 0)
+
+    def test_rating_change_invalidates_cached_popular_page(self):
+        url = reverse('books:popular_books')
+        self.assertEqual(self.client.get(url).data['results'][0]['average_rating'], 4.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rate(self.readers[0], 1.0)
+        self.assertEqual(self.client.get(url).data['results'][0]['average_rating'], 3.0)
+
+
+class GenreTaxonomyTests(CatalogTestCase):
+    """Free-text genres map onto BookGenre rows"""
+
+    def test_rolled_back_genre_leaves_no_dangling_id(self):
+        genre_taxonomy.match('Fiction')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            genre_taxonomy.resolve('Maritime Folklore')
+            genre_taxonomy.match('Maritime Folklore')
+            raise RuntimeError
+        genre_id = genre_taxonomy.resolve('Maritime Folklore')
+        self.assertEqual(BookGenre.objects.get(pk=genre_id).name, 'Maritime Folklore')
+
+    def test_new_genre_joins_the_tree_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            genre = BookGenre.objects.create(name='Nautical')
+        self.assertEqual(genre_taxonomy.match('Nautical Adventure'), genre.pk)
+
+
+class ItemNeighborTests(CatalogTestCase):
+    """The neighbor index matches item-item cosine computed on the dense matrix"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(19)
+        cls.books = [
+            Book.objects.create(title=f'Book {i}', author='Author', genre='Fiction', published_year=2000)
+            for i in range(8)
+        ]
+        readers = [
+            get_user_model().objects.create(username=f'reader{i}', email=f'reader{i}@example.com')
+            for i in range(12)
+        ]
+        statuses = [status for status, _ in UserLibrary.STATUS_CHOICES]
+        for reader in readers:
+            for book in rng.sample(cls.books, rng.randint(2, 6)):
+                UserLibrary.objects.create(
+                    user=reader, book=book, status=rng.choice(statuses),
+                    user_rating=rng.choice([None, None, 1.0, 2.0, 2.5, 4.0, 5.0])
+                )
+
+    def expected(self, k):
+        config = DEFAULT_COLLABORATIVE_FILTERING
+        rows = list(UserLibrary.objects.values_list('user_id', 'book_id', 'user_rating', 'status'))
+        users = sorted({user_id for user_id, *_ in rows})
+        books = [book.pk for book in self.books]
+        matrix = np.zeros((len(users), len(books)))
+        for user_id, book_id, rating, status in rows:
+            matrix[users.index(user_id), books.index(book_id)] = interaction_value(
+                rating, status, config['status_weights']
+            )
+        norms = np.sqrt((matrix * matrix).sum(axis=0))
+        expected = {}
+        for i, book_id in enumerate(books):
+            similar = []
+            for j, other_id in enumerate(books):
+                overlap = np.count_nonzero(matrix[:, i] * matrix[:, j])
+                if i == j or overlap < config['min_overlap']:
+                    continue
+                similarity = matrix[:, i] @ matrix[:, j] / (norms[i] * norms[j]) * overlap / (overlap + config['shrinkage'])
+                if similarity > 0:
+                    similar.append((other_id, similarity))
+            if similar:
+                expected[book_id] = sorted(similar, key=lambda item: -item[1])[:k]
+        return expected
+
+    def test_build_matches_dense_cosine(self):
+        out = StringIO()
+        call_command('build_item_neighbors', neighbors=3, chunk_size=7, stdout=out)
+        expected = self.expected(3)
+        self.assertIn(f'neighbors for {len(expected)} books', out.getvalue())
+        for book in self.books:
+            with self.subTest(book=book.pk):
+                found = readers_also_liked(book.pk)
+                wanted = expected.get(book.pk, [])
+                self.assertEqual(len(found), len(wanted))
+                for (_, found_similarity), (_, wanted_similarity) in zip(found, wanted):
+                    self.assertAlmostEqual(found_similarity, wanted_similarity, places=5)
+                # Equal similarities may come in either order
+                self.assertEqual({book_id for book_id, _ in found}, {book_id for book_id, _ in wanted})
+
+        book_id = next(iter(expected))
+        response = self.client.get(reverse('books:readers_also_liked', args=[book_id]), {'limit': 2})
+        self.assertEqual([book['id'] for book in response.data['results']], [pk for pk, _ in readers_also_liked(book_id, 2)])
+
+
+class BookSimilarityTests(CatalogTestCase):
+    """The similar books index follows builds, updates and deletes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sea, cls.harbour, cls.desert, cls.city = (
+            Book.objects.create(title=title, author='Author', genre=genre, description=description, published_year=2000)
+            for title, genre, description in (
+                ('Sea', 'Adventure', 'A whaling ship sails the stormy ocean after a white whale'),
+                ('Harbour', 'Adventure', 'A fishing ship leaves the harbour for the stormy ocean'),
+                ('Desert', 'Mystery', 'A detective crosses the burning desert on a camel'),
+                ('City', 'Romance', 'Two strangers meet in a crowded city cafe every morning'),
+            )
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Small enough a catalog that any delta would trigger a full rebuild
+        with self.settings(BOOK_SIMILARITY={'path': directory.name, 'max_delta_ratio': 10.0, 'sync_overlap': 0}):
+            self.index = BookSimilarityIndex()
+
+    def nearest(self, index, book_id):
+        return [neighbor_id for neighbor_id, _ in index.similar(book_id)]
+
+    def reader(self):
+        """The index as another process loads it from the files"""
+        reader = BookSimilarityIndex()
+        reader.config = self.index.config
+        return reader
+
+    def test_writers_hold_the_lock(self):
+        def assert_locked():
+            with open(self.index.path / 'build.lock') as lock, self.assertRaises(BlockingIOError):
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return 0
+
+        for method in ('_build', '_update'):
+            with self.subTest(method=method), mock.patch.object(self.index, method, side_effect=assert_locked):
+                getattr(self.index, method.lstrip('_'))()
+
+    def test_updates_and_deletes(self):
+        self.assertEqual(self.index.build(), 4)
+        self.assertEqual(self.nearest(self.index, self.sea.pk)[0], self.harbour.pk)
+
+        harbour_id = self.harbour.pk
+        self.city.genre = 'Adventure'
+        self.city.description = 'A whaling ship crosses the stormy ocean'
+        self.city.save()
+        with mock.patch('books.signals.book_similarity_index', self.index):
+            self.harbour.delete()
+        # This process drops the deleted book at once
+        self.assertNotIn(harbour_id, self.nearest(self.index, self.sea.pk))
+
+        self.assertEqual(self.index.update(), 1)
+        self.assertEqual(list(self.index.path.glob('tombstones*')), [])
+        # Another process sees both changes from the index files
+        self.assertEqual(self.nearest(self.reader(), self.sea.pk), [self.city.pk, self.desert.pk])
+        self.assertEqual(self.nearest(self.reader(), harbour_id), [])
+
+        with mock.patch('books.signals.book_similarity_index', self.index):
+            self.desert.delete()
+        self.assertEqual(self.index.build(), 2)
+        self.assertEqual(list(self.index.path.glob('tombstones*')), [])
+        self.assertEqual(self.nearest(self.reader(), self.sea.pk), [self.city.pk])
+
+
+class SuggestionIndexTests(CatalogTestCase):
+    """Search suggestions complete word prefixes, most popular first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.wizard, cls.shed, cls.pottery = (
+            Book.objects.create(
+                title=title, author=author, genre=genre, published_year=2000, popularity_score=popularity
+            )
+            for title, author, genre, popularity in (
+                ('Harry Potter', 'J. K. Rowling', 'Fantasy', 50.0),
+                ('The Potting Shed', 'Graham Greene', 'Fiction', 20.0),
+                ('Pottery Basics', 'Ann Clay', 'Crafts', 5.0),
+            )
+        )
+
+    def setUp(self):
+        suggestion_index.build()
+
+    def test_prefix_completion(self):
+        self.assertEqual(suggestion_index.suggest('pot'), ['Harry Potter', 'The Potting Shed', 'Pottery Basics'])
+        self.assertEqual(suggestion_index.suggest('POTT', limit=2), ['Harry Potter', 'The Potting Shed'])
+        self.assertEqual(suggestion_index.suggest('gre'), ['Graham Greene'])
+        # Genres outside any book come from the genre tree
+        self.assertEqual(suggestion_index.suggest('fant'), ['Fantasy', 'Epic Fantasy', 'Urban Fantasy'])
+        self.assertEqual(suggestion_index.suggest('potx'), [])
+
+    def test_edits_and_deletes(self):
+        self.pottery.title = 'Clay Basics'
+        self.pottery.save()
+        self.shed.popularity_score = 100.0
+        self.shed.save()
+        self.assertEqual(suggestion_index.suggest('pot'), ['The Potting Shed', 'Harry Potter'])
+        self.assertEqual(suggestion_index.suggest('clay'), ['Ann Clay', 'Clay Basics'])
+
+        BookTagAssociation.objects.create(book=self.shed, tag=BookTag.objects.create(name='Potions'))
+        self.assertEqual(suggestion_index.suggest('poti'), ['Potions'])
+
+        self.wizard.delete()
+        # A tag weighs as much as its book
+        self.assertEqual(suggestion_index.suggest('pot'), ['Potions', 'The Potting Shed'])
+        self.assertEqual(suggestion_index.suggest('rowl'), [])
+
+
+class MoodScoringParityTests(CatalogTestCase):
+    """The vectorized quiz scorer ranks books exactly as the per-book scorer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        choice = lambda options: options[rng.randrange(len(options))]
+        for i in range(40):
+            Book.objects.create(
+                title=f'Quiz Book {i}', author='Author', published_year=2000,
+                genre=choice(['Fantasy', 'Epic Fantasy', 'Crime', 'Biography', 'Cookery']),
+                average_rating=choice([0.0, 3.4, 3.5, 3.9, 4.0, 4.6]),
+                rating_count=choice([0, 100, 101, 1000, 1001, 5000]),
+                energy_level=choice([None, 'high', 'medium', 'low']),
+                reading_pace=choice([None, 'fast', 'moderate', 'slow']),
+                reading_depth=choice([None, 'light', 'medium', 'deep']),
+                page_count=choice([None, 0, 150, 299, 300, 400, 401, 900]),
+                description='x' * choice([0, 200, 201]),
+            )
+
+    def expected(self, energy, genre, depth, limit):
+        """The ORM filters and per-book scores the quiz used before the snapshot"""
+        genre_filter = Q(canonical_genre_id__in=genre_taxonomy.quiz_genre_ids(genre))
+        quiz_filter = Q()
+        if energy == 'high':
+            quiz_filter &= Q(energy_level='high') | Q(reading_pace='fast')
+        elif energy == 'low':
+            quiz_filter &= Q(energy_level='low') | Q(reading_pace='slow')
+        if depth == 'light':
+            quiz_filter &= Q(reading_depth='light') | Q(page_count__lt=300)
+        elif depth == 'deep':
+            quiz_filter &= Q(reading_depth='deep') | Q(page_count__gt=400)
+        books = list(Book.objects.filter(genre_filter & quiz_filter))
+        if len(books) < limit:
+            books = list(Book.objects.filter(genre_filter))
+        scored = [
+            (_calculate_match_score(book, energy, genre, depth)['total_score'], book)
+            for book in books
+        ]
+        scored.sort(key=lambda item: (-item[0], -item[1].average_rating, -item[1].rating_count, item[1].pk))
+        return [(book.pk, score) for score, book in scored[:limit]]
+
+    def test_scores_and_order_match(self):
+        mood_scorer.build()
+        for energy, genre, depth in product(QUIZ_ENERGIES, QUIZ_GENRES, QUIZ_DEPTHS):
+            for limit in (3, 10):
+                with self.subTest(energy=energy, genre=genre, depth=depth, limit=limit):
+                    expected = self.expected(energy, genre, depth, limit)
+                    self.assertEqual(mood_scorer.top_books(energy, genre, depth, limit), expected)
+                    self.assertEqual(mood_scorer.recommend(energy, genre, depth, limit), expected)
+
+
+class TagFilterTests(CatalogTestCase):
+    """Tag filters answer exactly what the equivalent ORM query returns"""
+
+    TAGS = ['adventure', 'romance', 'classic', 'dark academia']
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(21)
+        tags = [BookTag.objects.create(name=name) for name in cls.TAGS]
+        for i in range(30):
+            book = Book.objects.create(
+                title=f'Tagged {i}', author='Author', genre='Fiction', published_year=2000,
+                popularity_score=float(rng.randrange(5)), average_rating=float(rng.randrange(3)),
+            )
+            for tag in tags:
+                if rng.random() < 0.4:
+                    BookTagAssociation.objects.create(book=book, tag=tag)
+
+    def expected(self, all_tags=(), any_tags=(), none_tags=()):
+        queryset = Book.objects.all()
+        for name in all_tags:
+            queryset = queryset.filter(pk__in=BookTagAssociation.objects.filter(tag__name=name).values('book_id'))
+        if any_tags:
+            queryset = queryset.filter(pk__in=BookTagAssociation.objects.filter(tag__name__in=any_tags).values('book_id'))
+        if none_tags:
+            queryset = queryset.exclude(pk__in=BookTagAssociation.objects.filter(tag__name__in=none_tags).values('book_id'))
+        return list(queryset.order_by('-popularity_score', '-average_rating', 'pk').values_list('pk', flat=True))
+
+    def assert_filters_match(self):
+        for all_tags, any_tags, none_tags in [
+            ((), (), ()),
+            (['adventure'], (), ()),
+            (['adventure', 'romance'], (), ()),
+            ((), ['classic', 'dark academia'], ()),
+            ((), (), ['romance']),
+            (['adventure'], ['classic', 'romance'], ['dark academia']),
+            (['missing'], (), ()),
+            ((), ['missing'], ()),
+        ]:
+            with self.subTest(all=all_tags, any=any_tags, none=none_tags):
+                matches = tag_index.filter(all_tags, any_tags, none_tags)
+                expected = self.expected(all_tags, any_tags, none_tags)
+                self.assertEqual([int(book_id) for book_id in matches], expected)
+                self.assertEqual([int(book_id) for book_id in matches[2:5]], expected[2:5])
+
+    def test_and_or_not(self):
+        tag_index.build()
+        self.assert_filters_match()
+        # Tag names match case-insensitively
+        self.assertEqual(list(tag_index.filter(['ADVENTURE'])), list(tag_index.filter(['adventure'])))
+
+    def test_edits_after_build(self):
+        tag_index.build()
+        book = Book.objects.order_by('pk').first()
+        romance = BookTag.objects.get(name='romance')
+        BookTagAssociation.objects.filter(book=book).delete()
+        BookTagAssociation.objects.create(book=book, tag=romance)
+        Book.objects.filter(pk=book.pk + 1).first().delete()
+        book.popularity_score = 50.0
+        book.save()
+        self.assert_filters_match()
+
+
+@override_settings(POPULARITY={'mode': 'sync', 'half_life_days': 1})
+class PopularityTests(CatalogTestCase):
+    """Reader activity decays forward from the landmark"""
+
+    HALF_LIFE = 24 * 60 * 60
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = (
+            Book.objects.create(title=title, author='Author', genre='Fiction', published_year=2000)
+            for title in ('First', 'Second')
+        )
+        cls.seeded = Book.objects.create(
+            title='Seeded', author='Author', genre='Fiction', published_year=2000, popularity_score=8.0
+        )
+
+    def setUp(self):
+        self.engine = PopularityEngine()
+        self.start = self.engine.landmark + 10 * self.HALF_LIFE
+
+    def at(self, half_lives):
+        return mock.patch.object(popularity.time, 'time', return_value=self.start + half_lives * self.HALF_LIFE)
+
+    def record(self, book, *events):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.engine.record(book.pk, *events)
+
+    def scores(self):
+        return dict(Book.objects.values_list('title', 'popularity_score'))
+
+    def assert_scores(self, **expected):
+        scores = self.scores()
+        for title, score in expected.items():
+            self.assertAlmostEqual(scores[title], score, places=6, msg=title)
+
+    def test_events_decay_by_half_life(self):
+        with self.at(0):
+            self.record(self.first, 'completed')
+            self.engine.decay()
+        self.assert_scores(First=2.0, Second=0.0, Seeded=8.0)
+
+        with self.at(1):
+            self.record(self.second, 'added', 'reading')
+            self.engine.decay()
+        # One half-life on, the older and heavier event counts the same
+        self.assert_scores(First=1.0, Second=2.0, Seeded=4.0)
+
+        with self.at(2):
+            self.record(self.first, 'added')
+            self.engine.decay()
+        self.assert_scores(First=1.5, Second=1.0, Seeded=2.0)
+        self.assertEqual(
+            list(Book.objects.values_list('title', flat=True)), ['Seeded', 'First', 'Second']
+        )
+
+    def test_flush_sums_buffered_events_per_book(self):
+        with self.at(0):
+            self.engine._pending = {self.first.pk: 1.0 * self.engine.growth(), self.second.pk: 0.0}
+            self.engine._add(self.first.pk, 2.0 * self.engine.growth())
+        self.assertEqual(self.engine._pending, {})
+        self.assert_scores(First=3.0, Second=0.0)
+
+    def test_decay_retires_book_fragments(self):
+        before = get_generations(FRAGMENTS)
+        with self.captureOnCommitCallbacks(execute=True), self.at(0):
+            self.engine.decay()
+        self.assertNotEqual(get_generations(FRAGMENTS), before)
@@ -12,10 +12,17 @@ urlpatterns = [
     # Browse endpoints
     path('popular/', views.PopularBooksView.as_view(), name='popular_books'),
     path('genre/<str:genre>/', views.GenreBooksView.as_view(), name='books_by_genre'),
+    path('tags/filter/', views.filter_books_by_tags, name='filter_books_by_tags'),
+    
+    # Collaborative filtering
+    path('<int:book_id>/also-liked/', views.readers_also_liked, name='readers_also_liked'),
+    path('<int:book_id>/similar/', views.similar_books, name='similar_books'),
     
     # Metadata endpoints
     path('genres/', views.available_genres, name='available_genres'),
     path('moods/', views.available_moods, name='available_moods'),
+    path('providers/stats/', views.external_provider_stats, name='external_provider_stats'),
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
     
     # User library endpoints
     path('library/', views.UserLibraryView.as_view(), name='user_library'),
@@ -2,10 +2,8 @@ from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
 from django.core.cache import cache
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 
 from .models import Book, BookGenre, BookMood, BookTag, UserLibrary, UserRecommendation
 from .serializers import (
@@ -15,6 +13,17 @@ from .serializers import (
     MoodSummarySerializer
 )
 from .services import book_search_service
+from .fragments import book_fragments
+from .genres import genre_taxonomy
+from .mood_scoring import mood_scorer
+from .exclusions import recommendation_exclusions
+from .collaborative import readers_also_liked as item_neighbors
+from .similarity import book_similarity_index
+from .tag_index import tag_index
+from .recommendation_writer import recommendation_writer
+from .http_client import provider_client
+from .singleflight import canonical_key, search_single_flight
+from .cache_versions import CATALOG, GENRES, MOODS, versioned_key, versioned_cache_page
 
 import logging
 
@@ -48,37 +57,41 @@ def search_books(request):
         'year_from': serializer.validated_data.get('year_from'),
         'year_to': serializer.validated_data.get('year_to'),
         'sort_by': serializer.validated_data.get('sort_by', 'relevance'),
-        'limit': serializer.validated_data.get('limit', 20)
+        'limit': serializer.validated_data.get('limit', 20),
+        'offset': serializer.validated_data.get('offset', 0)
     }
     
-    # Check cache first
-    cache_key = f"book_search:{hash(str(sorted(request.GET.items())))}"
+    book_fields = BookSerializer.requested_fields_from(request.GET)
+    
+    # Check cache first; the key is stable across processes
+    search_params = {**_canonical_search_params(query, filters), 'fields': book_fields}
+    cache_key = versioned_key(canonical_key('book_search', search_params), CATALOG)
     cached_result = cache.get(cache_key)
     
     if cached_result:
-        return Response(cached_result)
+        return Response({**cached_result, 'query': query})
     
-    try:
-        # Perform search
+    def run_search():
         search_results = book_search_service.combined_search(
             query, 
             filters, 
             include_external=True
         )
         
-        # Serialize local books
-        local_books_serializer = BookSerializer(search_results['local_books'], many=True)
-        
-        response_data = {
+        return {
             'query': query,
             'total_count': search_results['total_count'],
-            'local_books': local_books_serializer.data,
+            'local_books': _render_books(search_results['local_books'], book_fields),
             'external_books': search_results['external_books'],
             'has_more': len(search_results['local_books']) + len(search_results['external_books']) >= filters['limit']
         }
+    
+    try:
+        # Identical concurrent searches share one computation
+        response_data = {**search_single_flight.do(cache_key, run_search), 'query': query}
         
-        # Cache for 5 minutes
-        cache.set(cache_key, response_data, 300)
+        # Catalog edits bump the key's generation, so the TTL can be long
+        cache.set(cache_key, response_data, 60 * 60)
         
         return Response(response_data)
         
@@ -90,6 +103,23 @@ def search_books(request):
         )
 
 
+def _canonical_search_params(query, filters):
+    """
+    Normalize validated search parameters so equivalent requests compare equal
+    """
+    return {
+        'q': ' '.join(query.lower().split()),
+        'genre': sorted({genre.lower() for genre in filters.get('genre') or []}),
+        'mood': sorted({mood.lower() for mood in filters.get('mood') or []}),
+        'rating': filters.get('rating'),
+        'year_from': filters.get('year_from'),
+        'year_to': filters.get('year_to'),
+        'sort_by': filters.get('sort_by') or 'relevance',
+        'limit': filters.get('limit') or 20,
+        'offset': filters.get('offset') or 0,
+    }
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def search_suggestions(request):
@@ -101,19 +131,10 @@ def search_suggestions(request):
     if not query or len(query) < 2:
         return Response({'suggestions': []})
     
-    # Check cache
-    cache_key = f"suggestions:{query.lower()}"
-    cached_suggestions = cache.get(cache_key)
-    
-    if cached_suggestions:
-        return Response({'suggestions': cached_suggestions})
-    
     try:
+        # The completion index is in memory, so no response cache is needed
         suggestions = book_search_service.get_suggestions(query)
         
-        # Cache for 10 minutes
-        cache.set(cache_key, suggestions, 600)
-        
         return Response({'suggestions': suggestions})
         
     except Exception as e:
@@ -121,8 +142,43 @@ def search_suggestions(request):
         return Response({'suggestions': []})
 
 
-@method_decorator(cache_page(60 * 15), name='dispatch')  # Cache for 15 minutes
-class PopularBooksView(generics.ListAPIView):
+def _render_books(books, fields=None):
+    """
+    Full payloads come from the fragment cache; sparse ones are cheap enough
+    to serialize directly from rows loaded with setup_sparse_loading
+    """
+    if fields is None:
+        return book_fragments.render(books)
+    if hasattr(books, 'defer'):
+        books = BookSerializer.setup_sparse_loading(books, fields)
+    return BookSerializer(books, many=True, fields=fields).data
+
+
+def _book_context(entries, fields=None):
+    """Serializer context for the books nested in library entries or recommendations"""
+    if fields is None:
+        return {'book_fragments': book_fragments.render_by_id(entry.book for entry in entries)}
+    return {'book_fields': fields}
+
+
+class BookFragmentListMixin:
+    """
+    List books from pre-rendered fragments instead of serializing each one,
+    or only the columns asked for with ?fields= / ?view=compact
+    """
+    def list(self, request, *args, **kwargs):
+        fields = BookSerializer.requested_fields_from(request.GET)
+        queryset = self.filter_queryset(self.get_queryset())
+        if fields is not None:
+            queryset = BookSerializer.setup_sparse_loading(queryset, fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(_render_books(page, fields))
+        return Response(_render_books(queryset, fields))
+
+
+@method_decorator(versioned_cache_page(60 * 60 * 24, CATALOG), name='dispatch')
+class PopularBooksView(BookFragmentListMixin, generics.ListAPIView):
     """
     Get popular books
     """
@@ -134,8 +190,8 @@ class PopularBooksView(generics.ListAPIView):
         return Book.objects.order_by('-popularity_score', '-average_rating')
 
 
-@method_decorator(cache_page(60 * 30), name='dispatch')  # Cache for 30 minutes
-class GenreBooksView(generics.ListAPIView):
+@method_decorator(versioned_cache_page(60 * 60 * 24, CATALOG), name='dispatch')
+class GenreBooksView(BookFragmentListMixin, generics.ListAPIView):
     """
     Get books by genre
     """
@@ -144,8 +200,84 @@ class GenreBooksView(generics.ListAPIView):
     pagination_class = BookSearchPagination
     
     def get_queryset(self):
-        genre = self.kwargs.get('genre')
-        return Book.objects.filter(genre__icontains=genre).order_by('-popularity_score')
+        genre_ids = genre_taxonomy.genre_ids(self.kwargs.get('genre'))
+        return Book.objects.filter(canonical_genre_id__in=genre_ids).order_by('-popularity_score')
+
+
+def _neighbor_response(request, book_id, neighbors_fn):
+    """
+    Render the books neighbors_fn(book_id, limit) returns as
+    [(book id, similarity)], best first, with their similarities
+    """
+    if not Book.objects.filter(pk=book_id).exists():
+        return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        limit = min(50, max(1, int(request.GET.get('limit', 10))))
+    except ValueError:
+        limit = 10
+    
+    neighbors = neighbors_fn(book_id, limit)
+    # Skip books deleted since the index was built
+    books_by_id = Book.objects.in_bulk([neighbor_id for neighbor_id, _ in neighbors])
+    ranked = [(books_by_id[neighbor_id], similarity) for neighbor_id, similarity in neighbors if neighbor_id in books_by_id]
+    
+    results = _render_books([book for book, _ in ranked], BookSerializer.requested_fields_from(request.GET))
+    for payload, (_, similarity) in zip(results, ranked):
+        payload['similarity'] = round(similarity, 4)
+    
+    return Response({'book_id': book_id, 'results': results})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def readers_also_liked(request, book_id):
+    """
+    Books most often shelved and rated alongside this one
+    """
+    return _neighbor_response(request, book_id, item_neighbors)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def similar_books(request, book_id):
+    """
+    Books closest to this one by description, genre, tags and moods
+    """
+    return _neighbor_response(request, book_id, book_similarity_index.similar)
+
+
+def _tag_list(params, name):
+    """Tag names from ?name=a,b and/or repeated ?name= parameters"""
+    return [tag.strip() for value in params.getlist(name) for tag in value.split(',') if tag.strip()]
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def filter_books_by_tags(request):
+    """
+    Books carrying every ?all= tag, at least one ?any= tag and no ?none=
+    tag, most popular first
+    """
+    all_tags = _tag_list(request.GET, 'all')
+    any_tags = _tag_list(request.GET, 'any')
+    none_tags = _tag_list(request.GET, 'none')
+    if not (all_tags or any_tags or none_tags):
+        return Response(
+            {'error': 'Provide at least one of the all, any or none tag parameters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    book_ids = tag_index.filter(all_tags, any_tags, none_tags)
+    paginator = BookSearchPagination()
+    page = [int(book_id) for book_id in paginator.paginate_queryset(book_ids, request)]
+    # Skip books deleted since the index last heard of them
+    books_by_id = Book.objects.in_bulk(page)
+    books = [books_by_id[book_id] for book_id in page if book_id in books_by_id]
+    
+    return paginator.get_paginated_response(
+        _render_books(books, BookSerializer.requested_fields_from(request.GET))
+    )
 
 
 @api_view(['GET'])
@@ -154,22 +286,18 @@ def available_genres(request):
     """
     Get all available genres
     """
-    cache_key = "available_genres"
+    cache_key = versioned_key("available_genres", GENRES)
     genres = cache.get(cache_key)
     
     if not genres:
-        # Get genres from both BookGenre model and Book model
-        model_genres = list(BookGenre.objects.values_list('name', flat=True))
-        book_genres = list(Book.objects.values_list('genre', flat=True).distinct())
-        
-        # Combine and deduplicate
-        all_genres = list(set(model_genres + book_genres))
-        all_genres.sort()
-        
-        genres = [{'name': genre} for genre in all_genres if genre]
+        # Every book genre is mapped onto a BookGenre node of the taxonomy
+        genres = [
+            {'id': genre_id, 'name': name, 'parent': parent}
+            for genre_id, name, parent in BookGenre.objects.order_by('name').values_list('id', 'name', 'parent__name')
+        ]
         
-        # Cache for 1 hour
-        cache.set(cache_key, genres, 3600)
+        # Invalidated by generation bumps, so keep for a day
+        cache.set(cache_key, genres, 60 * 60 * 24)
     
     return Response({'genres': genres})
 
@@ -180,7 +308,7 @@ def available_moods(request):
     """
     Get all available moods
     """
-    cache_key = "available_moods"
+    cache_key = versioned_key("available_moods", MOODS)
     moods = cache.get(cache_key)
     
     if not moods:
@@ -188,12 +316,32 @@ def available_moods(request):
         serializer = BookMoodSerializer(moods_qs, many=True)
         moods = serializer.data
         
-        # Cache for 1 hour
-        cache.set(cache_key, moods, 3600)
+        # Invalidated by generation bumps, so keep for a day
+        cache.set(cache_key, moods, 60 * 60 * 24)
     
     return Response({'moods': moods})
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """
+    Get size, limits and hit/miss counters of the shared cache
+    """
+    if not hasattr(cache, 'stats'):
+        return Response({'error': 'Cache backend does not report stats'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'cache': cache.stats()})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def external_provider_stats(request):
+    """
+    Get connection reuse, in-flight and latency stats for external providers
+    """
+    return Response({'providers': provider_client.stats()})
+
+
 # User Library Views (require authentication)
 
 class UserLibraryView(generics.ListCreateAPIView):
@@ -206,12 +354,27 @@ class UserLibraryView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         status_filter = self.request.GET.get('status')
-        queryset = UserLibrary.objects.filter(user=self.request.user)
+        queryset = UserLibrary.objects.filter(user=self.request.user).select_related('book')
         
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         
         return queryset.order_by('-date_added')
+    
+    def list(self, request, *args, **kwargs):
+        fields = BookSerializer.requested_fields_from(request.GET)
+        queryset = self.filter_queryset(self.get_queryset())
+        if fields is not None:
+            queryset = BookSerializer.setup_sparse_loading(queryset, fields, prefix='book__')
+        page = self.paginate_queryset(queryset)
+        entries = page if page is not None else list(queryset)
+        
+        context = {**self.get_serializer_context(), **_book_context(entries, fields)}
+        serializer = self.get_serializer(entries, many=True, context=context)
+        
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
 
 class UserLibraryDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -222,7 +385,16 @@ class UserLibraryDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return UserLibrary.objects.filter(user=self.request.user)
+        queryset = UserLibrary.objects.filter(user=self.request.user).select_related('book')
+        fields = BookSerializer.requested_fields_from(self.request.GET)
+        if fields is not None:
+            return BookSerializer.setup_sparse_loading(queryset, fields, prefix='book__')
+        return BookSerializer.setup_eager_loading(queryset, prefix='book__')
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['book_fields'] = BookSerializer.requested_fields_from(self.request.GET)
+        return context
 
 
 @api_view(['POST'])
@@ -288,7 +460,10 @@ def add_external_book_to_library(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        serializer = UserLibrarySerializer(library_entry)
+        serializer = UserLibrarySerializer(
+            library_entry,
+            context={'book_fields': BookSerializer.requested_fields_from(request.GET)}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
         
     except Exception as e:
@@ -330,26 +505,15 @@ def get_mood_recommendations(request):
             genre=mood_data['genre'],
             depth=mood_data['depth'],
             user=request.user,
-            limit=15
+            limit=15,
+            fields=BookSerializer.requested_fields_from(request.GET)
         )
 
         # Generate mood summary
         mood_summary = _generate_mood_summary(mood_data)
 
-        # Save recommendations to database
-        for rec in recommendations:
-            UserRecommendation.objects.update_or_create(
-                user=request.user,
-                book=rec['book'],
-                mood_energy=mood_data['energy'],
-                mood_genre=mood_data['genre'],
-                mood_depth=mood_data['depth'],
-                defaults={
-                    'match_score': rec['match_score'],
-                    'match_percentage': rec['match_percentage'],
-                    'match_reasons': rec['match_reasons']
-                }
-            )
+        # Save recommendations to database in one upsert, after the response by default
+        recommendation_writer.submit(request.user, mood_data, recommendations)
 
         return Response({
             'recommendations': recommendations,
@@ -365,54 +529,17 @@ def get_mood_recommendations(request):
         )
 
 
-def _build_recommendations(energy, genre, depth, user, limit=15):
+def _build_recommendations(energy, genre, depth, user, limit=15, fields=None):
     """
     Build recommendations based on mood criteria
     """
-    # Start with base query
-    queryset = Book.objects.all()
-
-    # Apply filters based on mood data
-    filters = Q()
-
-    # Genre filtering
-    genre_map = {
-        'fiction': ['Fiction', 'Literary Fiction', 'Contemporary'],
-        'mystery': ['Mystery', 'Crime', 'Detective', 'Thriller'],
-        'romance': ['Romance', 'Contemporary Romance'],
-        'scifi': ['Science Fiction', 'Dystopian', 'Space Opera'],
-        'nonfiction': ['Nonfiction', 'Biography', 'Self-Help', 'History'],
-        'fantasy': ['Fantasy', 'Epic Fantasy', 'Urban Fantasy', 'Magic']
-    }
-
-    if genre in genre_map:
-        for genre_term in genre_map[genre]:
-            filters |= Q(genre__icontains=genre_term)
-
-    # Energy level filtering
-    if energy == 'high':
-        filters &= (Q(energy_level='high') | Q(reading_pace='fast'))
-    elif energy == 'low':
-        filters &= (Q(energy_level='low') | Q(reading_pace='slow'))
+    # Read the materialized ranking of this quiz combination
+    ranked = mood_scorer.recommend(energy, genre, depth, limit, exclude=recommendation_exclusions.for_user(user))
+    books_by_id = Book.objects.in_bulk([book_id for book_id, _ in ranked])
+    # Skip books deleted since the snapshot was taken
+    books = [books_by_id[book_id] for book_id, _ in ranked if book_id in books_by_id]
 
-    # Depth filtering
-    if depth == 'light':
-        filters &= (Q(reading_depth='light') | Q(page_count__lt=300))
-    elif depth == 'deep':
-        filters &= (Q(reading_depth='deep') | Q(page_count__gt=400))
-
-    # Apply filters and order by rating
-    books = queryset.filter(filters).order_by('-average_rating', '-rating_count')[:limit * 2]
-
-    # If not enough books, fall back to genre-only filtering
-    if len(books) < limit:
-        fallback_filters = Q()
-        if genre in genre_map:
-            for genre_term in genre_map[genre]:
-                fallback_filters |= Q(genre__icontains=genre_term)
-        books = queryset.filter(fallback_filters).order_by('-average_rating', '-rating_count')[:limit * 2]
-
-    # Score and rank books
+    # Scores and reasons of the current rows
     scored_books = []
     for book in books:
         score = _calculate_match_score(book, energy, genre, depth)
@@ -429,10 +556,10 @@ def _build_recommendations(energy, genre, depth, user, limit=15):
     # Sort by score and return top results
     scored_books.sort(key=lambda x: x['match_score'], reverse=True)
 
-    # Serialize books with recommendation metadata
+    # Assemble pre-rendered books with recommendation metadata
+    top_books = scored_books[:limit]
     recommendations = []
-    for item in scored_books[:limit]:
-        book_data = BookSerializer(item['book']).data
+    for item, book_data in zip(top_books, _render_books([item['book'] for item in top_books], fields)):
         book_data.update({
             'match_score': item['match_score'],
             'match_percentage': item['match_percentage'],
@@ -592,12 +719,17 @@ def get_saved_recommendations(request):
     """
     Get user's saved recommendations
     """
-    recommendations = UserRecommendation.objects.filter(
-        user=request.user,
-        saved=True
-    ).select_related('book')
-
-    serializer = UserRecommendationSerializer(recommendations, many=True)
+    fields = BookSerializer.requested_fields_from(request.GET)
+    queryset = UserRecommendation.objects.filter(user=request.user, saved=True).select_related('book')
+    if fields is not None:
+        queryset = BookSerializer.setup_sparse_loading(queryset, fields, prefix='book__')
+    recommendations = list(queryset)
+
+    serializer = UserRecommendationSerializer(
+        recommendations,
+        many=True,
+        context=_book_context(recommendations, fields)
+    )
     return Response({'recommendations': serializer.data})
 
 